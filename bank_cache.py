@@ -0,0 +1,165 @@
+"""
+Bank list cache for `banking_adapter`.
+
+Behaviour:
+  - Fresh for FRESH_TTL_SECONDS; after that the stale list is still served
+    while one background thread refreshes it. Past STALE_TTL_SECONDS the
+    refresh happens inline instead.
+  - Single-flight: when there is no usable list, only one caller fetches
+    from Finlake; concurrent callers wait briefly for that result.
+  - Failures (or an empty list) are negatively cached for a short time and
+    never replace a good list, so an outage cannot poison the cache.
+  - Every good list is snapshotted to disk (/tmp by default) and a new
+    container starts from that snapshot, or from a bundled file.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Callable, List, Tuple
+
+import metrics
+from bank_index import BankIndex
+from config import BANKS_BUNDLED_PATH, BANKS_SNAPSHOT_PATH
+
+FRESH_TTL_SECONDS = 3600          # 1 hour
+STALE_TTL_SECONDS = 7 * 24 * 3600  # older than this: refresh inline, not in background
+NEGATIVE_TTL_SECONDS = 60         # back off this long after a failed fetch
+FETCH_WAIT_SECONDS = 10           # how long followers wait for the leader
+
+
+class BankListCache:
+    """
+    Stale-while-revalidate, single-flight cache of the Finlake bank list.
+
+    Parameters
+    ----------
+    fetch : callable(pin) -> list[dict]
+        Loads the bank records from Finlake (raises on failure).
+    snapshot_path / bundled_path : str
+        Writable snapshot location and an optional read-only fallback.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], List[dict]],
+        snapshot_path: str = BANKS_SNAPSHOT_PATH,
+        bundled_path: str = BANKS_BUNDLED_PATH,
+    ) -> None:
+        self._fetch = fetch
+        self.snapshot_path = snapshot_path
+        self.bundled_path = bundled_path
+        self._banks: List[dict] = []
+        self._index = BankIndex([])
+        self._fetched_at = 0.0
+        self._error_until = 0.0
+        self._refreshing = False
+        self._cond = threading.Condition()
+        self._load_snapshot()
+
+    # -----------------------------------------------------------------------
+    # Snapshot
+    # -----------------------------------------------------------------------
+
+    def _load_snapshot(self) -> None:
+        for path in (self.snapshot_path, self.bundled_path):
+            if not path:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue
+            banks = snap.get("banks") if isinstance(snap, dict) else None
+            if banks:
+                self._set(banks, float(snap.get("fetched_at") or 0.0))
+                metrics.incr("banks.snapshot_loaded")
+                return
+
+    def _save_snapshot(self) -> None:
+        if not self.snapshot_path:
+            return
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": self._fetched_at, "banks": self._banks}, f, ensure_ascii=False)
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            print("WARN bank snapshot write failed:", e)
+
+    # -----------------------------------------------------------------------
+    # Refresh
+    # -----------------------------------------------------------------------
+
+    def _set(self, banks: List[dict], fetched_at: float) -> None:
+        self._banks = banks
+        self._index = BankIndex(banks)
+        self._fetched_at = fetched_at
+
+    def _refresh(self, pin: str) -> None:
+        """
+        Fetch once; caller must have set `_refreshing`. Always clears it.
+        """
+        ok = False
+        try:
+            banks = self._fetch(pin)
+            ok = bool(banks)
+        except Exception as e:
+            print("ERR list_banks:", e)
+            banks = []
+        with self._cond:
+            if ok:
+                self._set(banks, time.time())
+                self._error_until = 0.0
+                metrics.incr("banks.refresh_ok")
+            else:
+                self._error_until = time.time() + NEGATIVE_TTL_SECONDS
+                metrics.incr("banks.refresh_failed")
+            self._refreshing = False
+            self._cond.notify_all()
+        if ok:
+            self._save_snapshot()
+
+    def _start_background(self, pin: str) -> None:
+        threading.Thread(target=self._refresh, args=(pin,), name="banks-refresh", daemon=True).start()
+
+    # -----------------------------------------------------------------------
+    # Public
+    # -----------------------------------------------------------------------
+
+    def get(self, pin: str) -> Tuple[List[dict], BankIndex]:
+        """
+        Return (bank records, index). May be empty if Finlake is unreachable
+        and no snapshot exists.
+        """
+        leader = False
+        with self._cond:
+            now = time.time()
+            age = now - self._fetched_at
+            if self._banks and age < FRESH_TTL_SECONDS:
+                return self._banks, self._index
+
+            can_fetch = not self._refreshing and now >= self._error_until
+            if self._banks and age < STALE_TTL_SECONDS:
+                if can_fetch:
+                    self._refreshing = True
+                    self._start_background(pin)
+                metrics.incr("banks.served_stale")
+                return self._banks, self._index
+
+            if can_fetch:
+                self._refreshing = True
+                leader = True
+            elif self._refreshing:
+                self._cond.wait_for(lambda: not self._refreshing, timeout=FETCH_WAIT_SECONDS)
+                return self._banks, self._index
+            else:
+                # Negative cache window: don't hammer a failing Finlake
+                return self._banks, self._index
+
+        if leader:
+            self._refresh(pin)
+        with self._cond:
+            return self._banks, self._index
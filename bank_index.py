@@ -0,0 +1,228 @@
+"""
+Indexed lookup of a user's bank text against the Finlake bank list.
+
+`BankIndex` is built once per bank-list refresh and answers lookups with:
+  1. exact hash hits on normalized full name, core name (without "BANK",
+     "PLC", ...), short name and bank code
+  2. a curated alias table (GTB, Guaranty, FCMB, Pidgin/Yoruba spellings)
+  3. a prefix trie over names/short names ("zen" -> Zenith)
+  4. trigram similarity with a confidence threshold
+
+Each lookup returns a `BankMatch`. When more than one bank fits, the match
+is "ambiguous" and carries ranked candidates, so the caller can ask the
+user instead of guessing.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+
+# Words that do not help tell banks apart
+_STOPWORDS = {"BANK", "BANKI", "PLC", "LIMITED", "LTD", "NIGERIA", "NIG", "OF", "THE", "MFB", "MICROFINANCE"}
+
+# Normalized alias -> normalized core name of the bank it means.
+# Targets missing from the current Finlake list are ignored.
+ALIASES: Dict[str, str] = {
+    "GTB": "GUARANTYTRUST",
+    "GTBANK": "GUARANTYTRUST",
+    "GTCO": "GUARANTYTRUST",
+    "GUARANTY": "GUARANTYTRUST",
+    "GUARANTEETRUST": "GUARANTYTRUST",
+    "FCMB": "FIRSTCITYMONUMENT",
+    "FIRSTCITY": "FIRSTCITYMONUMENT",
+    "FIRSTBANK": "FIRST",
+    "FBN": "FIRST",
+    "UBA": "UNITEDFORAFRICA",
+    "ACESS": "ACCESS",
+    "AKSES": "ACCESS",
+    "AXESS": "ACCESS",
+    "ZENIT": "ZENITH",
+    "SENITH": "ZENITH",
+    "ALAT": "WEMA",
+    "IBTC": "STANBICIBTC",
+    "STANBIC": "STANBICIBTC",
+    "ECO": "ECOBANK",
+    "FIDELITI": "FIDELITY",
+    "STERLIN": "STERLING",
+    "MONIPOINT": "MONIEPOINT",
+    "PAMPAY": "PALMPAY",
+    "OPEY": "OPAY",
+}
+
+FUZZY_THRESHOLD = 0.55   # best trigram score needed to accept a fuzzy match
+FUZZY_MARGIN = 0.15      # ...and how far ahead of the runner-up it must be
+CANDIDATE_FLOOR = 0.3    # lowest score still offered as a candidate
+MAX_CANDIDATES = 3
+MIN_PREFIX = 3
+
+
+class BankMatch:
+    """
+    Result of a lookup.
+
+    status : "exact" | "alias" | "prefix" | "fuzzy" | "ambiguous" | "none"
+    bank   : {"code", "name"} for a confident match, else None
+    candidates : ranked {"code", "name"} options when ambiguous
+    """
+
+    __slots__ = ("status", "bank", "candidates", "score")
+
+    def __init__(self, status: str, bank: Optional[dict] = None,
+                 candidates: Optional[List[dict]] = None, score: float = 0.0) -> None:
+        self.status = status
+        self.bank = bank
+        self.candidates = candidates or []
+        self.score = score
+
+    @property
+    def ambiguous(self) -> bool:
+        return self.status == "ambiguous"
+
+    def __repr__(self) -> str:
+        return f"BankMatch({self.status!r}, bank={self.bank!r}, candidates={len(self.candidates)})"
+
+
+# ---------------------------------------------------------------------------
+# Normalization
+# ---------------------------------------------------------------------------
+
+def _fold(text: str) -> str:
+    t = unicodedata.normalize("NFKD", text or "")
+    t = "".join(ch for ch in t if not unicodedata.combining(ch)).upper()
+    return re.sub(r"[^A-Z0-9 ]+", " ", t)
+
+
+def compact(text: str) -> str:
+    """
+    Uppercase, diacritics/punctuation/spaces removed ("Guaranty Trust" -> "GUARANTYTRUST").
+    """
+    return _fold(text).replace(" ", "")
+
+
+def core(text: str) -> str:
+    """
+    Like `compact` but without filler words ("Zenith Bank PLC" -> "ZENITH").
+    """
+    words = [w for w in _fold(text).split() if w not in _STOPWORDS]
+    return "".join(words) or compact(text)
+
+
+def _trigrams(s: str) -> Set[str]:
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class BankIndex:
+    """
+    Lookup structure over Finlake bank records (bankName/bankShortName/bankCode).
+    """
+
+    def __init__(self, records: Iterable[dict]) -> None:
+        self.banks: List[dict] = []
+        self._exact: Dict[str, Set[int]] = {}
+        self._alias: Dict[str, Set[int]] = {}
+        self._trie: Dict[str, dict] = {}
+        self._grams: Dict[str, Set[int]] = {}
+        self._gram_sets: List[Set[str]] = []
+
+        for rec in records or []:
+            name = rec.get("bankName") or ""
+            short = rec.get("bankShortName") or ""
+            code = (rec.get("bankCode") or "").strip().upper()
+            if not (name or short or code):
+                continue
+            i = len(self.banks)
+            self.banks.append({"code": code, "name": name or short or code})
+
+            keys = {compact(name), core(name), compact(short), core(short), code}
+            for k in keys:
+                if k:
+                    self._exact.setdefault(k, set()).add(i)
+            for k in {core(name), compact(short)}:
+                if k:
+                    self._trie_add(k, i)
+
+            grams = _trigrams(core(name)) | (_trigrams(compact(short)) if short else set())
+            self._gram_sets.append(grams)
+            for g in grams:
+                self._grams.setdefault(g, set()).add(i)
+
+        for alias, target in ALIASES.items():
+            ids = self._exact.get(target)
+            if ids:
+                self._alias[alias] = ids
+
+    def __len__(self) -> int:
+        return len(self.banks)
+
+    def _trie_add(self, key: str, i: int) -> None:
+        node = self._trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+            node.setdefault("", set()).add(i)
+
+    def _prefix(self, key: str) -> Set[int]:
+        node = self._trie
+        for ch in key:
+            node = node.get(ch)
+            if node is None:
+                return set()
+        return node.get("", set())
+
+    def _rank(self, text_key: str, ids: Iterable[int]) -> List[tuple]:
+        q = _trigrams(text_key)
+        scored = []
+        for i in ids:
+            g = self._gram_sets[i]
+            score = 2 * len(q & g) / (len(q) + len(g)) if (q or g) else 0.0
+            scored.append((score, i))
+        scored.sort(key=lambda t: (-t[0], self.banks[t[1]]["name"]))
+        return scored
+
+    def _one_or_ambiguous(self, status: str, key: str, ids: Set[int]) -> BankMatch:
+        if len(ids) == 1:
+            return BankMatch(status, self.banks[next(iter(ids))], score=1.0)
+        ranked = self._rank(key, ids)[:MAX_CANDIDATES]
+        return BankMatch("ambiguous", candidates=[self.banks[i] for _, i in ranked])
+
+    def lookup(self, text: str) -> BankMatch:
+        """
+        Resolve free-text bank input to a bank record, candidates, or nothing.
+        """
+        full, key = compact(text), core(text)
+        if not full:
+            return BankMatch("none")
+
+        for k in (full, key):
+            ids = self._exact.get(k)
+            if ids:
+                return self._one_or_ambiguous("exact", key, ids)
+
+        for k in (full, key):
+            ids = self._alias.get(k)
+            if ids:
+                return self._one_or_ambiguous("alias", key, ids)
+
+        if len(key) >= MIN_PREFIX:
+            ids = self._prefix(key)
+            if ids:
+                return self._one_or_ambiguous("prefix", key, ids)
+
+        pool: Set[int] = set()
+        for g in _trigrams(key):
+            pool |= self._grams.get(g, set())
+        ranked = self._rank(key, pool)
+        if not ranked or ranked[0][0] < CANDIDATE_FLOOR:
+            return BankMatch("none")
+
+        best = ranked[0][0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+        if best >= FUZZY_THRESHOLD and best - runner_up >= FUZZY_MARGIN:
+            return BankMatch("fuzzy", self.banks[ranked[0][1]], score=best)
+        top = [self.banks[i] for s, i in ranked[:MAX_CANDIDATES] if s >= CANDIDATE_FLOOR]
+        return BankMatch("ambiguous", candidates=top, score=best)
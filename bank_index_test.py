@@ -0,0 +1,78 @@
+"""
+BankIndex resolution: exact, alias, prefix, fuzzy, ambiguous and none.
+
+Run:  python -m pytest -q bank_index_test.py
+"""
+from bank_index import BankIndex, compact, core
+
+RECORDS = [
+    {"bankName": "Access Bank PLC", "bankShortName": "ACCESS", "bankCode": "044"},
+    {"bankName": "Zenith Bank PLC", "bankShortName": "ZENITH", "bankCode": "057"},
+    {"bankName": "Guaranty Trust Bank", "bankShortName": "GTBANK", "bankCode": "058"},
+    {"bankName": "First Bank of Nigeria", "bankShortName": "FBN", "bankCode": "011"},
+    {"bankName": "First City Monument Bank", "bankShortName": "FCMB", "bankCode": "214"},
+    {"bankName": "United Bank For Africa", "bankShortName": "UBA", "bankCode": "033"},
+    {"bankName": "Wema Bank", "bankShortName": "WEMA", "bankCode": "035"},
+    {"bankName": "Sterling Bank", "bankShortName": "STERLING", "bankCode": "232"},
+    {"bankName": "Stanbic IBTC Bank", "bankShortName": "STANBIC", "bankCode": "221"},
+    {"bankName": "Union Bank of Nigeria", "bankShortName": "UNION", "bankCode": "032"},
+]
+
+INDEX = BankIndex(RECORDS)
+
+
+def _code(text):
+    m = INDEX.lookup(text)
+    return m.status, (m.bank or {}).get("code")
+
+
+def test_normalization():
+    assert compact("Guaranty Trust") == "GUARANTYTRUST"
+    assert core("Zenith Bank PLC") == "ZENITH"
+    assert core("Ìbàdàn Bank") == "IBADAN"
+
+
+def test_exact_on_name_short_name_and_code():
+    assert _code("Zenith Bank PLC") == ("exact", "057")
+    assert _code("zenith") == ("exact", "057")
+    assert _code("GTBANK") == ("exact", "058")
+    assert _code("044") == ("exact", "044")
+
+
+def test_alias():
+    assert _code("gtb") == ("alias", "058")
+    assert _code("Guaranty") == ("alias", "058")
+    assert _code("akses") == ("alias", "044")
+    assert _code("ALAT") == ("alias", "035")
+
+
+def test_alias_to_missing_bank_is_ignored():
+    # "eco" points at Ecobank, which is not in this list
+    assert INDEX.lookup("eco").bank is None
+
+
+def test_prefix():
+    assert _code("zen") == ("prefix", "057")
+    assert _code("sterl") == ("prefix", "232")
+
+
+def test_fuzzy():
+    assert _code("zenitt bank") == ("fuzzy", "057")
+
+
+def test_ambiguous_prefix_offers_candidates():
+    m = INDEX.lookup("uni")
+    assert m.ambiguous and m.bank is None
+    assert {c["code"] for c in m.candidates} == {"033", "032"}
+
+
+def test_none():
+    assert INDEX.lookup("ecobank").status == "none"
+    assert INDEX.lookup("fidelity").status == "none"
+    assert INDEX.lookup("").status == "none"
+    assert INDEX.lookup("qqqq").bank is None
+
+
+def test_empty_index():
+    assert len(BankIndex([])) == 0
+    assert BankIndex([]).lookup("zenith").status == "none"
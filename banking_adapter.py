@@ -10,28 +10,47 @@ and return small dicts that the higher layer can format into user-facing text.
 
 Notes
 -----
-* The Finlake bank list is cached in-process for 1 hour to reduce API calls.
+* The Finlake bank list is cached by `bank_cache.BankListCache` (fresh for
+  1 hour, then served stale while refreshing; snapshotted to disk so cold
+  starts are warm), together with a `BankIndex` for bank-name matching.
+* Balances are cached per account for BALANCE_CACHE_TTL_SECONDS and the
+  entry is dropped as soon as `transfer_adapter` debits that account.
+* Destination account names are resolved ahead of time
+  (`prefetch_account_name`, started by the conversation layer while it is
+  still collecting slots) and cached per (bank, account). A transfer never
+  waits for one; when a name is known and does not match the recipient
+  the user gave, the transfer is held back for the user to confirm.
 * Keep signatures stable; other modules import these functions directly.
 """
 from __future__ import annotations
 
-import time
-from typing import Dict, Any, Optional
+import hashlib
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Iterable, Optional
 
 import finlake
+import ledger
+import metrics
+from bank_cache import BankListCache
+from bank_index import BankMatch
+from cache_utils import TTLCache
+from config import BALANCE_CACHE_TTL_SECONDS, NAME_CACHE_TTL_SECONDS
 
 # ---------------------------------------------------------------------------
-# Simple in-memory bank cache (process lifetime)
+# Bank list cache (warm container + on-disk snapshot)
 # ---------------------------------------------------------------------------
 
-_BANKS: Optional[list[dict]] = None
-_BANKS_AT: float = 0.0
-_CACHE_TTL_SECONDS = 3600  # 1 hour
+def _fetch_banks(pin: str) -> list[dict]:
+    return finlake.list_banks(pin).get("data") or []
+
+
+_BANK_CACHE = BankListCache(_fetch_banks)
 
 
 def _load_banks(pin: str) -> list[dict]:
     """
-    Retrieve and cache the list of banks from Finlake.
+    Retrieve the (cached) list of banks from Finlake.
 
     Parameters
     ----------
@@ -41,55 +60,160 @@ def _load_banks(pin: str) -> list[dict]:
     Returns
     -------
     list[dict]
-        The bank records as returned by Finlake.
+        The bank records as returned by Finlake (empty if unavailable).
     """
-    global _BANKS, _BANKS_AT
-    if _BANKS and (time.time() - _BANKS_AT) < _CACHE_TTL_SECONDS:
-        return _BANKS
+    return _BANK_CACHE.get(pin)[0]
 
-    try:
-        data = finlake.list_banks(pin)
-        _BANKS = data.get("data") or []
-        _BANKS_AT = time.time()
-    except Exception:
-        # On failure, return an empty cache rather than raising (caller will handle)
-        _BANKS, _BANKS_AT = [], time.time()
-    return _BANKS
+
+def _resolve_bank(bank_text: str, pin: str) -> BankMatch:
+    """
+    Look up the user's bank text in the index (refreshing the list if stale).
+    """
+    return _BANK_CACHE.get(pin)[1].lookup(bank_text)
 
 
 def _match_bank(bank_text: str, pin: str) -> Optional[dict]:
     """
     Try to match a user's destination bank text to a Finlake bank record.
 
-    We compare against:
-      * full name
-      * short name
-      * bank code
-      * name/short name with spaces removed
-      * startswith / contains fallbacks
-
-    Returns a dict with 'code' and 'name' if a match is found, else None.
+    Returns a dict with 'code' and 'name' for a confident match, else None
+    (ambiguous input also returns None; use `_resolve_bank` for candidates).
     """
-    bank_text = (bank_text or "").strip().upper()
-    if not bank_text:
+    if not (bank_text or "").strip():
         return None
+    return _resolve_bank(bank_text, pin).bank
 
-    for b in _load_banks(pin):
-        name = (b.get("bankName") or "").upper()
-        short = (b.get("bankShortName") or "").upper()
-        code = (b.get("bankCode") or "").upper()
 
-        # Exact / normalized exact
-        if bank_text in (name, short, code, short.replace(" ", ""), name.replace(" ", "")):
-            return {"code": code, "name": b.get("bankName") or short or code}
+# ---------------------------------------------------------------------------
+# Balance cache (short TTL, invalidated on debit)
+# ---------------------------------------------------------------------------
+
+# account number -> (digest of account+PIN, balance string)
+_BALANCES = TTLCache(maxsize=2048, ttl=BALANCE_CACHE_TTL_SECONDS)
+
 
-        # Looser matching
-        if bank_text in name or bank_text in short or name.startswith(bank_text) or short.startswith(bank_text):
-            return {"code": code, "name": b.get("bankName") or short or code}
+def _pin_digest(acct: str, pin: str) -> str:
+    # A cached balance is only served to a caller presenting the same PIN
+    return hashlib.sha256(f"{acct}:{pin}".encode("utf-8")).hexdigest()
 
+
+def _cached_balance(acct: str, pin: str) -> Optional[str]:
+    hit = _BALANCES.get(acct)
+    if hit and hit[0] == _pin_digest(acct, pin):
+        metrics.incr("balance.cache_hit")
+        return hit[1]
     return None
 
 
+def invalidate_balance(acct: Optional[str]) -> None:
+    """
+    Forget the cached balance of an account (call after any debit attempt).
+    """
+    if acct:
+        _BALANCES.delete(acct)
+
+
+def get_balances(accounts: Iterable[str], pin: str) -> Dict[str, Optional[str]]:
+    """
+    Balances for several accounts: cached ones immediately, the rest
+    fetched from Finlake concurrently. Failed lookups map to None.
+    """
+    out: Dict[str, Optional[str]] = {}
+    missing = []
+    for a in dict.fromkeys(accounts):
+        cached = _cached_balance(a, pin)
+        if cached is None:
+            missing.append(a)
+        else:
+            out[a] = cached
+
+    if missing:
+        metrics.incr("balance.fetch", len(missing))
+        for a, res in finlake.get_balances(missing, pin).items():
+            if isinstance(res, Exception):
+                print(f"ERR get_balance {a}:", res)
+                out[a] = None
+            else:
+                _BALANCES.set(a, (_pin_digest(a, pin), res))
+                out[a] = res
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Destination name enquiry (speculative, cached per bank + account)
+# ---------------------------------------------------------------------------
+
+# (bank text, account number) -> account name ("" = enquiry found no account)
+_NAMES = TTLCache(maxsize=4096, ttl=NAME_CACHE_TTL_SECONDS)
+_NAME_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="name-enquiry")
+
+
+def _name_key(acct: str, bank_text: Optional[str]) -> tuple:
+    return ((bank_text or "").strip().lower(), acct)
+
+
+def _account_name(resp: Dict[str, Any]) -> str:
+    data = resp.get("data") if isinstance(resp.get("data"), dict) else resp
+    for k in ("accountName", "account_name", "customerName", "name"):
+        if data.get(k):
+            return str(data[k]).strip()
+    return ""
+
+
+def cached_account_name(acct: Optional[str], bank_text: Optional[str] = None) -> Optional[str]:
+    """
+    Previously resolved holder name of an account, without calling Finlake.
+    """
+    if not acct:
+        return None
+    return _NAMES.get(_name_key(acct, bank_text)) or None
+
+
+def lookup_account_name(acct: str, pin: str, bank_text: Optional[str] = None) -> Optional[str]:
+    """
+    Resolve the holder name of a destination account (cached).
+
+    Finlake only offers an internal (same bank) name enquiry, so when a
+    destination bank is named there is nothing to look up and None is
+    returned. Errors are not cached; "no such account" is.
+    """
+    if not acct or (bank_text or "").strip():
+        return None
+    key = _name_key(acct, bank_text)
+    hit = _NAMES.get(key)
+    if hit is not None:
+        metrics.incr("name_enquiry.cache_hit")
+        return hit or None
+
+    metrics.incr("name_enquiry.fetch")
+    try:
+        with metrics.timed("name_enquiry.ms"):
+            name = _account_name(finlake.internal_name_enquiry(acct, pin))
+    except Exception as e:
+        print("ERR internal_name_enquiry:", e)
+        return None
+    _NAMES.set(key, name)
+    return name or None
+
+
+def _name_words(text: Optional[str]) -> set:
+    return {w for w in re.sub(r"[^a-z0-9 ]+", " ", (text or "").lower()).split() if len(w) > 1}
+
+
+def names_match(given: Optional[str], registered: Optional[str]) -> bool:
+    """
+    True if the user's recipient name shares a word with the registered name.
+    """
+    return bool(_name_words(given) & _name_words(registered))
+
+
+def prefetch_account_name(acct: str, pin: str, bank_text: Optional[str] = None) -> "Future[Optional[str]]":
+    """
+    Start `lookup_account_name` in the background; the future yields the name or None.
+    """
+    return _NAME_POOL.submit(lookup_account_name, acct, pin, bank_text)
+
+
 # ---------------------------------------------------------------------------
 # Public adapters
 # ---------------------------------------------------------------------------
@@ -113,11 +237,15 @@ def check_balance_adapter(wa_id: str, slots: Dict[str, Any]) -> Dict[str, Any]:
     if not acct or not pin:
         return {"ok": False, "error": "missing source_account_number or pin"}
 
-    bal = finlake.get_balance(acct, pin)
+    bal = _cached_balance(acct, pin)
+    if bal is None:
+        metrics.incr("balance.fetch")
+        bal = finlake.get_balance(acct, pin)
+        _BALANCES.set(acct, (_pin_digest(acct, pin), bal))
     return {"ok": True, "balance": bal}
 
 
-def transfer_adapter(wa_id: str, slots: Dict[str, Any]) -> Dict[str, Any]:
+def transfer_adapter(wa_id: str, slots: Dict[str, Any], key: str = "") -> Dict[str, Any]:
     """
     Perform either an internal (same bank) or outward fund transfer.
 
@@ -127,15 +255,28 @@ def transfer_adapter(wa_id: str, slots: Dict[str, Any]) -> Dict[str, Any]:
     - destination_account_number | destination_account
     - destination_bank | credit_bank_name (optional; if present and matched -> outward)
     - recipient_name | credit_account_name
+    - destination_account_name (optional; name from the internal name
+      enquiry, checked against recipient_name for same-bank transfers)
     - source_account_number | debit_account_number
     - source_account_name | debit_account_name (optional; defaults to "You")
     - narration (optional)
     - pin | transaction_pin
 
+    `key` identifies the turn that triggered the transfer (see
+    ledger.client_reference); the same key and details never post twice.
+
     Returns
     -------
     {"ok": True, "transaction_id": "..."} on success,
-    {"ok": False, "error": "<reason>"} on failure.
+    {"ok": False, "error": "<reason>"} on failure,
+    {"ok": False, "error": "ambiguous bank", "candidates": [{"code", "name"}, ...]}
+    when the bank text fits several banks,
+    {"ok": False, "error": "unknown bank", "unknown_bank": "<text>"} when it
+    fits none (never sent as a same-bank transfer instead),
+    {"ok": False, "error": "recipient name mismatch", "account_name": "..."}
+    when the enquired holder of a same-bank account is not the named recipient,
+    {"ok": False, "pending": True, "reference": "..."} when the bank may have
+    applied the transfer but it could not be confirmed yet.
     """
     # Normalize amount
     amt_obj = slots.get("amount")
@@ -157,35 +298,74 @@ def transfer_adapter(wa_id: str, slots: Dict[str, Any]) -> Dict[str, Any]:
         return {"ok": False, "error": "missing fields"}
 
     # Decide internal vs outward based on bank match
-    bank_match = _match_bank(dst_bank or "", pin) if dst_bank else None
-
-    if bank_match:
-        # Outward transfer
-        out = finlake.fund_transfer_outward(
-            amount=amount,
-            credit_account_name=recipient,
-            credit_account_number=dst_acct,
-            credit_bank_code=bank_match["code"],
-            credit_bank_name=bank_match["name"],
-            debit_account_name=src_name,
-            debit_account_number=src_acct,
-            narration=narration,
-            transaction_pin=pin,
-            save_beneficiary=True,
-        )
-        txid = out.get("transactionId") or out.get("paymentReference") or out.get("reference")
-        return {"ok": True, "transaction_id": txid}
-    else:
-        # Internal (same bank)
-        out = finlake.fund_transfer_internal(
-            amount=amount,
-            credit_account_name=recipient,
-            credit_account_number=dst_acct,
-            debit_account_name=src_name,
-            debit_account_number=src_acct,
-            narration=narration,
-            transaction_pin=pin,
-            save_beneficiary=True,
-        )
-        txid = out.get("reference") or out.get("cbaReference")
-        return {"ok": True, "transaction_id": txid}
+    bank_match = None
+    if dst_bank:
+        if not _load_banks(pin):
+            # Without a bank list we cannot tell outward from internal; don't guess
+            return {"ok": False, "error": "bank list unavailable, please try again shortly"}
+        m = _resolve_bank(dst_bank, pin)
+        if m.ambiguous:
+            return {"ok": False, "error": "ambiguous bank", "candidates": m.candidates}
+        if m.bank is None:
+            # The user named a bank we cannot find; the account number alone
+            # could belong to a stranger at our own bank, so ask again
+            metrics.incr("bank.unmatched")
+            return {"ok": False, "error": "unknown bank", "unknown_bank": str(dst_bank)}
+        bank_match = m.bank
+
+    credit_name = recipient
+    if not bank_match:
+        # Never wait for an enquiry here; if one already answered, the
+        # holder must be the recipient the user named
+        registered = slots.get("destination_account_name") or cached_account_name(dst_acct)
+        if registered and not names_match(recipient, registered):
+            metrics.incr("name_enquiry.mismatch")
+            return {"ok": False, "error": "recipient name mismatch", "account_name": registered}
+        credit_name = registered or recipient
+
+    ref = ledger.client_reference(wa_id, key, amount, src_acct, dst_acct)
+    details = {"wa_id": wa_id, "amount": amount, "src": src_acct, "dst": dst_acct,
+               "bank": bank_match["code"] if bank_match else ""}
+
+    # Any transfer attempt may move money; drop cached balances either way
+    try:
+        if bank_match:
+            # Outward transfer
+            return ledger.execute(
+                ref,
+                details,
+                lambda r: finlake.fund_transfer_outward(
+                    amount=amount,
+                    credit_account_name=recipient,
+                    credit_account_number=dst_acct,
+                    credit_bank_code=bank_match["code"],
+                    credit_bank_name=bank_match["name"],
+                    debit_account_name=src_name,
+                    debit_account_number=src_acct,
+                    narration=ledger.tag_narration(narration, r),
+                    transaction_pin=pin,
+                    save_beneficiary=True,
+                ),
+                pin,
+            )
+        else:
+            # Internal (same bank)
+            return ledger.execute(
+                ref,
+                details,
+                lambda r: finlake.fund_transfer_internal(
+                    amount=amount,
+                    credit_account_name=credit_name,
+                    credit_account_number=dst_acct,
+                    debit_account_name=src_name,
+                    debit_account_number=src_acct,
+                    narration=ledger.tag_narration(narration, r),
+                    transaction_pin=pin,
+                    save_beneficiary=True,
+                ),
+                pin,
+            )
+    finally:
+        invalidate_balance(src_acct)
+        if not bank_match:
+            invalidate_balance(dst_acct)  # same-bank credit
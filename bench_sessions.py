@@ -0,0 +1,89 @@
+"""
+Micro-benchmark: session item encode/decode, the legacy one-attribute-per-
+field layout through boto3's TypeSerializer vs the packed `Session` layout
+through session_codec. Also prints the stored item sizes.
+
+No AWS access needed. Run:  python bench_sessions.py [iterations]
+"""
+from __future__ import annotations
+
+import json
+import sys
+import time
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from session_codec import decode_item, encode_item
+from session_model import Session
+
+# A mid-transfer session, the common case on the hot path
+SESSION = {
+    "wa_id": "2348012345678",
+    "state": "idle",
+    "intent": "transfer",
+    "lang": "pcm",
+    "slots": {
+        "amount": {"text": "5k", "value": 5000},
+        "destination_account_number": "0123456789",
+        "destination_bank": None,
+        "recipient_name": "John",
+        "destination_account_name": "JOHN ADEBAYO",
+        "source_account_number": None,
+        "narration": None,
+        "pin": None,
+    },
+    "missing_slots": ["source_account_number", "pin"],
+    "ask_slot": "source_account_number",
+    "updated_at": 1760000000,
+    "ttl": 1760003600,
+    "version": 7,
+}
+
+_SER = TypeSerializer()
+_DESER = TypeDeserializer()
+
+
+def boto3_encode(item: dict) -> dict:
+    return {k: _SER.serialize(v) for k, v in item.items()}
+
+
+def boto3_decode(av: dict) -> dict:
+    return {k: _DESER.deserialize(v) for k, v in av.items()}
+
+
+def _size(av: dict) -> int:
+    # Rough DynamoDB item size: attribute names + serialized values
+    return len(json.dumps(av, separators=(",", ":")).encode())
+
+
+def _bench(label: str, fn, arg, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(arg)
+    us = (time.perf_counter() - t0) / n * 1e6
+    print(f"{label:<34} {us:8.2f} us/op")
+    return us
+
+
+def main(n: int = 20000) -> None:
+    legacy = boto3_encode(SESSION)
+    assert isinstance(boto3_decode(legacy)["version"], Decimal)
+
+    sess = Session.from_dict(SESSION)
+    ttl = SESSION["ttl"]
+    packed = encode_item(sess, ttl)
+    assert decode_item(packed).to_dict() == sess.to_dict(), "packed round-trip differs"
+    assert decode_item(legacy).to_dict() == sess.to_dict(), "legacy item decodes differently"
+
+    print(f"item size  legacy {_size(legacy)} B  packed {_size(packed)} B")
+    print(f"{n} iterations")
+    e0 = _bench("encode  legacy/TypeSerializer", boto3_encode, SESSION, n)
+    e1 = _bench("encode  packed/session_codec", lambda s: encode_item(s, ttl), sess, n)
+    d0 = _bench("decode  legacy/TypeDeserializer", boto3_decode, legacy, n)
+    d1 = _bench("decode  packed/session_codec", decode_item, packed, n)
+    print(f"speedup  encode x{e0 / e1:.1f}  decode x{d0 / d1:.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
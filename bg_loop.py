@@ -0,0 +1,45 @@
+"""
+Shared background event loop for the synchronous faces of async clients.
+
+`finlake.py` and `graph_sender.py` keep their pooled httpx.AsyncClients on
+this one loop (started on first use, daemon thread), so blocking callers
+such as dispatcher worker threads share the keep-alive pools instead of
+opening connections per call or per thread.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOCK = threading.Lock()
+
+
+def loop() -> asyncio.AbstractEventLoop:
+    """
+    The process-wide background loop (started on first call).
+    """
+    global _LOOP
+    with _LOCK:
+        if _LOOP is None:
+            lp = asyncio.new_event_loop()
+            threading.Thread(target=lp.run_forever, name="bg-loop", daemon=True).start()
+            _LOOP = lp
+        return _LOOP
+
+
+def run(coro: Awaitable[T]) -> T:
+    """
+    Run a coroutine on the background loop and block for its result.
+    """
+    lp = loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is lp:
+        raise RuntimeError("sync client API called from the background loop; await the async client instead")
+    return asyncio.run_coroutine_threadsafe(coro, lp).result()
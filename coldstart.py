@@ -0,0 +1,84 @@
+"""
+Import-time profiling for cold starts (enabled with COLDSTART_PROFILE=1).
+
+`install()` wraps `builtins.__import__` and records, for every module
+imported for the first time, its inclusive time and its self time
+(inclusive minus nested first-time imports). `report()` prints the most
+expensive modules as one "COLDSTART {json}" log line and stores the totals
+as metrics gauges. The lazily created clients in config.py add their own
+`coldstart.<name>_ms` timings when first used.
+
+Must be installed before the modules it should measure are imported, i.e.
+at the very top of lambda_function.py. Costs nothing when not installed.
+"""
+from __future__ import annotations
+
+import builtins
+import json
+import sys
+import time
+from typing import Any, Dict, List
+
+_orig_import = builtins.__import__
+_installed = False
+_t_install = 0.0
+_stack: List[float] = []            # child time accumulated per open import
+_times: Dict[str, List[float]] = {}  # module -> [inclusive_ms, self_ms]
+
+
+def _timed_import(name: str, globals: Any = None, locals: Any = None, fromlist: Any = (), level: int = 0) -> Any:
+    if level == 0 and name in sys.modules:
+        return _orig_import(name, globals, locals, fromlist, level)
+    t0 = time.perf_counter()
+    _stack.append(0.0)
+    try:
+        return _orig_import(name, globals, locals, fromlist, level)
+    finally:
+        dt = (time.perf_counter() - t0) * 1000.0
+        child = _stack.pop()
+        if _stack:
+            _stack[-1] += dt
+        if level == 0:
+            key = name
+        else:
+            pkg = (globals or {}).get("__package__") or ""
+            key = f"{pkg}.{name}" if name else f"{pkg}.{','.join(fromlist or ())}"
+        rec = _times.setdefault(key, [0.0, 0.0])
+        rec[0] += dt
+        rec[1] += dt - child
+
+
+def install() -> None:
+    """
+    Start measuring imports (idempotent).
+    """
+    global _installed, _t_install
+    if _installed:
+        return
+    _installed = True
+    _t_install = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+def uninstall() -> None:
+    global _installed
+    builtins.__import__ = _orig_import
+    _installed = False
+
+
+def report(top: int = 15) -> Dict[str, Any]:
+    """
+    Print and return the `top` modules by self time plus the total import time.
+    """
+    import metrics
+
+    ranked = sorted(_times.items(), key=lambda kv: -kv[1][1])[:top]
+    total = sum(self_ms for _, self_ms in _times.values())
+    out = {
+        "import_total_ms": round(total, 1),
+        "since_install_ms": round((time.perf_counter() - _t_install) * 1000.0, 1) if _t_install else 0.0,
+        "modules": [{"module": m, "self_ms": round(s, 1), "incl_ms": round(i, 1)} for m, (i, s) in ranked],
+    }
+    metrics.gauge("coldstart.import_total_ms", out["import_total_ms"])
+    print("COLDSTART " + json.dumps(out))
+    return out
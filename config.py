@@ -1,6 +1,12 @@
 """
 Configuration and shared AWS clients for the WhatsApp banking bot.
 
+Importing this module only reads environment variables. AWS clients and the
+system prompt are created on first use and memoized (`get_brt`,
+`get_dynamodb`, `get_system_prompt`), so e.g. webhook GET verification
+never pays for boto3. The old module attributes (`brt`, `dynamodb`, `table`,
+`SYSTEM_PROMPT`) still resolve, lazily, for scripts that import them.
+
 Load order for system prompt:
   1) SYSTEM_PROMPT environment variable
   2) Local file "system_prompt.txt"
@@ -10,25 +16,118 @@ Load order for system prompt:
 from __future__ import annotations
 
 import os
-import boto3
+import threading
+import time
+from typing import Any, Callable, Dict
 
 # --- WhatsApp / Graph ---
 GRAPH_API_VERSION: str = os.environ.get("GRAPH_API_VERSION", "v20.0")
 PHONE_NUMBER_ID: str = os.environ.get("PHONE_NUMBER_ID", "")
 WHATSAPP_TOKEN: str = os.environ.get("WHATSAPP_TOKEN", "")
 VERIFY_TOKEN: str = os.environ.get("VERIFY_TOKEN", "")
+# Graph sender (graph_sender.py); the base URL can point at a local stub
+GRAPH_BASE_URL: str = os.environ.get("GRAPH_BASE_URL", "https://graph.facebook.com")
+GRAPH_TIMEOUT: float = float(os.environ.get("GRAPH_TIMEOUT", "10"))
+GRAPH_MAX_CONNECTIONS: int = int(os.environ.get("GRAPH_MAX_CONNECTIONS", "10"))
+GRAPH_SEND_CONCURRENCY: int = int(os.environ.get("GRAPH_SEND_CONCURRENCY", "8"))
+# Outbound queue (outbound.py): Meta throughput per sending number and the
+# per-recipient pair rate limit (about 1 message / 6 s sustained, small bursts)
+OUTBOUND_QUEUE: bool = os.getenv("OUTBOUND_QUEUE", "1").lower() in ("1", "true", "yes")
+OUTBOUND_RATE: float = float(os.environ.get("OUTBOUND_RATE", "80"))
+OUTBOUND_BURST: float = float(os.environ.get("OUTBOUND_BURST", "80"))
+RECIPIENT_RATE: float = float(os.environ.get("RECIPIENT_RATE", "0.17"))
+RECIPIENT_BURST: float = float(os.environ.get("RECIPIENT_BURST", "10"))
+OUTBOUND_MAX_PENDING: int = int(os.environ.get("OUTBOUND_MAX_PENDING", "1000"))
+OUTBOUND_SUBMIT_TIMEOUT: float = float(os.environ.get("OUTBOUND_SUBMIT_TIMEOUT", "2"))
+# Longest wait for queued replies at the end of a batch (also capped by the Lambda deadline)
+OUTBOUND_FLUSH_TIMEOUT: float = float(os.environ.get("OUTBOUND_FLUSH_TIMEOUT", "20"))
 
 # --- Bedrock ---
 BEDROCK_REGION: str = os.getenv("BEDROCK_REGION", "us-east-1")
 MODEL_ID: str = os.getenv("BEDROCK_MODEL_ID", "us.anthropic.claude-3-5-haiku-20241022-v1:0")
+# Cheaper/faster tier for low-stakes turns and one-liners (see llm.py routing);
+# set it equal to BEDROCK_MODEL_ID to disable routing.
+FAST_MODEL_ID: str = os.getenv("BEDROCK_FAST_MODEL_ID", "us.anthropic.claude-3-haiku-20240307-v1:0")
+# Re-run a fast-tier parse on MODEL_ID when lang.confidence is below this
+ESCALATE_CONFIDENCE: float = float(os.getenv("ESCALATE_CONFIDENCE", "0.6"))
+# Ask for the parse as a forced tool call (schema-enforced) instead of bare JSON
+LLM_TOOL_MODE: bool = os.getenv("LLM_TOOL_MODE", "1").lower() in ("1", "true", "yes")
+# Stream llm_parse via converse_stream and stop once the turn's fields are in
+LLM_STREAM: bool = os.getenv("LLM_STREAM", "1").lower() in ("1", "true", "yes")
+# Put a Bedrock cachePoint after the static system prompt. Bedrock orders the
+# tool schema before the system prompt, so the cached prefix is the forced
+# tool schema plus the static sections. It is only cached above the model's
+# minimum (llm.CACHE_MIN_TOKENS: 1024 on Sonnet/Opus, 2048 on Claude 3.5 Haiku,
+# no caching on Claude 3 Haiku); the checkpoint is only sent to models whose
+# minimum the prefix reaches. LLM_CACHE_MIN_TOKENS (>0) overrides the table.
+LLM_PROMPT_CACHE: bool = os.getenv("LLM_PROMPT_CACHE", "1").lower() in ("1", "true", "yes")
+LLM_CACHE_MIN_TOKENS: int = int(os.getenv("LLM_CACHE_MIN_TOKENS", "0"))
+
+# --- Webhook processing ---
+# Max senders processed in parallel per delivery, and how close to the Lambda
+# deadline we stop starting new messages.
+WORKER_CONCURRENCY: int = int(os.environ.get("WORKER_CONCURRENCY", "8"))
+DEADLINE_MARGIN_MS: int = int(os.environ.get("DEADLINE_MARGIN_MS", "3000"))
+
+# "inline": process inside the webhook call (default)
+# "queue" : enqueue and return 200 at once; worker.worker_handler processes
+WEBHOOK_MODE: str = os.environ.get("WEBHOOK_MODE", "inline")
+QUEUE_BACKEND: str = os.environ.get("QUEUE_BACKEND", "sqs")   # sqs | sqlite | memory
+QUEUE_URL: str = os.environ.get("QUEUE_URL", "")
+QUEUE_DB_PATH: str = os.environ.get("QUEUE_DB_PATH", "/tmp/wa-queue.sqlite3")
+WORKER_BATCH_SIZE: int = int(os.environ.get("WORKER_BATCH_SIZE", "10"))
 
 # --- Sessions (DynamoDB) ---
 SESSIONS_TABLE: str = os.environ.get("SESSIONS_TABLE", "wa-bot-sessions")
+# Warm-container session cache (skips get_item on back-to-back turns)
+SESSION_CACHE_SIZE: int = int(os.environ.get("SESSION_CACHE_SIZE", "1024"))
+SESSION_CACHE_TTL_SECONDS: int = int(os.environ.get("SESSION_CACHE_TTL_SECONDS", "30"))
+
+# --- Inbound de-duplication (see idempotency.py) ---
+IDEMPOTENCY_BACKEND: str = os.environ.get("IDEMPOTENCY_BACKEND", "dynamodb")  # dynamodb | memory | off
+# Own table by default; the sessions table also works (IDEMPOTENCY_KEY_ATTR=wa_id)
+IDEMPOTENCY_TABLE: str = os.environ.get("IDEMPOTENCY_TABLE", "wa-bot-messages")
+IDEMPOTENCY_KEY_ATTR: str = os.environ.get("IDEMPOTENCY_KEY_ATTR", "msg_id")
+# Meta keeps retrying a failed delivery for up to 7 days
+IDEMPOTENCY_TTL_SECONDS: int = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(7 * 24 * 3600)))
+# How long an in-progress claim blocks redeliveries (longer than any turn)
+IDEMPOTENCY_LEASE_SECONDS: int = int(os.environ.get("IDEMPOTENCY_LEASE_SECONDS", "180"))
+IDEMPOTENCY_CACHE_SIZE: int = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "4096"))
 
 # --- Finlake headers ---
 ACCOUNT_ID: str = os.environ.get("ACCOUNT_ID", "")    # X-Account-Id
 FLK_STAGE: str = os.environ.get("FLK_STAGE", "dev")   # X-Flk-Stage (e.g., dev, prod)
 
+# --- Finlake HTTP pool ---
+FINLAKE_BASE_URL: str = os.environ.get("FINLAKE_BASE_URL", "https://api-dev.finlake.tech/mobility")
+FINLAKE_MAX_CONNECTIONS: int = int(os.environ.get("FINLAKE_MAX_CONNECTIONS", "20"))
+FINLAKE_KEEPALIVE_CONNECTIONS: int = int(os.environ.get("FINLAKE_KEEPALIVE_CONNECTIONS", "10"))
+FINLAKE_ENDPOINT_CONCURRENCY: int = int(os.environ.get("FINLAKE_ENDPOINT_CONCURRENCY", "8"))
+# Transfers are never blindly re-posted (see ledger.py), so they can use a
+# shorter timeout than reads
+FINLAKE_TRANSFER_TIMEOUT: float = float(os.environ.get("FINLAKE_TRANSFER_TIMEOUT", "10"))
+
+# --- Transfer ledger (see ledger.py) ---
+LEDGER_BACKEND: str = os.environ.get("LEDGER_BACKEND", "dynamodb")  # dynamodb | memory
+LEDGER_TABLE: str = os.environ.get("LEDGER_TABLE", SESSIONS_TABLE)
+LEDGER_TTL_SECONDS: int = int(os.environ.get("LEDGER_TTL_SECONDS", str(30 * 24 * 3600)))
+# How long an invocation waits for background re-checks of unknown transfers
+LEDGER_FOLLOW_UP_WAIT: float = float(os.environ.get("LEDGER_FOLLOW_UP_WAIT", "25"))
+
+# --- Balance cache (per account; dropped on every transfer from that account) ---
+BALANCE_CACHE_TTL_SECONDS: int = int(os.environ.get("BALANCE_CACHE_TTL_SECONDS", "60"))
+
+# --- Destination name enquiry (started while slots are still being collected) ---
+NAME_CACHE_TTL_SECONDS: int = int(os.environ.get("NAME_CACHE_TTL_SECONDS", "21600"))
+NAME_ENQUIRY_WAIT_SECONDS: float = float(os.environ.get("NAME_ENQUIRY_WAIT_SECONDS", "1.5"))
+# Finlake authenticates every public call with the transaction PIN; set to 0
+# only if the name enquiry endpoint accepts requests without one
+NAME_ENQUIRY_NEEDS_PIN: bool = os.getenv("NAME_ENQUIRY_NEEDS_PIN", "1").lower() in ("1", "true", "yes")
+
+# --- Bank list snapshot (warm cold starts) ---
+BANKS_SNAPSHOT_PATH: str = os.environ.get("BANKS_SNAPSHOT_PATH", "/tmp/finlake-banks.json")
+BANKS_BUNDLED_PATH: str = os.environ.get("BANKS_BUNDLED_PATH", "banks_snapshot.json")
+
 # --- Phone credentials used inside Finlake credentials payload ---
 PHONE_COUNTRY_CODE: str = os.environ.get("PHONE_COUNTRY_CODE", "234")
 PHONE_NUMBER: str = os.environ.get("PHONE_NUMBER", "")
@@ -37,29 +136,108 @@ PHONE_NUMBER: str = os.environ.get("PHONE_NUMBER", "")
 BANK_API_BASE: str = os.getenv("BANK_API_BASE", "")
 BANK_API_TOKEN: str = os.getenv("BANK_API_TOKEN", "")
 
-# --- System Prompt loading order: ENV -> local file -> S3 ---
-SYSTEM_PROMPT: str | None = os.environ.get("SYSTEM_PROMPT")
-if not SYSTEM_PROMPT:
+# --- AWS client tuning (botocore Config) ---
+AWS_CONNECT_TIMEOUT: float = float(os.getenv("AWS_CONNECT_TIMEOUT", "2"))
+DDB_READ_TIMEOUT: float = float(os.getenv("DDB_READ_TIMEOUT", "3"))
+BEDROCK_READ_TIMEOUT: float = float(os.getenv("BEDROCK_READ_TIMEOUT", "30"))
+AWS_MAX_ATTEMPTS: int = int(os.getenv("AWS_MAX_ATTEMPTS", "3"))
+
+# Print per-module import cost at cold start (see coldstart.py)
+COLDSTART_PROFILE: bool = os.getenv("COLDSTART_PROFILE", "0").lower() in ("1", "true", "yes")
+
+_DEFAULT_PROMPT = "You are a multilingual Nigerian banking NLU. Output only strict JSON."
+
+_LAZY: Dict[str, Any] = {}
+_LAZY_LOCK = threading.Lock()
+
+
+def _memo(name: str, factory: Callable[[], Any]) -> Any:
+    """
+    Create `name` once per container (thread-safe) and time its creation.
+    """
+    obj = _LAZY.get(name)
+    if obj is not None:
+        return obj
+    with _LAZY_LOCK:
+        obj = _LAZY.get(name)
+        if obj is None:
+            t0 = time.perf_counter()
+            obj = _LAZY[name] = factory()
+            ms = (time.perf_counter() - t0) * 1000.0
+            # metrics imports nothing heavy; import here to keep config dependency-free
+            import metrics
+            metrics.timing(f"coldstart.{name}_ms", ms)
+    return obj
+
+
+def _client(service: str, read_timeout: float, **kwargs: Any) -> Any:
+    import boto3
+    from botocore.config import Config
+
+    cfg = Config(
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        retries={"max_attempts": AWS_MAX_ATTEMPTS, "mode": "standard"},
+        # Dispatcher threads share one client; avoid pool starvation warnings
+        max_pool_connections=max(10, WORKER_CONCURRENCY * 2),
+        tcp_keepalive=True,
+    )
+    return boto3.client(service, config=cfg, **kwargs)
+
+
+def get_brt() -> Any:
+    """
+    Bedrock runtime client.
+    """
+    return _memo("brt", lambda: _client("bedrock-runtime", BEDROCK_READ_TIMEOUT, region_name=BEDROCK_REGION))
+
+
+def get_dynamodb() -> Any:
+    """
+    Low-level DynamoDB client (sessions.py serializes items itself).
+    """
+    return _memo("dynamodb", lambda: _client("dynamodb", DDB_READ_TIMEOUT))
+
+
+def _load_system_prompt() -> str:
+    prompt = os.environ.get("SYSTEM_PROMPT")
+    if prompt:
+        return prompt
     # Try local file first
     try:
         with open("system_prompt.txt", "r", encoding="utf-8") as f:
-            SYSTEM_PROMPT = f.read()
+            return f.read()
     except Exception:
-        # Fallback to S3 if configured, else last-resort default
-        try:
-            bucket = os.getenv("CFG_BUCKET")
-            key = os.getenv("CFG_KEY")
-            if bucket and key:
-                s3 = boto3.client("s3")
-                obj = s3.get_object(Bucket=bucket, Key=key)
-                SYSTEM_PROMPT = obj["Body"].read().decode("utf-8")
-            else:
-                SYSTEM_PROMPT = "You are a multilingual Nigerian banking NLU. Output only strict JSON."
-        except Exception:
-            SYSTEM_PROMPT = "You are a multilingual Nigerian banking NLU. Output only strict JSON."
-
-# --- AWS clients ---
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(SESSIONS_TABLE)
-
-brt = boto3.client("bedrock-runtime", region_name=BEDROCK_REGION)
+        pass
+    # Fallback to S3 if configured, else last-resort default
+    try:
+        bucket = os.getenv("CFG_BUCKET")
+        key = os.getenv("CFG_KEY")
+        if bucket and key:
+            s3 = _client("s3", DDB_READ_TIMEOUT)
+            obj = s3.get_object(Bucket=bucket, Key=key)
+            return obj["Body"].read().decode("utf-8")
+    except Exception as e:
+        print("ERR system prompt from S3:", e)
+    return _DEFAULT_PROMPT
+
+
+def get_system_prompt() -> str:
+    """
+    The NLU system prompt (loaded on first use).
+    """
+    return _memo("system_prompt", _load_system_prompt)
+
+
+def __getattr__(name: str) -> Any:
+    # Lazy legacy attributes: `from config import brt` etc. keep working
+    if name == "brt":
+        return get_brt()
+    if name == "SYSTEM_PROMPT":
+        return get_system_prompt()
+    if name == "dynamodb":
+        import boto3
+        return _memo("dynamodb_resource", lambda: boto3.resource("dynamodb"))
+    if name == "table":
+        return _memo("table", lambda: __getattr__("dynamodb").Table(SESSIONS_TABLE))
+    raise AttributeError(f"module 'config' has no attribute {name!r}")
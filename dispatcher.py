@@ -0,0 +1,104 @@
+"""
+Concurrent processing of a batch of inbound WhatsApp messages.
+
+Messages are grouped by sender (`from` / wa_id). Different senders run in
+parallel on a bounded thread pool; messages from the same sender run one
+after another, in delivery order, so session updates never interleave.
+
+Before each message we check the Lambda deadline and stop picking up new
+work once fewer than DEADLINE_MARGIN_MS remain. Skipped and failed
+messages are reported back so the caller can have them redelivered.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+from config import DEADLINE_MARGIN_MS, WORKER_CONCURRENCY
+
+
+def group_by_sender(msgs: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Group messages by sender, preserving first-seen sender order and per-sender order.
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for m in msgs:
+        groups.setdefault(m["from"], []).append(m)
+    return groups
+
+
+def remaining_ms(context: Any) -> Optional[int]:
+    """
+    Milliseconds left before the Lambda deadline, or None without a context.
+    """
+    try:
+        return int(context.get_remaining_time_in_millis())
+    except Exception:
+        return None
+
+
+def _run_sender(
+    msgs: List[Dict[str, Any]],
+    handler: Callable[[Dict[str, Any]], None],
+    context: Any,
+    margin_ms: int,
+) -> Dict[str, Any]:
+    """
+    Process one sender's messages in order; stop early near the deadline.
+    """
+    done = 0
+    failed: List[Dict[str, Any]] = []
+    for i, msg in enumerate(msgs):
+        left = remaining_ms(context)
+        if left is not None and left < margin_ms:
+            return {"processed": done, "failed": failed, "skipped": msgs[i:]}
+        try:
+            handler(msg)
+            done += 1
+        except Exception as e:
+            # Log, report it to the caller and continue with this sender's next message
+            failed.append(msg)
+            print("ERR handle_text:", e)
+    return {"processed": done, "failed": failed, "skipped": []}
+
+
+def process_messages(
+    msgs: List[Dict[str, Any]],
+    handler: Callable[[Dict[str, Any]], None],
+    context: Any = None,
+    max_workers: Optional[int] = None,
+    margin_ms: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Run `handler(msg)` for every message: parallel across senders, ordered within one.
+
+    Returns {"processed": int, "failed": int, "failed_msgs": [msg, ...],
+    "skipped": [msg, ...]}; failed messages raised in `handler`, skipped
+    ones were not started before the deadline.
+    """
+    groups = list(group_by_sender(msgs).values())
+    margin = DEADLINE_MARGIN_MS if margin_ms is None else margin_ms
+    workers = max(1, min(max_workers or WORKER_CONCURRENCY, len(groups) or 1))
+
+    with metrics.timed("dispatch.batch_ms"):
+        if workers == 1:
+            results = [_run_sender(g, handler, context, margin) for g in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wa-sender") as pool:
+                futures = [pool.submit(_run_sender, g, handler, context, margin) for g in groups]
+                results = [f.result() for f in futures]
+
+    failed = [m for r in results for m in r["failed"]]
+    out = {
+        "processed": sum(r["processed"] for r in results),
+        "failed": len(failed),
+        "failed_msgs": failed,
+        "skipped": [m for r in results for m in r["skipped"]],
+    }
+    metrics.incr("dispatch.processed", out["processed"])
+    metrics.incr("dispatch.failed", out["failed"])
+    if out["skipped"]:
+        metrics.incr("dispatch.skipped_deadline", len(out["skipped"]))
+        print(f"WARN deadline: skipped {len(out['skipped'])} message(s)")
+    return out
@@ -0,0 +1,90 @@
+"""
+Batch dispatcher: per-sender order, parallel senders, deadline, failures.
+
+Run:  python -m pytest -q dispatcher_test.py
+"""
+import threading
+import time
+
+from dispatcher import group_by_sender, process_messages, remaining_ms
+
+
+def _msg(i, sender, text="hi"):
+    return {"id": f"wamid.{i}", "from": sender, "text": text}
+
+
+class Context:
+    """
+    Lambda context whose clock runs down by `step_ms` per call.
+    """
+
+    def __init__(self, left_ms, step_ms=0):
+        self.left_ms = left_ms
+        self.step_ms = step_ms
+
+    def get_remaining_time_in_millis(self):
+        left = self.left_ms
+        self.left_ms -= self.step_ms
+        return left
+
+
+def test_group_by_sender_keeps_order():
+    msgs = [_msg(1, "a"), _msg(2, "b"), _msg(3, "a")]
+    groups = group_by_sender(msgs)
+    assert list(groups) == ["a", "b"]
+    assert [m["id"] for m in groups["a"]] == ["wamid.1", "wamid.3"]
+
+
+def test_one_sender_in_order_senders_in_parallel():
+    seen = []
+    running = set()
+    overlap = threading.Event()
+    lock = threading.Lock()
+
+    def handler(m):
+        with lock:
+            if running:
+                overlap.set()
+            assert m["from"] not in running
+            running.add(m["from"])
+            seen.append(m["id"])
+        time.sleep(0.02)
+        with lock:
+            running.discard(m["from"])
+
+    msgs = [_msg(i, "ab"[i % 2]) for i in range(6)]
+    res = process_messages(msgs, handler, max_workers=2)
+    assert res["processed"] == 6 and res["failed"] == 0
+    assert overlap.is_set()
+    for sender in "ab":
+        ids = [i for i in seen if int(i.split(".")[1]) % 2 == "ab".index(sender)]
+        assert ids == [m["id"] for m in msgs if m["from"] == sender]
+
+
+def test_failed_messages_are_reported_and_the_sender_continues():
+    handled = []
+
+    def handler(m):
+        if m["text"] == "boom":
+            raise RuntimeError("bad turn")
+        handled.append(m["id"])
+
+    msgs = [_msg(1, "a"), _msg(2, "a", "boom"), _msg(3, "a"), _msg(4, "b")]
+    res = process_messages(msgs, handler)
+    assert res["processed"] == 3 and res["failed"] == 1
+    assert res["failed_msgs"] == [msgs[1]]
+    assert sorted(handled) == ["wamid.1", "wamid.3", "wamid.4"]
+
+
+def test_messages_after_the_deadline_margin_are_skipped():
+    handled = []
+    msgs = [_msg(1, "a"), _msg(2, "a"), _msg(3, "a")]
+    # 5s left, 2s per check, 2s margin: two messages start, the third does not
+    res = process_messages(msgs, lambda m: handled.append(m["id"]), Context(5000, 2000), margin_ms=2000)
+    assert handled == ["wamid.1", "wamid.2"]
+    assert res["processed"] == 2 and res["skipped"] == [msgs[2]]
+
+
+def test_remaining_ms_without_a_context():
+    assert remaining_ms(None) is None
+    assert remaining_ms(Context(1234)) == 1234
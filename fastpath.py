@@ -0,0 +1,288 @@
+"""
+Deterministic fast-path NLU in front of `llm.llm_parse`.
+
+Most slot-filling turns are a single token ("1234567890", "PIN 0000", "5k")
+and the session already tells us which slot we asked for. For those, plus
+reset keywords and plain greetings, we can build the same dict shape that
+`llm_parse` returns without a Bedrock round-trip.
+
+`fast_parse` returns None whenever it is not confident; the caller then
+falls through to the LLM. It also never decides to move money: the answer
+that completes a transfer (MONEY_INTENTS) is handed to the LLM, which
+routes it to the strong model. Hits/misses are counted in `metrics`, and
+the bypass rate (`bypass_rate()`) is reported as the `nlu.bypass_rate`
+gauge.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+import metrics
+from session_model import Session
+from templates import render
+
+SUPPORTED_LANGS = ("en", "pcm", "ig", "yo", "ha")
+
+# Intents whose fulfillment moves money; their fulfill decision is never made here
+MONEY_INTENTS = ("transfer",)
+
+# Required slots per intent, in the order we ask for them (see system prompt).
+REQUIRED_SLOTS: Dict[str, List[str]] = {
+    "transfer": ["amount", "recipient_name", "destination_account_number", "source_account_number", "pin"],
+    "check_balance": ["source_account_number", "pin"],
+}
+
+# Keyword -> language it implies (None = language-neutral, keep session language).
+# Keys are diacritic-folded, lowercase, punctuation stripped.
+_RESET_WORDS: Dict[str, Optional[str]] = {
+    "reset": None,
+    "restart": None,
+    "start over": "en",
+    "start again": "en",
+    "cancel": None,
+    "clear": "en",
+    "abeg reset": "pcm",
+    "reset am": "pcm",
+    "make we start again": "pcm",
+    "cancel am": "pcm",
+    "malite ozo": "ig",
+    "kagbuo": "ig",
+    "bere lekansi": "yo",
+    "bere leekansi": "yo",
+    "fagile": "yo",
+    "fagilee": "yo",
+    "sake farawa": "ha",
+    "soke": "ha",
+}
+
+_GREETING_WORDS: Dict[str, Optional[str]] = {
+    "hi": "en",
+    "hello": "en",
+    "hey": "en",
+    "good morning": "en",
+    "good afternoon": "en",
+    "good evening": "en",
+    "how far": "pcm",
+    "howfa": "pcm",
+    "how you dey": "pcm",
+    "ndewo": "ig",
+    "kedu": "ig",
+    "nnoo": "ig",
+    "bawo": "yo",
+    "bawo ni": "yo",
+    "e n le": "yo",
+    "pele": "yo",
+    "e kaaro": "yo",
+    "sannu": "ha",
+    "ina kwana": "ha",
+    "ina wuni": "ha",
+    "salam": "ha",
+}
+
+_EMPTY_SLOTS = {
+    "amount": None,
+    "destination_account_number": None,
+    "destination_bank": None,
+    "recipient_name": None,
+    "source_account_number": None,
+    "source_account_name": None,
+    "narration": None,
+    "pin": None,
+}
+
+# Words (folded) that mark a request to move money, in any supported language
+_MONEY_WORDS = frozenset({
+    "send", "transfer", "pay", "ziga", "zipu", "ranse", "sanwo", "tura", "aika",
+})
+
+_ACCOUNT_RE = re.compile(r"^(?:(?:acct|account|acc|a/c)\s*(?:no\.?|number)?\s*[:#-]?\s*)?(\d{10})$", re.I)
+_PIN_RE = re.compile(r"^(?:(?:my\s+)?pin\s*(?:is)?\s*[:#-]?\s*)?(\d{4,6})$", re.I)
+_AMOUNT_RE = re.compile(
+    r"^(?:₦|ngn|n)?\s*(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d+))?\s*([km])?\s*(?:naira|ngn)?$",
+    re.I,
+)
+
+
+# ---------------------------------------------------------------------------
+# Normalisation / extractors
+# ---------------------------------------------------------------------------
+
+def _fold(text: str) -> str:
+    """
+    Lowercase, drop diacritics and punctuation, collapse whitespace.
+    """
+    t = unicodedata.normalize("NFKD", text or "")
+    t = "".join(ch for ch in t if not unicodedata.combining(ch)).lower()
+    t = re.sub(r"[^\w\s]", " ", t)
+    return " ".join(t.split())
+
+
+def _compact(text: str) -> str:
+    """
+    Strip and remove spaces/dashes inside digit runs ("0123 456 789" -> "0123456789").
+    """
+    t = (text or "").strip().rstrip(".!")
+    return re.sub(r"(?<=\d)[\s-]+(?=\d)", "", t)
+
+
+def parse_account(text: str) -> Optional[str]:
+    m = _ACCOUNT_RE.match(_compact(text))
+    return m.group(1) if m else None
+
+
+def parse_pin(text: str) -> Optional[str]:
+    m = _PIN_RE.match(_compact(text))
+    return m.group(1) if m else None
+
+
+def parse_amount(text: str) -> Optional[Dict[str, Any]]:
+    """
+    "5k" / "₦5,000" / "NGN 5000" / "2.5m" -> {"text": ..., "value": int}.
+    """
+    raw = (text or "").strip().rstrip(".!")
+    m = _AMOUNT_RE.match(raw)
+    if not m:
+        return None
+    whole, frac, suffix = m.group(1).replace(",", ""), m.group(2), (m.group(3) or "").lower()
+    if len(whole) >= 10 and not suffix:
+        return None  # looks like an account number, not an amount
+    try:
+        val = float(f"{whole}.{frac}" if frac else whole)
+    except ValueError:
+        return None
+    val *= {"k": 1_000, "m": 1_000_000}.get(suffix, 1)
+    if val <= 0:
+        return None
+    return {"text": raw, "value": int(round(val))}
+
+
+_EXTRACTORS = {
+    "destination_account_number": parse_account,
+    "source_account_number": parse_account,
+    "pin": parse_pin,
+    "amount": parse_amount,
+}
+
+
+def looks_like_money(text: str) -> bool:
+    """
+    True if `text` reads like a request to move money (a money keyword, or
+    a 10-digit account number). Used to route the parse, never to act on.
+    """
+    folded = _fold(text)
+    if _MONEY_WORDS & set(folded.split()):
+        return True
+    return re.search(r"(?<!\d)\d{10}(?!\d)", _compact(text)) is not None
+
+
+def missing_for(intent: str, slots: Dict[str, Any]) -> List[str]:
+    """
+    Required slots for `intent` that are still empty, in asking order.
+    """
+    return [s for s in REQUIRED_SLOTS.get(intent, []) if not (slots or {}).get(s)]
+
+
+# ---------------------------------------------------------------------------
+# Result builders (same shape as llm_parse)
+# ---------------------------------------------------------------------------
+
+def _result(
+    lang: str,
+    intent: str,
+    slots: Dict[str, Any],
+    missing: List[str],
+    ask_slot: Optional[str],
+    action: str,
+    reply: str,
+    canonical: str,
+) -> Dict[str, Any]:
+    return {
+        "lang": {"detected": lang, "confidence": 1.0},
+        "intent": intent,
+        "slots": slots,
+        "missing_slots": missing,
+        "ask_slot": ask_slot,
+        "action": action,
+        "reply": reply,
+        "canonical_en": canonical,
+        "source": "fastpath",
+    }
+
+
+def _try_reset(folded: str, lang: str) -> Optional[Dict[str, Any]]:
+    if folded not in _RESET_WORDS:
+        return None
+    lang = _RESET_WORDS[folded] or lang
+    return _result(lang, "reset", dict(_EMPTY_SLOTS), [], None, "reset", render("reset", lang), "Reset session.")
+
+
+def _try_greeting(folded: str, lang: str, sess: Session) -> Optional[Dict[str, Any]]:
+    if folded not in _GREETING_WORDS:
+        return None
+    # Mid-flow greetings ("hi" while collecting a PIN) are left to the LLM.
+    if sess.intent in REQUIRED_SLOTS and sess.slots:
+        return None
+    lang = _GREETING_WORDS[folded] or lang
+    return _result(lang, "greeting", {}, [], None, "ask", render("greeting", lang), "Greeting.")
+
+
+def _try_slot(text: str, lang: str, sess: Session) -> Optional[Dict[str, Any]]:
+    intent = sess.intent
+    if intent not in REQUIRED_SLOTS:
+        return None
+
+    known = sess.slots
+    pending = sess.ask_slot or next(iter(sess.missing_slots), None)
+    if pending not in _EXTRACTORS:
+        return None
+
+    value = _EXTRACTORS[pending](text)
+    if value is None:
+        return None
+
+    merged = dict(known)
+    merged[pending] = value
+    missing = missing_for(intent, merged)
+    if missing:
+        nxt = missing[0]
+        reply = render(f"ask.{nxt}", lang)
+        return _result(lang, intent, {pending: value}, missing, nxt, "ask", reply, f"Provide {pending}.")
+    if intent in MONEY_INTENTS:
+        # Whether to send money is the model's call (strong tier), not a regex's
+        metrics.incr("nlu.fastpath_handoff")
+        return None
+    reply = render("fulfill_ack", lang)
+    return _result(lang, intent, {pending: value}, [], None, "fulfill", reply, f"Provide {pending}.")
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def fast_parse(text: str, sess: Session) -> Optional[Dict[str, Any]]:
+    """
+    Try to parse `text` deterministically given the current session.
+
+    Returns a dict shaped like `llm_parse` output, or None to fall through.
+    """
+    lang = sess.lang or "en"
+    if lang not in SUPPORTED_LANGS:
+        lang = "en"
+
+    folded = _fold(text)
+    out = None
+    if folded:
+        out = _try_reset(folded, lang) or _try_greeting(folded, lang, sess) or _try_slot(text, lang, sess)
+
+    metrics.incr("nlu.fastpath" if out else "nlu.llm")
+    metrics.gauge("nlu.bypass_rate", round(bypass_rate(), 3))
+    return out
+
+
+def bypass_rate() -> float:
+    """
+    Fraction of turns answered without Bedrock in this warm container.
+    """
+    return metrics.ratio("nlu.fastpath", "nlu.llm")
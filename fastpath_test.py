@@ -0,0 +1,92 @@
+"""
+Deterministic fast-path NLU: extractors, resets/greetings, slot answers.
+
+Run:  python -m pytest -q fastpath_test.py
+"""
+import pytest
+
+import metrics
+from fastpath import bypass_rate, fast_parse, parse_account, parse_amount, parse_pin
+from session_model import Session
+
+
+def _sess(intent="unknown", slots=None, ask_slot=None, lang="en"):
+    return Session("2348000000001", intent=intent, lang=lang, slots=slots or {}, ask_slot=ask_slot)
+
+
+@pytest.mark.parametrize("text, value", [
+    ("5k", 5000),
+    ("₦5,000", 5000),
+    ("NGN 5000", 5000),
+    ("2.5m", 2_500_000),
+    ("1,250.50 naira", 1250),
+])
+def test_parse_amount(text, value):
+    assert parse_amount(text)["value"] == value
+
+
+@pytest.mark.parametrize("text", ["0", "five thousand", "0123456789", "-5"])
+def test_parse_amount_rejects(text):
+    assert parse_amount(text) is None
+
+
+def test_parse_account():
+    assert parse_account("0123456789") == "0123456789"
+    assert parse_account("0123 456 789") == "0123456789"
+    assert parse_account("acct no: 0123-456-789") == "0123456789"
+    assert parse_account("012345678") is None
+    assert parse_account("01234567890") is None
+
+
+def test_parse_pin_accepts_four_to_six_digits():
+    assert parse_pin("1234") == "1234"
+    assert parse_pin("my pin is 123456") == "123456"
+    assert parse_pin("PIN: 0000") == "0000"
+    assert parse_pin("123") is None
+    assert parse_pin("1234567") is None
+
+
+def test_reset_and_greeting():
+    out = fast_parse("Start over!", _sess("transfer", {"amount": 5000}))
+    assert out["action"] == "reset" and out["lang"]["detected"] == "en"
+    assert fast_parse("bawo ni", _sess())["lang"]["detected"] == "yo"
+    # A greeting in the middle of a flow is left to the model
+    assert fast_parse("hi", _sess("transfer", {"amount": 5000})) is None
+
+
+def test_slot_answer_asks_for_the_next_slot():
+    sess = _sess("transfer", {"amount": 5000, "recipient_name": "Ada"}, ask_slot="destination_account_number")
+    out = fast_parse("0123456789", sess)
+    assert out["action"] == "ask"
+    assert out["slots"] == {"destination_account_number": "0123456789"}
+    assert out["ask_slot"] == "source_account_number"
+
+
+def test_balance_is_fulfilled_here():
+    sess = _sess("check_balance", {"source_account_number": "0001112223"}, ask_slot="pin")
+    out = fast_parse("123456", sess)
+    assert out["action"] == "fulfill" and out["slots"] == {"pin": "123456"}
+
+
+def test_transfer_fulfill_is_handed_to_the_model():
+    slots = {
+        "amount": 5000,
+        "recipient_name": "Ada",
+        "destination_account_number": "0123456789",
+        "source_account_number": "0001112223",
+    }
+    before = metrics.counter("nlu.fastpath_handoff")
+    assert fast_parse("1234", _sess("transfer", slots, ask_slot="pin")) is None
+    assert metrics.counter("nlu.fastpath_handoff") == before + 1
+
+
+def test_unclear_text_falls_through():
+    assert fast_parse("send it to my sister", _sess("transfer", {"amount": 5000}, ask_slot="recipient_name")) is None
+
+
+def test_bypass_rate_is_reported():
+    metrics.reset()
+    fast_parse("hello", _sess())
+    fast_parse("what can you do?", _sess())
+    assert bypass_rate() == 0.5
+    assert metrics.snapshot()["gauges"]["nlu.bypass_rate"] == 0.5
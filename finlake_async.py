@@ -0,0 +1,447 @@
+"""
+asyncio-native Finlake API client.
+
+`AsyncFinlake` offers the same helpers as `finlake.py` (list_banks,
+internal_name_enquiry, transaction_history_by_account, get_balance,
+fund_transfer_internal, fund_transfer_outward, user_info) as coroutines,
+on top of a pooled keep-alive `httpx.AsyncClient`.
+
+Each endpoint path has its own semaphore so a burst on one endpoint
+(e.g. history lookups) cannot starve another (e.g. transfers), and its
+own circuit breaker. Retries come out of a shared retry budget and honour
+Retry-After; when the breaker is open or the budget is spent we fail fast
+with `FinlakeUnavailable` instead of sleeping.
+
+Money-moving endpoints (NON_IDEMPOTENT_PATHS) are only retried when the
+request provably never reached Finlake (connect errors, 429). A read
+timeout or 5xx there raises `FinlakeAmbiguous`; ledger.py then reconciles
+through the transaction history instead of posting again.
+
+`finlake.py` keeps the synchronous API as a thin wrapper that runs these
+coroutines on a shared background event loop.
+
+Requires `httpx` (requirements.txt; not part of the Lambda runtime).
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import random
+import time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+import metrics
+from resilience import CircuitBreaker, RetryBudget, parse_retry_after
+from config import (
+    ACCOUNT_ID,
+    FINLAKE_BASE_URL,
+    FINLAKE_ENDPOINT_CONCURRENCY,
+    FINLAKE_KEEPALIVE_CONNECTIONS,
+    FINLAKE_MAX_CONNECTIONS,
+    FINLAKE_TRANSFER_TIMEOUT,
+    FLK_STAGE,
+    PHONE_COUNTRY_CODE,
+    PHONE_NUMBER,
+)
+
+BASE_URL = FINLAKE_BASE_URL
+TIMEOUT = 15  # seconds
+KEEPALIVE_EXPIRY = 30  # seconds an idle pooled connection is kept
+
+# Retry policy (simple, conservative)
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.6  # seconds; exponential (0.6, 1.2, 2.4) + small jitter
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRY_AFTER = 5.0  # seconds; longer Retry-After hints fail fast instead
+
+# Circuit breaker (per endpoint) and retry budget (shared)
+BREAKER_FAILURES = 5
+BREAKER_RESET_SECONDS = 30.0
+RETRY_BUDGET_RATIO = 0.1
+
+# Money-moving endpoints get a tighter concurrency cap than reads.
+ENDPOINT_LIMITS: Dict[str, int] = {
+    "/public/create/cts-internal-fund-transfer": 4,
+    "/public/create/cts-outward-fund-transfer": 4,
+}
+
+# Endpoints that must not be re-posted once the request may have arrived,
+# and their (shorter) timeout: an ambiguous outcome is reconciled, not retried.
+NON_IDEMPOTENT_PATHS = frozenset(ENDPOINT_LIMITS)
+ENDPOINT_TIMEOUTS: Dict[str, float] = {p: FINLAKE_TRANSFER_TIMEOUT for p in NON_IDEMPOTENT_PATHS}
+
+# Transport errors raised before the request was sent; safe to retry anywhere
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class FinlakeUnavailable(Exception):
+    """
+    Finlake is failing (circuit open, retries exhausted or budget spent).
+    The caller should tell the user to try again later.
+    """
+
+
+class FinlakeAmbiguous(FinlakeUnavailable):
+    """
+    A non-idempotent request (a transfer) failed after it may have reached
+    Finlake (read timeout, 5xx). Whether it was applied is unknown; do not
+    re-post, reconcile instead.
+    """
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _headers(auth_token: Optional[str] = None) -> Dict[str, str]:
+    """
+    Build Finlake headers, optionally including Authorization.
+    """
+    h = {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "X-Account-Id": ACCOUNT_ID,
+        "X-Flk-Stage": FLK_STAGE,
+    }
+    if auth_token:
+        h["Authorization"] = f"Bearer {auth_token}"
+    return h
+
+
+def generate_credentials(transaction_pin: str) -> Dict[str, str]:
+    """
+    Finlake "credentials" payload for public endpoints.
+
+    The requestSignature must be Base64 of "<unix_ts>:chatbot".
+    """
+    signature = f"{int(time.time())}:chatbot"
+    sig = base64.b64encode(signature.encode()).decode()
+    return {
+        "phoneCountryCode": PHONE_COUNTRY_CODE,
+        "phoneNumber": PHONE_NUMBER,
+        "requestSignature": sig,
+        "transactionPin": transaction_pin or "",
+    }
+
+
+def _backoff_seconds(attempt: int) -> float:
+    return BACKOFF_BASE * (2 ** (attempt - 1)) + random.uniform(0, 0.25)
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+class AsyncFinlake:
+    """
+    Pooled async Finlake client.
+
+    Parameters
+    ----------
+    base_url : str
+        Finlake base URL.
+    max_connections / max_keepalive : int
+        httpx pool limits (total, and idle keep-alive connections).
+    endpoint_concurrency : int
+        Default in-flight cap per endpoint path (see ENDPOINT_LIMITS overrides).
+    """
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        timeout: float = TIMEOUT,
+        max_connections: int = FINLAKE_MAX_CONNECTIONS,
+        max_keepalive: int = FINLAKE_KEEPALIVE_CONNECTIONS,
+        endpoint_concurrency: int = FINLAKE_ENDPOINT_CONCURRENCY,
+        endpoint_limits: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.base_url = base_url
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        self.endpoint_concurrency = endpoint_concurrency
+        self.endpoint_limits = dict(ENDPOINT_LIMITS if endpoint_limits is None else endpoint_limits)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retry_budget = RetryBudget(ratio=RETRY_BUDGET_RATIO)
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the loop that first uses it
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+            )
+        return self._client
+
+    def _sem(self, path: str) -> asyncio.Semaphore:
+        sem = self._sems.get(path)
+        if sem is None:
+            sem = self._sems[path] = asyncio.Semaphore(
+                self.endpoint_limits.get(path, self.endpoint_concurrency)
+            )
+        return sem
+
+    def breaker(self, path: str) -> CircuitBreaker:
+        b = self._breakers.get(path)
+        if b is None:
+            name = "finlake." + path.rsplit("/", 1)[-1]
+            # A probe is one attempt; give it its full request timeout before
+            # treating it as lost (cancelled callers never report back)
+            probe_timeout = max(BREAKER_RESET_SECONDS, 2 * ENDPOINT_TIMEOUTS.get(path, self.timeout))
+            b = self._breakers[path] = CircuitBreaker(name, BREAKER_FAILURES, BREAKER_RESET_SECONDS, probe_timeout)
+        return b
+
+    def breaker_states(self) -> Dict[str, str]:
+        """
+        Current breaker state per endpoint path (for metrics/health output).
+        """
+        return {path: b.state for path, b in self._breakers.items()}
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, path: str, payload: Dict[str, Any], auth_token: Optional[str] = None) -> Dict[str, Any]:
+        """
+        POST helper with budgeted retries for transient failures.
+
+        Retries on: network errors (timeout/connection), and HTTP {429, 500, 502, 503, 504},
+        only while the endpoint breaker allows it and the retry budget has room.
+        Envelope errors are treated as business errors and are NOT retried.
+
+        For NON_IDEMPOTENT_PATHS only connect errors and 429 are retried; a
+        read timeout or 5xx raises FinlakeAmbiguous at once. The call's wall
+        time (retries included) is recorded as finlake.<endpoint>_ms.
+        """
+        t0 = time.perf_counter()
+        try:
+            return await self._post_retrying(path, payload, auth_token)
+        finally:
+            metrics.timing(f"finlake.{path.rsplit('/', 1)[-1]}_ms", (time.perf_counter() - t0) * 1000.0)
+
+    async def _post_retrying(
+        self, path: str, payload: Dict[str, Any], auth_token: Optional[str]
+    ) -> Dict[str, Any]:
+        breaker = self.breaker(path)
+        if not breaker.allow():
+            metrics.incr("finlake.fail_fast")
+            raise FinlakeUnavailable(f"Finlake {path} unavailable (circuit open)")
+
+        self.retry_budget.record_request()
+        last_err: Optional[Exception] = None
+        once = path in NON_IDEMPOTENT_PATHS
+        timeout = ENDPOINT_TIMEOUTS.get(path, self.timeout)
+
+        for attempt in range(1, MAX_RETRIES + 1):
+            delay = _backoff_seconds(attempt)
+            try:
+                async with self._sem(path):
+                    r = await self._http().post(path, json=payload, headers=_headers(auth_token), timeout=timeout)
+                status = r.status_code
+
+                if once and status in RETRY_STATUSES and status != 429:
+                    breaker.record_failure()
+                    metrics.incr("finlake.ambiguous")
+                    raise FinlakeAmbiguous(f"Finlake {path} HTTP {status}: {r.text[:300]}")
+
+                # Retry on transient HTTP codes
+                if status in RETRY_STATUSES:
+                    last_err = Exception(f"Finlake HTTP {status}: {r.text[:300]}")
+                    breaker.record_failure()
+                    hint = parse_retry_after(r.headers.get("Retry-After"))
+                    if hint is not None:
+                        if hint > MAX_RETRY_AFTER:
+                            break
+                        delay = hint
+                    if attempt < MAX_RETRIES and self._may_retry(breaker):
+                        await asyncio.sleep(delay)
+                        continue
+                    break
+
+                # Any non-transient answer means the service is up
+                breaker.record_success()
+
+                # Parse JSON (or raise if not JSON)
+                try:
+                    data = r.json()
+                except ValueError:
+                    raise Exception(f"Finlake non-JSON response {status}: {r.text[:300]}")
+
+                # Non-200 that isn't in our retry list -> raise immediately
+                if status != 200:
+                    raise Exception(f"Finlake HTTP {status}: {data}")
+
+                # Common envelope check (do NOT retry)
+                if isinstance(data, dict) and data.get("responseCode") not in (None, "", "00"):
+                    # Some endpoints use '00' for success
+                    raise Exception(
+                        f"Finlake error responseCode={data.get('responseCode')} "
+                        f"message={data.get('responseMessage')}"
+                    )
+
+                return data
+
+            except httpx.TransportError as e:
+                # Timeouts, connection errors, protocol errors
+                last_err = e
+                breaker.record_failure()
+                if once and not isinstance(e, _NOT_SENT):
+                    metrics.incr("finlake.ambiguous")
+                    raise FinlakeAmbiguous(f"Finlake {path} outcome unknown: {e!r}") from e
+                if attempt < MAX_RETRIES and self._may_retry(breaker):
+                    await asyncio.sleep(delay)
+                    continue
+                break
+
+        raise FinlakeUnavailable(f"Finlake request failed after {attempt} attempt(s): {last_err}")
+
+    def _may_retry(self, breaker: CircuitBreaker) -> bool:
+        if not breaker.allow():
+            return False
+        if not self.retry_budget.try_acquire():
+            return False
+        metrics.incr("finlake.retry")
+        return True
+
+    # -----------------------------------------------------------------------
+    # Public endpoints (chatbot-controller)
+    # -----------------------------------------------------------------------
+
+    async def list_banks(self, transaction_pin: str) -> Dict[str, Any]:
+        payload = generate_credentials(transaction_pin)
+        return await self._post("/public/read/cts-bank", payload)
+
+    async def internal_name_enquiry(self, account_number: str, transaction_pin: str) -> Dict[str, Any]:
+        payload = {
+            "accountNumber": account_number,
+            "credentials": generate_credentials(transaction_pin),
+        }
+        return await self._post("/public/read/cts-internal-name-enquiry", payload)
+
+    async def transaction_history_by_account(
+        self,
+        account_number: str,
+        start_date: str,
+        end_date: str,
+        page: int,
+        page_size: int,
+        transaction_pin: str,
+    ) -> Dict[str, Any]:
+        payload = {
+            "accountNumber": account_number,
+            "credentials": generate_credentials(transaction_pin),
+            "startDate": start_date,
+            "endDate": end_date,
+            "page": page,
+            "pageSize": page_size,
+        }
+        return await self._post("/public/read/cts-by-account-number", payload)
+
+    async def get_balance(self, account_number: str, transaction_pin: str) -> str:
+        """
+        Returns a decimal string (2 d.p.) representing the current balance.
+        """
+        today = time.strftime("%Y-%m-%d")
+        month_ago = time.strftime("%Y-%m-%d", time.gmtime(time.time() - 30 * 24 * 3600))
+
+        data = await self.transaction_history_by_account(
+            account_number, month_ago, today, page=1, page_size=1, transaction_pin=transaction_pin
+        )
+
+        acct = (data.get("account") or [{}])[0]
+        bal_str = str(acct.get("accountBalance") or "0")
+        try:
+            dec = Decimal(bal_str).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+            return str(dec)
+        except (InvalidOperation, Exception):
+            return "0.00"
+
+    async def get_balances(self, account_numbers: List[str], transaction_pin: str) -> Dict[str, Any]:
+        """
+        Fetch several balances concurrently.
+
+        Returns {account_number: "<decimal-string>" | Exception}.
+        """
+        accts = list(dict.fromkeys(account_numbers))
+        results = await asyncio.gather(
+            *(self.get_balance(a, transaction_pin) for a in accts), return_exceptions=True
+        )
+        return dict(zip(accts, results))
+
+    async def fund_transfer_internal(
+        self,
+        *,
+        amount: int,
+        credit_account_name: str,
+        credit_account_number: str,
+        debit_account_name: str,
+        debit_account_number: str,
+        location: str = "NGA",
+        narration: str = "",
+        save_beneficiary: bool = True,
+        transaction_pin: str,
+    ) -> Dict[str, Any]:
+        payload = {
+            "amount": str(amount),
+            "credentials": generate_credentials(transaction_pin),
+            "creditAccountName": credit_account_name,
+            "creditAccountNumber": credit_account_number,
+            "debitAccountName": debit_account_name,
+            "debitAccountNumber": debit_account_number,
+            "location": location,
+            "narration": narration or "",
+            "saveBeneficiary": bool(save_beneficiary),
+            "transactionPin": transaction_pin,
+        }
+        return await self._post("/public/create/cts-internal-fund-transfer", payload)
+
+    async def fund_transfer_outward(
+        self,
+        *,
+        amount: int,
+        credit_account_name: str,
+        credit_account_number: str,
+        credit_bank_code: str,
+        credit_bank_name: str,
+        debit_account_name: str,
+        debit_account_number: str,
+        location: str = "NGA",
+        name_enquiry_reference: str = "",
+        narration: str = "",
+        save_beneficiary: bool = True,
+        transaction_pin: str,
+    ) -> Dict[str, Any]:
+        payload = {
+            "amount": str(amount),
+            "credentials": generate_credentials(transaction_pin),
+            "creditAccountName": credit_account_name,
+            "creditAccountNumber": credit_account_number,
+            "creditBankCode": credit_bank_code,
+            "creditBankName": credit_bank_name,
+            "debitAccountName": debit_account_name,
+            "debitAccountNumber": debit_account_number,
+            "location": location,
+            "nameEnquiryReference": name_enquiry_reference or "",
+            "narration": narration or "",
+            "saveBeneficiary": bool(save_beneficiary),
+            "transactionPin": transaction_pin,
+        }
+        return await self._post("/public/create/cts-outward-fund-transfer", payload)
+
+    async def user_info(self, transaction_pin: str) -> Dict[str, Any]:
+        """
+        Chatbot Controller:
+          POST /public/read/cts-user-info
+        """
+        payload = generate_credentials(transaction_pin)
+        return await self._post("/public/read/cts-user-info", payload)
@@ -0,0 +1,257 @@
+"""
+Pooled WhatsApp Cloud API (Graph) sender.
+
+`AsyncGraphSender` keeps one keep-alive `httpx.AsyncClient` to the Graph
+API, so a warm container pays the TLS handshake once instead of on every
+reply. Sends are retried (bounded) only when Meta says trying again can
+help:
+  - HTTP 429 and 5xx, honouring Retry-After
+  - throttling / transient error codes (RETRYABLE_CODES), with a longer
+    back-off for the per-recipient pair rate limit (131056)
+  - connection failures before the request was sent
+Anything else (bad token, recipient outside the 24h window, invalid
+parameters, ...) raises `GraphError` at once.
+
+`send_text` is the blocking API used per turn; `send_many` / `asend_many`
+flush several replies concurrently on the same pool. The sync functions
+run on the shared background loop (bg_loop.py), like finlake.py.
+
+Metrics: graph.send_ms per message (including retries), graph.sent,
+graph.retry, graph.error.<code>.
+
+Requires `httpx` (requirements.txt; not part of the Lambda runtime).
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+import metrics
+from bg_loop import run
+from config import (
+    GRAPH_API_VERSION,
+    GRAPH_BASE_URL,
+    GRAPH_MAX_CONNECTIONS,
+    GRAPH_SEND_CONCURRENCY,
+    GRAPH_TIMEOUT,
+    PHONE_NUMBER_ID,
+    WHATSAPP_TOKEN,
+)
+from resilience import parse_retry_after
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.3  # seconds; exponential + jitter
+PAIR_RATE_BACKOFF = 2.0  # seconds; 131056 needs a real pause
+MAX_RETRY_AFTER = 5.0  # seconds; longer hints fail instead of holding the turn
+KEEPALIVE_EXPIRY = 60  # seconds an idle pooled connection is kept
+TEXT_LIMIT = 4000  # WhatsApp text body limit
+
+# Meta error codes worth retrying (throttling and transient platform errors)
+RETRYABLE_CODES = frozenset({
+    1,       # API unknown error
+    2,       # API service temporarily unavailable
+    4,       # app-level rate limit
+    80007,   # WABA rate limit
+    130429,  # Cloud API throughput reached
+    131000,  # something went wrong
+    131016,  # service unavailable
+    131056,  # pair rate limit (same sender/recipient)
+})
+PAIR_RATE_CODE = 131056
+
+# Transport errors raised before the request was sent (a retry cannot duplicate)
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class GraphError(Exception):
+    """
+    A send that failed for good. `code` is Meta's error code when present.
+    """
+
+    def __init__(self, message: str, status: int = 0, code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def _error_code(r: httpx.Response) -> Tuple[Optional[int], str]:
+    try:
+        err = (r.json() or {}).get("error") or {}
+    except ValueError:
+        return None, r.text[:300]
+    code = str(err.get("code", ""))
+    return (int(code) if code.isdigit() else None), str(err.get("message") or "")[:300]
+
+
+def _backoff_seconds(attempt: int) -> float:
+    return BACKOFF_BASE * (2 ** (attempt - 1)) + random.uniform(0, 0.1)
+
+
+def text_payload(to: str, body: str) -> Dict[str, Any]:
+    return {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "text",
+        "text": {"body": body[:TEXT_LIMIT]},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Sender
+# ---------------------------------------------------------------------------
+
+class AsyncGraphSender:
+    """
+    Pooled async Graph API client for one WhatsApp phone number.
+
+    Parameters
+    ----------
+    phone_number_id : str
+        Sending number (PHONE_NUMBER_ID).
+    base_url : str
+        Graph base URL (GRAPH_BASE_URL; overridable for local harnesses).
+    concurrency : int
+        Max in-flight sends from `asend_many`.
+    """
+
+    def __init__(
+        self,
+        phone_number_id: str = PHONE_NUMBER_ID,
+        token: str = WHATSAPP_TOKEN,
+        base_url: str = GRAPH_BASE_URL,
+        api_version: str = GRAPH_API_VERSION,
+        timeout: float = GRAPH_TIMEOUT,
+        max_connections: int = GRAPH_MAX_CONNECTIONS,
+        concurrency: int = GRAPH_SEND_CONCURRENCY,
+    ) -> None:
+        self.path = f"/{api_version}/{phone_number_id}/messages"
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        self.concurrency = concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the loop that first uses it
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                headers={"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"},
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def asend(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        POST one message payload; returns Meta's JSON answer.
+        """
+        t0 = time.perf_counter()
+        try:
+            return await self._send(payload)
+        finally:
+            metrics.timing("graph.send_ms", (time.perf_counter() - t0) * 1000.0)
+
+    async def _send(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        last: Optional[GraphError] = None
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            delay = _backoff_seconds(attempt)
+            try:
+                r = await self._http().post(self.path, json=payload)
+            except _NOT_SENT as e:
+                last = GraphError(f"Graph connect failed: {e!r}")
+            except httpx.TransportError as e:
+                # May have been delivered; a retry could send the reply twice
+                metrics.incr("graph.error.transport")
+                raise GraphError(f"Graph send outcome unknown: {e!r}") from e
+            else:
+                if r.status_code == 200:
+                    metrics.incr("graph.sent")
+                    try:
+                        return r.json()
+                    except ValueError:
+                        return {}
+                code, message = _error_code(r)
+                last = GraphError(f"Graph HTTP {r.status_code} code={code}: {message}", r.status_code, code)
+                retryable = r.status_code == 429 or r.status_code >= 500 or code in RETRYABLE_CODES
+                if not retryable:
+                    break
+                if code == PAIR_RATE_CODE:
+                    delay = max(delay, PAIR_RATE_BACKOFF)
+                hint = parse_retry_after(r.headers.get("Retry-After"))
+                if hint is not None:
+                    if hint > MAX_RETRY_AFTER:
+                        break
+                    delay = hint
+            if attempt < MAX_ATTEMPTS:
+                metrics.incr("graph.retry")
+                await asyncio.sleep(delay)
+
+        assert last is not None
+        metrics.incr(f"graph.error.{last.code if last.code is not None else last.status}")
+        raise last
+
+    async def asend_text(self, to: str, body: str) -> Dict[str, Any]:
+        return await self.asend(text_payload(to, body))
+
+    async def asend_many(self, messages: Iterable[Tuple[str, str]]) -> List[Any]:
+        """
+        Send several (to, body) texts concurrently (at most `concurrency` in flight).
+
+        Returns one entry per message, in order: Meta's answer or the exception.
+        """
+        sem = asyncio.Semaphore(max(1, self.concurrency))
+
+        async def one(to: str, body: str) -> Dict[str, Any]:
+            async with sem:
+                return await self.asend_text(to, body)
+
+        return await asyncio.gather(*(one(to, body) for to, body in messages), return_exceptions=True)
+
+
+# ---------------------------------------------------------------------------
+# Process-wide sender (sync API)
+# ---------------------------------------------------------------------------
+
+_SENDER: Optional[AsyncGraphSender] = None
+_LOCK = threading.Lock()
+
+
+def sender() -> AsyncGraphSender:
+    """
+    Process-wide sender (bound to the shared background loop).
+    """
+    global _SENDER
+    with _LOCK:
+        if _SENDER is None:
+            _SENDER = AsyncGraphSender()
+        return _SENDER
+
+
+def send_text(to: str, body: str) -> Dict[str, Any]:
+    """
+    Send one text reply; raises GraphError if it cannot be delivered.
+    """
+    return run(sender().asend_text(to, body))
+
+
+def send_many(messages: Iterable[Tuple[str, str]]) -> List[Any]:
+    """
+    Send several (to, body) texts concurrently; see AsyncGraphSender.asend_many.
+    """
+    return run(sender().asend_many(list(messages)))
@@ -0,0 +1,273 @@
+"""
+Inbound message de-duplication, keyed on the WhatsApp message id.
+
+Meta redelivers a webhook when we acknowledge it slowly, and the same
+message can also come back through the queue. Each message id goes
+through two states:
+  1. `claim(msg)` before processing: records the id as "processing" with
+     a short lease (IDEMPOTENCY_LEASE_SECONDS); only the first claim wins,
+     so a redelivery costs one conditional write instead of an LLM parse,
+     a bank call and a second reply
+  2. `complete(msg)` after the turn succeeded: "done", kept for
+     IDEMPOTENCY_TTL_SECONDS
+If the turn fails (Bedrock throttle, Finlake outage, ...) `release(msg)`
+deletes the claim, so the redelivery is processed. If the container dies
+mid-turn (Lambda timeout), the lease runs out and a later redelivery takes
+the claim over. A transfer the failed turn may already have posted is not
+repeated: the ledger keys it on the same message id (ledger.py).
+
+Stores (IDEMPOTENCY_BACKEND):
+  - "dynamodb" : "msg:<id>" items in IDEMPOTENCY_TABLE (its own table by
+                 default; partition key IDEMPOTENCY_KEY_ATTR, `ttl` expiry)
+  - "memory"   : in-process only, for tests and local harnesses
+  - "off"      : every message is processed
+
+The DynamoDB store keeps an LRU of ids it has claimed or seen done, so
+repeats within a warm container do not even pay for the write. Messages
+without an id are always processed.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import metrics
+from cache_utils import TTLCache
+from config import (
+    IDEMPOTENCY_BACKEND,
+    IDEMPOTENCY_CACHE_SIZE,
+    IDEMPOTENCY_KEY_ATTR,
+    IDEMPOTENCY_LEASE_SECONDS,
+    IDEMPOTENCY_TABLE,
+    IDEMPOTENCY_TTL_SECONDS,
+    get_dynamodb,
+)
+
+KEY_PREFIX = "msg:"
+
+PROCESSING = "processing"
+DONE = "done"
+
+
+class IdempotencyStore:
+    """
+    Interface implemented by every store.
+    """
+
+    def claim_id(self, msg_id: str) -> bool:
+        """
+        Record `msg_id` as processing; True if nobody holds or finished it.
+        """
+        raise NotImplementedError
+
+    def complete_id(self, msg_id: str) -> None:
+        """
+        Mark `msg_id` as done (kept for the full TTL).
+        """
+        raise NotImplementedError
+
+    def release_id(self, msg_id: str) -> None:
+        """
+        Drop the claim on `msg_id` so a redelivery is processed.
+        """
+        raise NotImplementedError
+
+
+class NullStore(IdempotencyStore):
+    def claim_id(self, msg_id: str) -> bool:
+        return True
+
+    def complete_id(self, msg_id: str) -> None:
+        pass
+
+    def release_id(self, msg_id: str) -> None:
+        pass
+
+
+class MemoryStore(IdempotencyStore):
+    """
+    Process-local store (claims expire after `lease`, done ids after `ttl` seconds).
+    """
+
+    def __init__(
+        self,
+        ttl: float = IDEMPOTENCY_TTL_SECONDS,
+        lease: float = IDEMPOTENCY_LEASE_SECONDS,
+        maxsize: int = 100_000,
+    ) -> None:
+        self.ttl = ttl
+        self.lease = lease
+        self._seen = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def claim_id(self, msg_id: str) -> bool:
+        with self._lock:
+            if self._seen.get(msg_id) is not None:
+                return False
+            self._seen.set(msg_id, PROCESSING, ttl=self.lease)
+            return True
+
+    def complete_id(self, msg_id: str) -> None:
+        self._seen.set(msg_id, DONE, ttl=self.ttl)
+
+    def release_id(self, msg_id: str) -> None:
+        self._seen.delete(msg_id)
+
+
+class DynamoStore(IdempotencyStore):
+    """
+    "msg:<id>" items with `state`, `lease_until` and `ttl`, plus an LRU of
+    ids this container has claimed or seen done.
+
+    A claim succeeds when the item is missing, or is a "processing" claim
+    whose lease has run out (its holder died mid-turn).
+    """
+
+    def __init__(
+        self,
+        table: str = IDEMPOTENCY_TABLE,
+        ttl: int = IDEMPOTENCY_TTL_SECONDS,
+        lease: int = IDEMPOTENCY_LEASE_SECONDS,
+        cache_size: int = IDEMPOTENCY_CACHE_SIZE,
+        key_attr: str = IDEMPOTENCY_KEY_ATTR,
+    ) -> None:
+        self.table = table
+        self.ttl = ttl
+        self.lease = lease
+        self.key_attr = key_attr
+        self._seen = TTLCache(maxsize=cache_size, ttl=ttl)
+
+    def _key(self, msg_id: str) -> Dict[str, Any]:
+        return {self.key_attr: {"S": KEY_PREFIX + msg_id}}
+
+    def claim_id(self, msg_id: str) -> bool:
+        if self._seen.get(msg_id) is not None:
+            return False
+        from botocore.exceptions import ClientError
+
+        now = int(time.time())
+        try:
+            get_dynamodb().put_item(
+                TableName=self.table,
+                Item={
+                    **self._key(msg_id),
+                    "state": {"S": PROCESSING},
+                    "received_at": {"N": str(now)},
+                    "lease_until": {"N": str(now + self.lease)},
+                    "ttl": {"N": str(now + self.ttl)},
+                },
+                ConditionExpression="attribute_not_exists(#k) OR (#s = :p AND #l < :now)",
+                ExpressionAttributeNames={"#k": self.key_attr, "#s": "state", "#l": "lease_until"},
+                ExpressionAttributeValues={":p": {"S": PROCESSING}, ":now": {"N": str(now)}},
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            return False
+        self._seen.set(msg_id, PROCESSING, ttl=self.lease)
+        return True
+
+    def complete_id(self, msg_id: str) -> None:
+        now = int(time.time())
+        get_dynamodb().put_item(
+            TableName=self.table,
+            Item={
+                **self._key(msg_id),
+                "state": {"S": DONE},
+                "done_at": {"N": str(now)},
+                "ttl": {"N": str(now + self.ttl)},
+            },
+        )
+        self._seen.set(msg_id, DONE)
+
+    def release_id(self, msg_id: str) -> None:
+        self._seen.delete(msg_id)
+        get_dynamodb().delete_item(TableName=self.table, Key=self._key(msg_id))
+
+
+# ---------------------------------------------------------------------------
+# Process-wide store
+# ---------------------------------------------------------------------------
+
+_STORE: Optional[IdempotencyStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store() -> IdempotencyStore:
+    """
+    Return the process-wide store selected by IDEMPOTENCY_BACKEND.
+    """
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            backend = (IDEMPOTENCY_BACKEND or "dynamodb").lower()
+            if backend == "off":
+                _STORE = NullStore()
+            elif backend == "memory":
+                _STORE = MemoryStore()
+            else:
+                _STORE = DynamoStore()
+        return _STORE
+
+
+def set_store(store: Optional[IdempotencyStore]) -> None:
+    """
+    Override the process-wide store (local tools / tests).
+    """
+    global _STORE
+    with _STORE_LOCK:
+        _STORE = store
+
+
+def claim(msg: Dict[str, Any]) -> bool:
+    """
+    True if `msg` should be processed (first delivery, or no id to key on).
+
+    Store errors fail open: the message is processed and the error logged,
+    since dropping a real message is worse than a rare double reply.
+    """
+    msg_id = msg.get("id")
+    if not msg_id:
+        return True
+    try:
+        first = get_store().claim_id(str(msg_id))
+    except Exception as e:
+        metrics.incr("idempotency.error")
+        print("ERR idempotency claim:", e)
+        return True
+    if not first:
+        metrics.incr("idempotency.duplicate")
+        print(f"WARN duplicate message {msg_id} from {msg.get('from')}; skipped")
+    return first
+
+
+def complete(msg: Dict[str, Any]) -> None:
+    """
+    Mark a processed message as done. Errors are logged: the claim's lease
+    still covers quick redeliveries.
+    """
+    msg_id = msg.get("id")
+    if not msg_id:
+        return
+    try:
+        get_store().complete_id(str(msg_id))
+    except Exception as e:
+        metrics.incr("idempotency.error")
+        print("ERR idempotency complete:", e)
+
+
+def release(msg: Dict[str, Any]) -> None:
+    """
+    Give up the claim on a message whose turn failed, so its redelivery
+    is processed instead of skipped as a duplicate.
+    """
+    msg_id = msg.get("id")
+    if not msg_id:
+        return
+    metrics.incr("idempotency.released")
+    try:
+        get_store().release_id(str(msg_id))
+    except Exception as e:
+        metrics.incr("idempotency.error")
+        print("ERR idempotency release:", e)
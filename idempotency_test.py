@@ -0,0 +1,111 @@
+"""
+Message de-duplication: claims, leases, completion and release.
+
+Run:  python -m pytest -q idempotency_test.py
+"""
+import time
+
+import pytest
+
+import config
+import idempotency
+from idempotency import DynamoStore, MemoryStore
+from loadtest import Latency, MemoryDynamo
+
+TABLE = "idempotency"
+
+
+@pytest.fixture
+def ddb():
+    mem = MemoryDynamo(Latency(0), key_attrs={TABLE: "pk"})
+    saved = config._LAZY.get("dynamodb")
+    config._LAZY["dynamodb"] = mem
+    yield mem
+    if saved is None:
+        config._LAZY.pop("dynamodb", None)
+    else:
+        config._LAZY["dynamodb"] = saved
+
+
+class Broken(MemoryStore):
+    def claim_id(self, msg_id):
+        raise RuntimeError("table missing")
+
+
+@pytest.fixture
+def use_store():
+    def use(s):
+        idempotency.set_store(s)
+        return s
+
+    yield use
+    idempotency.set_store(None)
+
+
+def _store(**kw):
+    return DynamoStore(table=TABLE, key_attr="pk", **kw)
+
+
+def test_memory_store_claim_complete_release():
+    s = MemoryStore(ttl=60, lease=60)
+    assert s.claim_id("m1") and not s.claim_id("m1")
+    s.release_id("m1")
+    assert s.claim_id("m1")
+    s.complete_id("m1")
+    assert not s.claim_id("m1")
+
+
+def test_memory_store_lease_runs_out():
+    s = MemoryStore(ttl=60, lease=0.01)
+    assert s.claim_id("m1")
+    time.sleep(0.02)
+    assert s.claim_id("m1")
+
+
+def test_only_the_first_container_claims(ddb):
+    assert _store().claim_id("m1")
+    assert not _store().claim_id("m1")
+
+
+def test_expired_lease_is_taken_over(ddb):
+    assert _store(lease=-1).claim_id("m1")  # holder died mid-turn
+    assert _store().claim_id("m1")
+    assert not _store().claim_id("m1")
+
+
+def test_done_is_never_taken_over(ddb):
+    first = _store(lease=-1)
+    assert first.claim_id("m1")
+    first.complete_id("m1")
+    assert not _store().claim_id("m1")
+    assert ddb.items[(TABLE, "msg:m1")]["state"] == {"S": idempotency.DONE}
+
+
+def test_released_claim_is_processed_again(ddb):
+    first = _store()
+    assert first.claim_id("m1")
+    first.release_id("m1")
+    assert _store().claim_id("m1")
+
+
+def test_repeats_in_a_warm_container_skip_the_write(ddb):
+    s = _store()
+    assert s.claim_id("m1")
+    ddb.calls.clear()
+    assert not s.claim_id("m1")
+    assert ddb.calls == {}
+
+
+def test_module_helpers(use_store):
+    use_store(MemoryStore())
+    msg = {"id": "wamid.1", "from": "2348000000001"}
+    assert idempotency.claim(msg) and not idempotency.claim(msg)
+    idempotency.release(msg)
+    assert idempotency.claim(msg)
+    # No id: always processed
+    assert idempotency.claim({"from": "2348000000001"})
+
+
+def test_store_errors_fail_open(use_store):
+    use_store(Broken())
+    assert idempotency.claim({"id": "wamid.1"})
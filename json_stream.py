@@ -0,0 +1,196 @@
+"""
+Incremental parser for the top-level fields of a streamed JSON object.
+
+The NLU model answers with one flat-ish JSON object. While it streams,
+`JsonFieldStream.feed` is given text deltas and returns each top-level
+field as soon as its value is complete:
+  - strings, objects and arrays when their closing quote/brace arrives
+  - numbers and literals (true/false/null) when the following "," or "}"
+    arrives
+
+Anything before the first "{" (e.g. a stray code fence) is ignored. Values
+are decoded with `json.loads`; a value that fails to decode is recorded in
+`errors` and skipped, so the caller can fall back to a full-text parse.
+
+`extract_json` is that fallback: one pass over the whole answer that pulls
+out the first balanced object and repairs the usual model slips.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Parser states at depth 1
+_KEY = "key"              # expecting a key (or "}")
+_KEY_STR = "key_str"      # inside a key string
+_COLON = "colon"          # key read, expecting ":"
+_VALUE_START = "value_start"
+_VALUE = "value"          # inside a value
+_AFTER_VALUE = "after_value"
+
+
+class JsonFieldStream:
+    """
+    Feed text chunks; collect completed top-level (key, value) pairs.
+    """
+
+    def __init__(self) -> None:
+        self.fields: Dict[str, Any] = {}
+        self.errors: List[str] = []
+        self.done = False
+        self._buf = ""
+        self._i = 0
+        self._started = False
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._state = _KEY
+        self._key = ""
+        self._key_start = 0
+        self._val_start = 0
+
+    def has(self, keys: Iterable[str]) -> bool:
+        """
+        True once every key in `keys` has been received.
+        """
+        return all(k in self.fields for k in keys)
+
+    def _emit(self, end: int, out: List[Tuple[str, Any]]) -> None:
+        raw = self._buf[self._val_start:end].strip()
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            self.errors.append(self._key)
+        else:
+            self.fields[self._key] = value
+            out.append((self._key, value))
+        self._state = _AFTER_VALUE
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume more text; return the fields completed by it (in order).
+        """
+        out: List[Tuple[str, Any]] = []
+        if self.done or not chunk:
+            return out
+        self._buf += chunk
+        buf = self._buf
+
+        i = self._i
+        while i < len(buf):
+            ch = buf[i]
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    if self._depth == 1:
+                        if self._state == _KEY_STR:
+                            try:
+                                self._key = json.loads(buf[self._key_start:i + 1])
+                            except ValueError:
+                                self._key = buf[self._key_start + 1:i]
+                            self._state = _COLON
+                        elif self._state == _VALUE:
+                            self._emit(i + 1, out)
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_str = True
+                if self._depth == 1:
+                    if self._state == _KEY:
+                        self._key_start = i
+                        self._state = _KEY_STR
+                    elif self._state == _VALUE_START:
+                        self._val_start = i
+                        self._state = _VALUE
+            elif ch == ":" and self._depth == 1 and self._state == _COLON:
+                self._state = _VALUE_START
+            elif ch in "{[":
+                if self._depth == 1 and self._state == _VALUE_START:
+                    self._val_start = i
+                    self._state = _VALUE
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._state == _VALUE:
+                    self._emit(i + 1, out)
+                elif self._depth == 0:
+                    if self._state == _VALUE:
+                        self._emit(i, out)
+                    self.done = True
+                    i += 1
+                    break
+            elif ch == "," and self._depth == 1:
+                if self._state == _VALUE:
+                    self._emit(i, out)
+                self._state = _KEY
+            elif self._depth == 1 and self._state == _VALUE_START and not ch.isspace():
+                # number / true / false / null
+                self._val_start = i
+                self._state = _VALUE
+            i += 1
+
+        self._i = i
+        return out
+
+
+def extract_json(text: str) -> Any:
+    """
+    Decode the first top-level JSON object in `text`, tolerating what models
+    typically get wrong: surrounding prose or code fences, zero-width chars,
+    raw newlines inside strings and trailing commas. Single pass; raises
+    ValueError if no object can be decoded.
+    """
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("no JSON object in model output")
+
+    out: List[str] = []
+    depth = 0
+    in_str = esc = False
+    comma = False  # a "," held back until we know it is not trailing
+    for ch in text[start:]:
+        if ch in "\u200b\ufeff":
+            continue
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            elif ch == "\n":
+                ch = "\\n"
+            out.append(ch)
+            continue
+        if ch.isspace():
+            continue
+        if ch == ",":
+            comma = True
+            continue
+        if comma:
+            if ch not in "}]":
+                out.append(",")
+            comma = False
+        out.append(ch)
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                break
+    return json.loads("".join(out))
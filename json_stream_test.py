@@ -0,0 +1,103 @@
+"""
+JsonFieldStream (incremental) and extract_json (tolerant) parsing.
+
+Run:  python -m pytest -q json_stream_test.py
+"""
+import json
+
+import pytest
+
+from json_stream import JsonFieldStream, extract_json
+
+PARSE = {
+    "intent": "transfer",
+    "action": "ask",
+    "slots": {"amount": {"value": 5000, "currency": "NGN"}, "note": "rent {may}, \"june\""},
+    "missing_slots": ["destination_bank"],
+    "confident": True,
+    "ask_slot": None,
+    "score": -1.5e2,
+    "reply": "Which bank, please?",
+}
+
+
+def _feed_in(chunks):
+    s = JsonFieldStream()
+    seen = []
+    for c in chunks:
+        seen.extend(s.feed(c))
+    return s, seen
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_fields_in_any_chunking(size):
+    text = json.dumps(PARSE)
+    s, seen = _feed_in(text[i:i + size] for i in range(0, len(text), size))
+    assert s.fields == PARSE
+    assert [k for k, _ in seen] == list(PARSE)
+    assert s.done and not s.errors
+
+
+def test_field_emitted_as_soon_as_complete():
+    s = JsonFieldStream()
+    assert s.feed('{"intent": "transfer", "slots": {"bank": "GT') == [("intent", "transfer")]
+    assert s.feed('B"}') == [("slots", {"bank": "GTB"})]
+    # A number is only complete at the next separator
+    assert s.feed(', "n": 12') == []
+    assert s.feed("3") == []
+    assert s.feed(', "reply"') == [("n", 123)]
+    assert not s.has(["reply"])
+    assert s.feed(': "ok"') == [("reply", "ok")]
+    assert s.has(["intent", "slots", "n", "reply"])
+
+
+def test_prefix_before_object_is_ignored():
+    s, _ = _feed_in(['```json\n', '{"a": 1, "b": [1, 2]}', '\n```'])
+    assert s.fields == {"a": 1, "b": [1, 2]}
+
+
+def test_input_after_close_is_ignored():
+    s = JsonFieldStream()
+    s.feed('{"a": true}')
+    assert s.done
+    assert s.feed('{"b": 2}') == []
+    assert s.fields == {"a": True}
+
+
+def test_bad_value_recorded_and_skipped():
+    s, seen = _feed_in(['{"a": tru, "b": "x"}'])
+    assert s.errors == ["a"]
+    assert seen == [("b", "x")]
+
+
+def test_escaped_key():
+    s, _ = _feed_in(['{"a\\"b": 1}'])
+    assert s.fields == {'a"b': 1}
+
+
+def test_extract_json_plain():
+    assert extract_json(json.dumps(PARSE)) == PARSE
+
+
+def test_extract_json_tolerates_model_slips():
+    text = (
+        "Sure! Here is the parse:\n```json\n"
+        '{\u200b"intent": "transfer",\n'
+        '  "reply": "line one\nline two",\n'
+        '  "missing_slots": ["pin",],\n'
+        "}\n```\nAnything else?"
+    )
+    assert extract_json(text) == {
+        "intent": "transfer",
+        "reply": "line one\nline two",
+        "missing_slots": ["pin"],
+    }
+
+
+def test_extract_json_first_object_only():
+    assert extract_json('{"a": {"b": 1}} {"c": 2}') == {"a": {"b": 1}}
+
+
+def test_extract_json_without_object():
+    with pytest.raises(ValueError):
+        extract_json("no json here")
@@ -2,16 +2,33 @@
 AWS Lambda entrypoint for WhatsApp webhook.
 
 - GET  : Facebook/WhatsApp webhook verification
-- POST : Inbound message processing (text only)
+- POST : Inbound message processing (text only); senders in one delivery
+         are processed concurrently, each sender's messages in order
+
+With WEBHOOK_MODE=queue the POST handler only validates and enqueues the
+messages, then returns 200; `worker.worker_handler` does the processing.
+
+The processing path (worker, queue, boto3, Bedrock/DynamoDB clients) is
+imported on the first POST, so GET verification stays near-instant. With
+COLDSTART_PROFILE=1 the import cost of every module is printed once.
 """
 from __future__ import annotations
 
+import os
+
+if os.getenv("COLDSTART_PROFILE", "0").lower() in ("1", "true", "yes"):
+    import coldstart
+    coldstart.install()
+
 import json
+import time
 from typing import Any, Dict
 
-from config import VERIFY_TOKEN
+import metrics
+from config import COLDSTART_PROFILE, VERIFY_TOKEN, WEBHOOK_MODE
 from whatsapp_helpers import wa_ok, extract_messages
-from main_logic import handle_text
+
+_profiled = False
 
 
 def _handle_get(event: Dict[str, Any]):
@@ -24,7 +41,7 @@ def _handle_get(event: Dict[str, Any]):
     return wa_ok("forbidden", 403)
 
 
-def _handle_post(event: Dict[str, Any]):
+def _handle_post(event: Dict[str, Any], context: Any = None):
     """
     Handle inbound messages from WhatsApp. We only process text messages.
     """
@@ -36,15 +53,44 @@ def _handle_post(event: Dict[str, Any]):
     if body.get("object") != "whatsapp_business_account":
         return wa_ok("ignored", 200)
 
-    for msg in extract_messages(body):
-        try:
-            handle_text(msg["from"], msg["text"])
-        except Exception as e:
-            # Avoid raising to Meta; log and continue
-            print("ERR handle_text:", e)
+    msgs = extract_messages(body)
+    now = time.time()
+    for m in msgs:
+        m["received_at"] = now
+
+    if WEBHOOK_MODE == "queue":
+        from msg_queue import get_queue
+
+        if msgs:
+            try:
+                get_queue().put_many(msgs)
+            except Exception as e:
+                # Let Meta redeliver rather than lose the messages
+                print("ERR enqueue:", e)
+                return wa_ok("retry", 500)
+            metrics.incr("webhook.enqueued", len(msgs))
+        return wa_ok("ok", 200)
+
+    from worker import process_batch
+
+    # Errors are logged per message inside the dispatcher. If any turn failed
+    # (its claim was released) or was skipped at the deadline, answer non-2xx
+    # so Meta redelivers; the turns that did complete are dropped as duplicates.
+    res = process_batch(msgs, context)
+    if res["failed"] or res["skipped"]:
+        return wa_ok("retry", 500)
     return wa_ok("ok", 200)
 
 
+def _report_coldstart() -> None:
+    # Once per container, after the first POST has pulled in the processing path
+    global _profiled
+    if COLDSTART_PROFILE and not _profiled:
+        _profiled = True
+        import coldstart
+        coldstart.report()
+
+
 def lambda_handler(event, context):
     """
     Lambda runtime entrypoint.
@@ -58,6 +104,12 @@ def lambda_handler(event, context):
         return _handle_get(event)
 
     if method == "POST":
-        return _handle_post(event)
+        t0 = time.perf_counter()
+        try:
+            return _handle_post(event, context)
+        finally:
+            metrics.timing("webhook.ack_ms", (time.perf_counter() - t0) * 1000.0)
+            _report_coldstart()
+            metrics.flush()
 
     return wa_ok("method not allowed", 405)
@@ -0,0 +1,488 @@
+"""
+Transfer ledger: at-most-once execution of Finlake fund transfers.
+
+Every fulfillment gets a deterministic client reference (`client_reference`,
+derived from the user, the triggering message and the transfer details),
+so a redelivered or retried fulfillment maps to the same ledger record.
+`execute` then:
+  1. records the transfer as "pending" (conditional create)
+  2. posts it once, with the reference appended to the narration
+  3. marks it "committed" (with the bank's transaction id) or "failed"
+
+If the record already exists, nothing is posted again: a committed transfer
+returns its stored result, and a pending one is reconciled once it is older
+than SETTLE_AFTER (a younger one may still be in flight elsewhere and is
+only reported as pending). When the post ends ambiguously
+(`FinlakeAmbiguous`: timeout or 5xx after the request may have arrived),
+the debit account's recent history is searched for the reference instead
+of re-posting; if it is not there yet the record is left "unknown" and the
+user is told the transfer is being confirmed.
+
+Unknown transfers are followed up: `follow_up` looks them up again a few
+seconds later in the background (the worker waits for these before the
+invocation ends, `wait_follow_ups`) and reports the outcome, and
+`recheck` lets the conversation layer ask again on the user's next
+message. The PIN such a lookup needs is never stored: it is kept in this
+container's memory for RECHECK_PIN_TTL, so a later `recheck` in the same
+warm container needs no PIN; otherwise the caller must pass one (e.g. the
+next PIN the user types). `mark_notified` records which outcome the user
+was told.
+
+Stores (LEDGER_BACKEND):
+  - "dynamodb" : "txn:<reference>" items in LEDGER_TABLE (defaults to the
+                 sessions table, reusing its `wa_id` key and `ttl` expiry)
+  - "memory"   : in-process only, for tests and local harnesses
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Set
+
+import finlake
+import metrics
+from cache_utils import TTLCache
+from config import FINLAKE_TRANSFER_TIMEOUT, LEDGER_BACKEND, LEDGER_TABLE, LEDGER_TTL_SECONDS, get_dynamodb
+
+KEY_PREFIX = "txn:"
+
+PENDING = "pending"
+COMMITTED = "committed"
+FAILED = "failed"
+UNKNOWN = "unknown"
+
+# History lookups after an ambiguous post (the debit can take a moment to show)
+RECONCILE_ATTEMPTS = 3
+RECONCILE_DELAY = 1.0  # seconds between lookups
+RECONCILE_PAGE_SIZE = 20
+
+# A pending record younger than this may belong to a post still in flight
+# (one transfer request plus its connect/429 retries); do not settle it
+SETTLE_AFTER = 3 * FINLAKE_TRANSFER_TIMEOUT
+
+# Background lookups for unknown transfers, in seconds after the reply
+FOLLOW_UP_DELAYS = (5.0, 15.0)
+
+# How long the PIN of an unsettled transfer is kept in memory for `recheck`
+RECHECK_PIN_TTL = 3600.0
+
+# Transaction id fields seen on history entries / transfer responses
+_TXID_FIELDS = ("transactionId", "paymentReference", "reference", "cbaReference", "transactionReference")
+
+
+# ---------------------------------------------------------------------------
+# References
+# ---------------------------------------------------------------------------
+
+def client_reference(wa_id: str, key: str, amount: int, src_acct: str, dst_acct: str) -> str:
+    """
+    Deterministic reference for one fulfillment.
+
+    `key` identifies the triggering turn (the WhatsApp message id, or the
+    session version when there is none); the same inputs always give the
+    same 16-character reference.
+    """
+    raw = f"{wa_id}|{key}|{amount}|{src_acct}|{dst_acct}"
+    return "WA" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:14].upper()
+
+
+def tag_narration(narration: str, ref: str) -> str:
+    """
+    Narration carrying the reference, so the transfer can be found in history.
+    """
+    return f"{narration} {ref}".strip() if narration else ref
+
+
+def txid_of(resp: Dict[str, Any]) -> Optional[str]:
+    for k in _TXID_FIELDS:
+        if resp.get(k):
+            return str(resp[k])
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Stores
+# ---------------------------------------------------------------------------
+
+class LedgerStore:
+    """
+    Interface implemented by every store. Records are plain dicts.
+    """
+
+    def create(self, ref: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Store `record` unless `ref` exists; return the existing record if it does.
+        """
+        raise NotImplementedError
+
+    def get(self, ref: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, ref: str, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, ref: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryLedger(LedgerStore):
+    def __init__(self) -> None:
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, ref: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if ref in self._data:
+                return dict(self._data[ref])
+            self._data[ref] = dict(record)
+            return None
+
+    def get(self, ref: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rec = self._data.get(ref)
+            return dict(rec) if rec is not None else None
+
+    def update(self, ref: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data[ref] = dict(record)
+
+    def delete(self, ref: str) -> None:
+        with self._lock:
+            self._data.pop(ref, None)
+
+
+class DynamoLedger(LedgerStore):
+    """
+    One item per reference: key "txn:<ref>", `state`, the record as JSON, `ttl`.
+    """
+
+    def __init__(self, table: str = LEDGER_TABLE, ttl: int = LEDGER_TTL_SECONDS) -> None:
+        self.table = table
+        self.ttl = ttl
+
+    def _item(self, ref: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "wa_id": {"S": KEY_PREFIX + ref},
+            "state": {"S": record["state"]},
+            "rec": {"S": json.dumps(record, separators=(",", ":"), ensure_ascii=False)},
+            "ttl": {"N": str(int(record["created_at"]) + self.ttl)},
+        }
+
+    def create(self, ref: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        from botocore.exceptions import ClientError
+
+        try:
+            get_dynamodb().put_item(
+                TableName=self.table,
+                Item=self._item(ref, record),
+                ConditionExpression="attribute_not_exists(wa_id)",
+            )
+            return None
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+        return self.get(ref) or dict(record, state=UNKNOWN)
+
+    def get(self, ref: str) -> Optional[Dict[str, Any]]:
+        r = get_dynamodb().get_item(
+            TableName=self.table, Key={"wa_id": {"S": KEY_PREFIX + ref}}, ConsistentRead=True
+        )
+        item = r.get("Item") or {}
+        return json.loads(item["rec"]["S"]) if "rec" in item else None
+
+    def update(self, ref: str, record: Dict[str, Any]) -> None:
+        get_dynamodb().put_item(TableName=self.table, Item=self._item(ref, record))
+
+    def delete(self, ref: str) -> None:
+        get_dynamodb().delete_item(TableName=self.table, Key={"wa_id": {"S": KEY_PREFIX + ref}})
+
+
+_STORE: Optional[LedgerStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_ledger() -> LedgerStore:
+    """
+    Return the process-wide store selected by LEDGER_BACKEND.
+    """
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = MemoryLedger() if (LEDGER_BACKEND or "").lower() == "memory" else DynamoLedger()
+        return _STORE
+
+
+def set_ledger(store: Optional[LedgerStore]) -> None:
+    """
+    Override the process-wide store (local tools / tests).
+    """
+    global _STORE
+    with _STORE_LOCK:
+        _STORE = store
+
+
+# ---------------------------------------------------------------------------
+# Reconciliation
+# ---------------------------------------------------------------------------
+
+def _find(node: Any, ref: str) -> Optional[Dict[str, Any]]:
+    """
+    First dict in a history response with a string field containing `ref`.
+    """
+    if isinstance(node, dict):
+        if any(isinstance(v, str) and ref in v for v in node.values()):
+            return node
+        node = list(node.values())
+    if isinstance(node, list):
+        for x in node:
+            hit = _find(x, ref)
+            if hit is not None:
+                return hit
+    return None
+
+
+def reconcile(record: Dict[str, Any], pin: str, attempts: int = RECONCILE_ATTEMPTS) -> Optional[Dict[str, Any]]:
+    """
+    Look for the transfer in the debit account's history.
+
+    Returns the matching history entry, or None if it is not (yet) there
+    or the lookup failed.
+    """
+    ref = record["ref"]
+    start = time.strftime("%Y-%m-%d", time.gmtime(record["created_at"] - 24 * 3600))
+    end = time.strftime("%Y-%m-%d", time.gmtime(time.time() + 24 * 3600))
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(RECONCILE_DELAY)
+        metrics.incr("ledger.reconcile_lookup")
+        try:
+            history = finlake.transaction_history_by_account(
+                record["src"], start, end, 1, RECONCILE_PAGE_SIZE, pin
+            )
+        except Exception as e:
+            print("ERR ledger reconcile:", e)
+            continue
+        hit = _find(history, ref)
+        if hit is not None:
+            return hit
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Execution
+# ---------------------------------------------------------------------------
+
+def _settleable(record: Dict[str, Any]) -> bool:
+    # Pending records are only ours to settle once their post must be over
+    return time.time() - record.get("created_at", 0) >= SETTLE_AFTER
+
+
+# ref -> PIN of transfers that may still need a history lookup (memory only)
+_RECHECK_PINS = TTLCache(maxsize=1024, ttl=RECHECK_PIN_TTL)
+
+
+def _save(store: LedgerStore, record: Dict[str, Any], state: str, **fields: Any) -> None:
+    record.update(fields, state=state, updated_at=int(time.time()))
+    if state in (COMMITTED, FAILED):
+        _RECHECK_PINS.delete(record["ref"])
+    try:
+        store.update(record["ref"], record)
+    except Exception as e:
+        metrics.incr("ledger.store_error")
+        print(f"ERR ledger update {record['ref']} -> {state}:", e)
+
+
+def _result(record: Dict[str, Any]) -> Dict[str, Any]:
+    if record["state"] == COMMITTED:
+        return {"ok": True, "transaction_id": record.get("txid") or record["ref"], "reference": record["ref"]}
+    if record["state"] == FAILED:
+        return {"ok": False, "error": record.get("error") or "transfer failed", "reference": record["ref"]}
+    return {"ok": False, "pending": True, "error": "transfer status unknown", "reference": record["ref"]}
+
+
+def _settle_unclear(
+    store: LedgerStore, record: Dict[str, Any], pin: str, attempts: int = RECONCILE_ATTEMPTS
+) -> Dict[str, Any]:
+    hit = reconcile(record, pin, attempts)
+    if hit is not None:
+        metrics.incr("ledger.reconciled")
+        _save(store, record, COMMITTED, txid=txid_of(hit) or record["ref"])
+    else:
+        metrics.incr("ledger.unknown")
+        print(f"WARN transfer {record['ref']} outcome unknown after reconcile")
+        _save(store, record, UNKNOWN)
+        if pin:
+            _RECHECK_PINS.set(record["ref"], pin)
+    return _result(record)
+
+
+def execute(
+    ref: str,
+    details: Dict[str, Any],
+    post: Callable[[str], Dict[str, Any]],
+    pin: str,
+) -> Dict[str, Any]:
+    """
+    Run one transfer at most once.
+
+    Parameters
+    ----------
+    ref : str
+        Client reference from `client_reference`.
+    details : dict
+        Stored with the record; must include "src" (debit account number).
+    post : callable
+        `post(ref)` performs the Finlake call and returns its response.
+    pin : str
+        Transaction PIN, used only for reconciliation lookups (never stored).
+
+    Returns the transfer_adapter result shape; `pending` is set when the
+    outcome could not be confirmed, and a decline (business error, e.g.
+    insufficient funds) comes back as {"ok": False, "error": ...} after the
+    record is marked failed. `FinlakeUnavailable` (request never sent)
+    propagates after the record is dropped.
+    """
+    store = get_ledger()
+    now = int(time.time())
+    record: Dict[str, Any] = dict(details, ref=ref, state=PENDING, created_at=now, updated_at=now)
+    try:
+        existing = store.create(ref, record)
+    except Exception as e:
+        # Without the store we lose replay protection, but a single post is still safe
+        metrics.incr("ledger.store_error")
+        print(f"ERR ledger create {ref}:", e)
+        existing = None
+
+    if existing is not None:
+        metrics.incr("ledger.replayed")
+        print(f"WARN transfer {ref} already {existing.get('state')}; not posting again")
+        if existing.get("state") == UNKNOWN or (existing.get("state") == PENDING and _settleable(existing)):
+            return _settle_unclear(store, existing, pin)
+        if existing.get("state") == PENDING and pin:
+            _RECHECK_PINS.set(ref, pin)
+        return _result(existing)
+
+    try:
+        resp = post(ref)
+    except finlake.FinlakeAmbiguous as e:
+        print(f"ERR transfer {ref} ambiguous:", e)
+        return _settle_unclear(store, record, pin)
+    except finlake.FinlakeUnavailable:
+        # Never reached Finlake: drop the record so a retry may post
+        try:
+            store.delete(ref)
+        except Exception as e:
+            print(f"ERR ledger delete {ref}:", e)
+        raise
+    except Exception as e:
+        metrics.incr("ledger.failed")
+        _save(store, record, FAILED, error=str(e)[:300])
+        return _result(record)
+
+    metrics.incr("ledger.committed")
+    _save(store, record, COMMITTED, txid=txid_of(resp) or ref)
+    return _result(record)
+
+
+# ---------------------------------------------------------------------------
+# Follow-ups for unknown transfers
+# ---------------------------------------------------------------------------
+
+def recheck(ref: str, pin: str = "") -> Optional[Dict[str, Any]]:
+    """
+    Current result of a transfer (the `execute` shape plus "notified").
+
+    An unsettled record is looked up once more in history when a PIN is
+    known: `pin`, or the one `execute` kept in memory (pending records only
+    after SETTLE_AFTER). None if the ledger has no such record (never
+    created, or expired).
+    """
+    pin = pin or _RECHECK_PINS.get(ref, "")
+    store = get_ledger()
+    record = store.get(ref)
+    if record is None:
+        return None
+    state = record.get("state")
+    if pin and (state == UNKNOWN or (state == PENDING and _settleable(record))):
+        res = _settle_unclear(store, record, pin, attempts=1)
+    else:
+        res = _result(record)
+    res["notified"] = record.get("notified")
+    return res
+
+
+def mark_notified(ref: str, outcome: str) -> None:
+    """
+    Record that the user was told the transfer's final `outcome`.
+    """
+    store = get_ledger()
+    record = store.get(ref)
+    if record is not None:
+        _save(store, record, record["state"], notified=outcome)
+
+
+_FOLLOW_UPS: Set["Future[None]"] = set()
+_FOLLOW_UP_LOCK = threading.Lock()
+_FOLLOW_UP_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ledger-follow-up")
+
+
+def _follow_up(ref: str, pin: str, notify: Callable[[Dict[str, Any]], None]) -> None:
+    res: Optional[Dict[str, Any]] = None
+    for delay in FOLLOW_UP_DELAYS:
+        time.sleep(delay)
+        try:
+            res = recheck(ref, pin)
+        except Exception as e:
+            print(f"ERR ledger follow-up {ref}:", e)
+            continue
+        if res is None or not res.get("pending"):
+            break
+    if res is None or res.get("notified"):
+        return
+    if res.get("pending"):
+        # Left for `recheck` on the user's next message
+        metrics.incr("ledger.follow_up.unsettled")
+        return
+    outcome = COMMITTED if res.get("ok") else FAILED
+    metrics.incr(f"ledger.follow_up.{outcome}")
+    try:
+        notify(res)
+    except Exception as e:
+        print(f"ERR ledger follow-up notify {ref}:", e)
+        return
+    mark_notified(ref, outcome)
+
+
+def follow_up(ref: str, pin: str, notify: Callable[[Dict[str, Any]], None]) -> None:
+    """
+    Look an unknown transfer up again in the background (FOLLOW_UP_DELAYS)
+    and call `notify(result)` once it has settled. The PIN is only held in
+    memory.
+    """
+    fut = _FOLLOW_UP_POOL.submit(_follow_up, ref, pin, notify)
+    with _FOLLOW_UP_LOCK:
+        _FOLLOW_UPS.add(fut)
+    fut.add_done_callback(_follow_up_done)
+
+
+def _follow_up_done(fut: "Future[None]") -> None:
+    with _FOLLOW_UP_LOCK:
+        _FOLLOW_UPS.discard(fut)
+
+
+def wait_follow_ups(timeout: float) -> int:
+    """
+    Wait up to `timeout` seconds for running follow-ups; returns how many
+    are still running (they resume if the container is reused).
+    """
+    with _FOLLOW_UP_LOCK:
+        running = list(_FOLLOW_UPS)
+    if not running:
+        return 0
+    _, not_done = wait(running, timeout=max(0.0, timeout))
+    if not_done:
+        print(f"WARN ledger: {len(not_done)} transfer follow-up(s) still running at the deadline")
+    return len(not_done)
@@ -0,0 +1,184 @@
+"""
+Transfer ledger: at-most-once posting, reconciliation and follow-ups.
+
+Run:  python -m pytest -q ledger_test.py
+"""
+import time
+
+import pytest
+
+import finlake
+import ledger
+
+DETAILS = {"src": "0001112223", "dst": "0009998887", "amount": 5000}
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    mem = ledger.MemoryLedger()
+    ledger.set_ledger(mem)
+    ledger._RECHECK_PINS.clear()
+    monkeypatch.setattr(ledger, "RECONCILE_DELAY", 0)
+    monkeypatch.setattr(ledger, "FOLLOW_UP_DELAYS", (0, 0))
+    yield mem
+    ledger.set_ledger(None)
+
+
+@pytest.fixture
+def history(monkeypatch):
+    """
+    Fake transaction history; append refs to make a transfer "show up".
+    """
+    seen = []
+    calls = []
+
+    def fake(acct, start, end, page, page_size, pin):
+        calls.append(pin)
+        return {"data": [{"narration": f"chatbot {r}", "transactionId": f"T-{r}"} for r in seen]}
+
+    monkeypatch.setattr(finlake, "transaction_history_by_account", fake)
+    return seen, calls
+
+
+class Poster:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self, ref):
+        self.calls += 1
+        out = self.outcomes.pop(0)
+        if isinstance(out, Exception):
+            raise out
+        return out
+
+
+def test_commit_and_replay_does_not_post_again(store):
+    post = Poster({"transactionId": "T1"})
+    assert ledger.execute("r1", DETAILS, post, "1234") == {"ok": True, "transaction_id": "T1", "reference": "r1"}
+    assert store.get("r1")["state"] == ledger.COMMITTED
+
+    again = ledger.execute("r1", DETAILS, post, "1234")
+    assert again["ok"] and again["transaction_id"] == "T1"
+    assert post.calls == 1
+
+
+def test_unavailable_drops_record_so_retry_may_post(store):
+    post = Poster(finlake.FinlakeUnavailable("connect failed"), {"transactionId": "T2"})
+    with pytest.raises(finlake.FinlakeUnavailable):
+        ledger.execute("r2", DETAILS, post, "1234")
+    assert store.get("r2") is None
+
+    assert ledger.execute("r2", DETAILS, post, "1234")["ok"]
+    assert post.calls == 2
+
+
+def test_declined_post_returns_failure(store):
+    post = Poster(Exception("Finlake error responseCode=51 message=Insufficient funds"))
+    res = ledger.execute("r3", DETAILS, post, "1234")
+    assert res == {
+        "ok": False,
+        "error": "Finlake error responseCode=51 message=Insufficient funds",
+        "reference": "r3",
+    }
+    assert store.get("r3")["state"] == ledger.FAILED
+
+    res = ledger.execute("r3", DETAILS, post, "1234")
+    assert res["ok"] is False and "insufficient funds" in res["error"].lower()
+    assert post.calls == 1
+
+
+def test_ambiguous_found_in_history_commits(store, history):
+    seen, _ = history
+    seen.append("r4")
+    post = Poster(finlake.FinlakeAmbiguous("read timeout"))
+    res = ledger.execute("r4", DETAILS, post, "1234")
+    assert res["ok"] and res["transaction_id"] == "T-r4"
+    assert store.get("r4")["state"] == ledger.COMMITTED
+
+
+def test_ambiguous_missing_from_history_is_unknown(store, history):
+    _, calls = history
+    post = Poster(finlake.FinlakeAmbiguous("502"))
+    res = ledger.execute("r5", DETAILS, post, "1234")
+    assert res == {"ok": False, "pending": True, "error": "transfer status unknown", "reference": "r5"}
+    assert store.get("r5")["state"] == ledger.UNKNOWN
+    assert len(calls) == ledger.RECONCILE_ATTEMPTS
+
+    # A replay reconciles again instead of posting
+    seen, _ = history
+    seen.append("r5")
+    assert ledger.execute("r5", DETAILS, post, "1234")["ok"]
+    assert post.calls == 1
+
+
+def test_fresh_pending_record_is_left_alone(store, history):
+    _, calls = history
+    store.create("r6", dict(DETAILS, ref="r6", state=ledger.PENDING, created_at=int(time.time())))
+    post = Poster({"transactionId": "never"})
+
+    res = ledger.execute("r6", DETAILS, post, "1234")
+    assert res["pending"] and post.calls == 0
+    assert calls == []
+    assert store.get("r6")["state"] == ledger.PENDING
+
+
+def test_stale_pending_record_is_settled(store, history):
+    store.create("r7", dict(DETAILS, ref="r7", state=ledger.PENDING, created_at=int(time.time() - ledger.SETTLE_AFTER - 1)))
+    res = ledger.execute("r7", DETAILS, Poster(), "1234")
+    assert res["pending"]
+    assert store.get("r7")["state"] == ledger.UNKNOWN
+
+
+def test_recheck(store, history):
+    seen, calls = history
+    assert ledger.recheck("missing") is None
+
+    ledger.execute("r8", DETAILS, Poster(finlake.FinlakeAmbiguous("timeout")), "1234")
+    calls.clear()
+    # Another container (no PIN kept in memory): only the stored state is read
+    ledger._RECHECK_PINS.clear()
+    assert ledger.recheck("r8")["pending"] and calls == []
+
+    seen.append("r8")
+    res = ledger.recheck("r8", "1234")
+    assert res["ok"] and res["notified"] is None
+    assert len(calls) == 1
+
+    ledger.mark_notified("r8", ledger.COMMITTED)
+    assert ledger.recheck("r8")["notified"] == ledger.COMMITTED
+
+
+def test_recheck_uses_the_pin_kept_in_memory(store, history):
+    seen, calls = history
+    ledger.execute("r11", DETAILS, Poster(finlake.FinlakeAmbiguous("timeout")), "1234")
+    assert "1234" not in str(store.get("r11"))
+    calls.clear()
+
+    seen.append("r11")
+    assert ledger.recheck("r11")["ok"]
+    assert calls == ["1234"]
+    # Settled: the PIN is dropped
+    assert ledger._RECHECK_PINS.get("r11") is None
+
+
+def test_follow_up_notifies_once_settled(store, history):
+    seen, _ = history
+    ledger.execute("r9", DETAILS, Poster(finlake.FinlakeAmbiguous("timeout")), "1234")
+    seen.append("r9")
+
+    told = []
+    ledger.follow_up("r9", "1234", told.append)
+    assert ledger.wait_follow_ups(5) == 0
+    assert [r["transaction_id"] for r in told] == ["T-r9"]
+    assert store.get("r9")["notified"] == ledger.COMMITTED
+
+
+def test_follow_up_stays_quiet_while_unknown(store, history):
+    ledger.execute("r10", DETAILS, Poster(finlake.FinlakeAmbiguous("timeout")), "1234")
+
+    told = []
+    ledger.follow_up("r10", "1234", told.append)
+    assert ledger.wait_follow_ups(5) == 0
+    assert told == []
+    assert store.get("r10")["state"] == ledger.UNKNOWN
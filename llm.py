@@ -2,26 +2,129 @@
 Bedrock LLM utilities:
   - `llm_parse`: structured parse for intent/slots/action/lang
   - `llm_one_liner`: short professional line in requested language
+    (cached per (lang, line) for the warm-container lifetime)
 
-These helpers are intentionally thin; they keep the calling code simple.
+`llm_parse` details:
+  - Structured output: the model is made to call a tool whose input schema
+    is the NLU schema (nlu_schema.py), so the parse arrives as tool
+    arguments. Plain-text JSON is still accepted via a tolerant extractor,
+    and every parse is validated against the schema.
+  - Streamed by default: fields are parsed as they arrive and the call
+    returns once everything the turn needs is in, so trailing fields like
+    `canonical_en` are not waited for.
+  - The system prompt is assembled per turn from the tagged sections of
+    `system_prompt.txt` (prompt_builder.py). With LLM_PROMPT_CACHE a
+    cachePoint follows its stable leading part; since Bedrock puts the tool
+    schema first, the cached prefix is tool schema + static sections. The
+    checkpoint is only sent to models whose minimum cacheable length
+    (CACHE_MIN_TOKENS) that prefix reaches: today's ~1.2k tokens are cached
+    on Sonnet/Opus but not on Claude 3.5 Haiku (2048) or Claude 3 Haiku.
+  - Model routing: money turns go straight to MODEL_ID ("strong"): any turn
+    of a transfer conversation, and a fresh message that reads like a
+    transfer request (`fastpath.looks_like_money`). Everything else,
+    including one-liners, goes to FAST_MODEL_ID ("fast"). A fast parse is
+    re-run on the strong model when it fails validation, its
+    lang.confidence is below ESCALATE_CONFIDENCE, or it unexpectedly
+    decides to fulfill a transfer. Each decision is logged and timed per tier.
+
+Token usage (including cache reads/writes) is recorded in `metrics` for
+every call. These helpers are intentionally thin; they keep the calling
+code simple.
 """
 from __future__ import annotations
 
 import json
-import re
-from typing import Any, Dict, Optional
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache_utils import TTLCache
+from config import (
+    ESCALATE_CONFIDENCE,
+    FAST_MODEL_ID,
+    LLM_CACHE_MIN_TOKENS,
+    LLM_PROMPT_CACHE,
+    LLM_STREAM,
+    LLM_TOOL_MODE,
+    MODEL_ID,
+    get_brt,
+    get_system_prompt,
+)
+from fastpath import MONEY_INTENTS, looks_like_money
+from json_stream import JsonFieldStream, extract_json
+from nlu_schema import NLU_SCHEMA, NLUParseError, normalize, tool_config, validate
+from prompt_builder import AssembledPrompt, build_prompt, estimate_tokens
+import metrics
+
+# Fields handle_text needs from a parse; once all are in, the stream is closed
+TURN_FIELDS = tuple(NLU_SCHEMA["required"])
+
+TIERS = {"fast": FAST_MODEL_ID, "strong": MODEL_ID}
+
+# Minimum cacheable prompt length per model family, first match wins
+# (None: no prompt caching). Unknown models get no checkpoint.
+CACHE_MIN_TOKENS: Tuple[Tuple[str, Optional[int]], ...] = (
+    ("claude-3-haiku", None),
+    ("claude-3-5-haiku", 2048),
+    ("claude-haiku-4-5", 4096),
+    ("claude-opus-4-5", 4096),
+    ("claude-3-5-sonnet", 1024),
+    ("claude-3-7-sonnet", 1024),
+    ("claude-sonnet-4", 1024),
+    ("claude-opus-4", 1024),
+)
+
+# Translations of fixed lines rarely change; keep each one per warm container.
+ONE_LINER_CACHE_SIZE = 512
+ONE_LINER_CACHE_TTL_SECONDS = 6 * 3600
+
+_ONE_LINER_CACHE = TTLCache(maxsize=ONE_LINER_CACHE_SIZE, ttl=ONE_LINER_CACHE_TTL_SECONDS)
 
-from config import brt, MODEL_ID, SYSTEM_PROMPT
 
+def _cache_min_tokens(model_id: str) -> Optional[int]:
+    if LLM_CACHE_MIN_TOKENS > 0:
+        return LLM_CACHE_MIN_TOKENS
+    for family, floor in CACHE_MIN_TOKENS:
+        if family in model_id:
+            return floor
+    return None
 
-def _clean_json(s: str) -> str:
+
+def _cached_prefix_tokens(prompt: AssembledPrompt) -> int:
+    """
+    Estimated length of what a checkpoint after the static prefix covers:
+    the forced tool schema (sent before the system prompt) plus the prefix.
     """
-    Strip code fences / zero-width chars and return a best-effort JSON string.
+    tokens = estimate_tokens(prompt.prefix)
+    if LLM_TOOL_MODE:
+        tokens += estimate_tokens(json.dumps(tool_config()["tools"]))
+    return tokens
+
+
+def _system_blocks(prompt: AssembledPrompt, model_id: str) -> list:
     """
-    s = s.strip()
-    s = re.sub(r"^```(?:json)?\s*|\s*```$", "", s, flags=re.DOTALL).strip()
-    s = s.replace("\u200b", "")
-    return s
+    System prompt blocks: stable prefix, cache checkpoint, turn-specific rest.
+
+    The checkpoint is left out when the cached prefix is below `model_id`'s
+    minimum cacheable length, where Bedrock would ignore it anyway.
+    """
+    blocks: list = [{"text": prompt.prefix}]
+    floor = _cache_min_tokens(model_id) if LLM_PROMPT_CACHE else None
+    if floor is not None and _cached_prefix_tokens(prompt) >= floor:
+        blocks.append({"cachePoint": {"type": "default"}})
+    if prompt.rest:
+        blocks.append({"text": prompt.rest})
+    return blocks
+
+
+def _record_usage(usage: Optional[Dict[str, Any]]) -> None:
+    if not usage:
+        return
+    metrics.incr("llm.calls")
+    metrics.incr("llm.input_tokens", int(usage.get("inputTokens") or 0))
+    metrics.incr("llm.output_tokens", int(usage.get("outputTokens") or 0))
+    metrics.incr("llm.cache_read_tokens", int(usage.get("cacheReadInputTokens") or 0))
+    metrics.incr("llm.cache_write_tokens", int(usage.get("cacheWriteInputTokens") or 0))
 
 
 def llm_parse(
@@ -29,9 +132,18 @@ def llm_parse(
     prev_intent: str = "unknown",
     prev_slots: Optional[Dict[str, Any]] = None,
     preferred_lang: Optional[str] = None,
+    missing_slots: Optional[List[str]] = None,
+    stream: Optional[bool] = None,
 ) -> Dict[str, Any]:
     """
-    Ask the model to return STRICT JSON for NLU parsing.
+    Ask the model for the NLU parse of one user message.
+
+    Raises `NLUParseError` when no schema-valid parse can be obtained.
+
+    `prev_intent`, `missing_slots` and `preferred_lang` also pick the prompt
+    sections sent (prompt_builder) and the model tier (see module docstring).
+    `stream` overrides config.LLM_STREAM. A streamed result may lack trailing
+    fields such as `canonical_en`.
     """
     prev_slots = prev_slots or {}
     lang_line = f"Preferred Reply Language: {preferred_lang or 'auto'}\n"
@@ -43,23 +155,189 @@ def llm_parse(
         f"Return STRICT JSON matching the schema."
     )
 
-    resp = brt.converse(
-        modelId=MODEL_ID,
-        system=[{"text": SYSTEM_PROMPT}],
+    prompt = build_prompt(get_system_prompt(), prev_intent, missing_slots, preferred_lang or "auto")
+    request = dict(
         messages=[{"role": "user", "content": [{"text": user_payload}]}],
         inferenceConfig={"maxTokens": 800, "temperature": 0.2, "topP": 0.9},
     )
-    out = resp["output"]["message"]["content"][0]["text"]
-    s = _clean_json(out)
+    if LLM_TOOL_MODE:
+        request["toolConfig"] = tool_config()
+    use_stream = LLM_STREAM if stream is None else stream
+
+    tier, reason = _route(prev_intent, user_text)
+    if tier == "fast":
+        try:
+            parsed = _parse_on("fast", request, prompt, use_stream)
+            reason = _escalation_reason(parsed)
+        except Exception as e:
+            # Bad JSON, or the fast model itself failing: the strong tier decides
+            parsed, reason = None, f"error:{type(e).__name__}"
+        if reason is None:
+            _log_route("fast", "low_stakes")
+            return parsed
+        metrics.incr("llm.route.escalated")
+        tier = "strong"
+
+    _log_route(tier, reason)
+    try:
+        parsed = _parse_on(tier, request, prompt, use_stream)
+    except ValueError as e:
+        metrics.incr("llm.parse_failed")
+        raise NLUParseError(str(e)) from e
+    errors = validate(parsed)
+    if errors:
+        metrics.incr("llm.parse_invalid")
+        raise NLUParseError("; ".join(errors[:3]))
+    return parsed
+
+
+# ---------------------------------------------------------------------------
+# Model routing
+# ---------------------------------------------------------------------------
+
+def _route(prev_intent: str, user_text: str) -> Tuple[str, str]:
+    """
+    Pick the starting tier for a parse: (tier, reason).
+
+    Money turns start on the strong model rather than escalating after a
+    fast-tier answer, which would pay for both.
+    """
+    if FAST_MODEL_ID == MODEL_ID:
+        return "strong", "single_model"
+    if prev_intent in MONEY_INTENTS:
+        return "strong", "money_intent"
+    if looks_like_money(user_text):
+        return "strong", "money_request"
+    return "fast", "low_stakes"
+
 
-    # Tolerate trailing commas / line breaks
+def _escalation_reason(parsed: Any) -> Optional[str]:
+    """
+    Why a fast-tier parse must be redone on the strong model (None = keep it).
+    """
+    errors = validate(parsed)
+    if errors:
+        return f"invalid:{errors[0]}"
+    if parsed["lang"]["confidence"] < ESCALATE_CONFIDENCE:
+        return "low_confidence"
+    if parsed["intent"] == "transfer" and parsed["action"] == "fulfill":
+        return "transfer_fulfill"
+    return None
+
+
+def _log_route(tier: str, reason: str) -> None:
+    metrics.incr(f"llm.route.{tier}")
+    print(f"LLM route tier={tier} model={TIERS[tier]} reason={reason}")
+
+
+def _parse_on(
+    tier: str,
+    request: Dict[str, Any],
+    prompt: AssembledPrompt,
+    use_stream: bool,
+) -> Dict[str, Any]:
+    with metrics.timed(f"llm.{tier}.parse_ms"):
+        model_id = TIERS[tier]
+        req = dict(request, modelId=model_id, system=_system_blocks(prompt, model_id))
+        if use_stream:
+            return _parse_streamed(req)
+        with metrics.timed("llm.parse_ms"):
+            resp = get_brt().converse(**req)
+        _record_usage(resp.get("usage"))
+        return _from_content(resp["output"]["message"]["content"])
+
+
+def _from_content(blocks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    The parse from a Converse message: tool-call input if present, else the
+    JSON found in its text.
+    """
+    for block in blocks:
+        tool = block.get("toolUse")
+        if tool and isinstance(tool.get("input"), dict):
+            metrics.incr("llm.tool_input")
+            return normalize(tool["input"])
+    text = "".join(b.get("text") or "" for b in blocks)
+    metrics.incr("llm.text_fallback")
+    return _from_text(text)
+
+
+def _from_text(text: str) -> Dict[str, Any]:
+    parsed = extract_json(text)
+    if not isinstance(parsed, dict):
+        raise ValueError("model output is not a JSON object")
+    return normalize(parsed)
+
+
+def _parse_streamed(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `converse_stream` + incremental field parsing with early exit.
+
+    In tool mode only the tool call's input deltas are parsed incrementally
+    (any text the model writes before the call is not the parse); without
+    tools the JSON arrives as text deltas. Falls back to the tolerant
+    full-text parse (tool input if any, else text) if the stream ends before
+    every TURN_FIELDS entry could be decoded. After an early exit the rest
+    of the stream is drained on a daemon thread so its usage is recorded.
+    """
+    t0 = time.monotonic()
+    parser = JsonFieldStream()
+    source = "toolUse" if "toolConfig" in request else "text"
+    chunks: Dict[str, List[str]] = {"toolUse": [], "text": []}
+    stream = get_brt().converse_stream(**request)["stream"]
+    events = iter(stream)
+    early = False
     try:
-        return json.loads(s)
-    except json.JSONDecodeError:
-        s2 = s.replace("\n", " ")
-        s2 = re.sub(r",\s*}", "}", s2)
-        s2 = re.sub(r",\s*]", "]", s2)
-        return json.loads(s2)
+        for event in events:
+            if "metadata" in event:
+                _record_usage(event["metadata"].get("usage"))
+                continue
+            # Text deltas, or the tool call's input arriving as JSON fragments
+            d = (event.get("contentBlockDelta") or {}).get("delta") or {}
+            parts = {"text": d.get("text"), "toolUse": (d.get("toolUse") or {}).get("input")}
+            for kind, part in parts.items():
+                if part:
+                    chunks[kind].append(part)
+            delta = parts[source]
+            if not delta:
+                continue
+            for key, _ in parser.feed(delta):
+                if key == "reply":
+                    metrics.timing("llm.reply_ms", (time.monotonic() - t0) * 1000)
+            if parser.has(TURN_FIELDS):
+                metrics.incr("llm.stream_early_exit")
+                early = True
+                break
+    finally:
+        if early:
+            # The caller moves on now; the tail is read off the hot path only
+            # to pick up the usage metadata event
+            threading.Thread(target=_drain_usage, args=(stream, events), name="llm-drain", daemon=True).start()
+        else:
+            _close(stream)
+    metrics.timing("llm.parse_ms", (time.monotonic() - t0) * 1000)
+
+    if parser.has(TURN_FIELDS):
+        return normalize(parser.fields)
+    metrics.incr("llm.stream_fallback")
+    return _from_text("".join(chunks["toolUse"] or chunks["text"]))
+
+
+def _close(stream: Any) -> None:
+    close = getattr(stream, "close", None)
+    if close:
+        close()
+
+
+def _drain_usage(stream: Any, events: Any) -> None:
+    try:
+        for event in events:
+            if "metadata" in event:
+                _record_usage(event["metadata"].get("usage"))
+    except Exception as e:
+        print("WARN llm stream drain:", e)
+    finally:
+        _close(stream)
 
 
 def llm_one_liner(lang: str, english_line: str) -> str:
@@ -70,7 +348,17 @@ def llm_one_liner(lang: str, english_line: str) -> str:
       - Neutral, professional tone. No jokes, no commentary, no emojis.
       - Preserve currency/number formatting exactly.
       - No English or code-mix for pcm/ig/yo/ha.
+
+    Results are cached on (lang, english_line); callers should pass the
+    templated line so repeated sentences translate only once.
     """
+    key = (lang, english_line)
+    cached = _ONE_LINER_CACHE.get(key)
+    if cached is not None:
+        metrics.incr("one_liner.cache_hit")
+        return cached
+    metrics.incr("one_liner.cache_miss")
+
     sys = (
         "Translate or rewrite the given line into the exact target language indicated by 'lang'.\n"
         "STRICT RULES:\n"
@@ -79,15 +367,20 @@ def llm_one_liner(lang: str, english_line: str) -> str:
         "3) Do NOT add opinions, jokes, or commentary.\n"
         "4) If lang is pcm/ig/yo/ha, do NOT output English or code-mix.\n"
         "5) Use the neutral templates for that language.\n"
-        "6) Output only the sentence."
+        "6) Output only the sentence.\n"
+        "7) Keep any {placeholder} tokens exactly as written, untranslated."
     )
     u = f"lang={lang}\nLine: {english_line}\nReply (one sentence only):"
 
-    resp = brt.converse(
-        modelId=MODEL_ID,
-        system=[{"text": sys}],
-        messages=[{"role": "user", "content": [{"text": u}]}],
-        inferenceConfig={"maxTokens": 120, "temperature": 0.2, "topP": 0.9},
-    )
+    with metrics.timed("llm.fast.one_liner_ms"):
+        resp = get_brt().converse(
+            modelId=FAST_MODEL_ID,
+            system=[{"text": sys}],
+            messages=[{"role": "user", "content": [{"text": u}]}],
+            inferenceConfig={"maxTokens": 120, "temperature": 0.2, "topP": 0.9},
+        )
+    _record_usage(resp.get("usage"))
     txt = resp["output"]["message"]["content"][0]["text"].strip()
+    if txt:
+        _ONE_LINER_CACHE.set(key, txt)
     return txt
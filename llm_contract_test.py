@@ -1,13 +1,18 @@
 import os, json, decimal, re
 import boto3
 
+from prompt_builder import build_prompt
+
 # -------- Config --------
 REGION = os.getenv("BEDROCK_REGION", "us-east-1")
 # Example Anthropic Sonnet ID on Bedrock; make this configurable:
 MODEL_ID = os.getenv("BEDROCK_MODEL_ID", "us.anthropic.claude-3-5-haiku-20241022-v1:0")
 
 
-SYSTEM_PROMPT = open("system_prompt.txt", "r", encoding="utf-8").read()
+# Assembled the way llm.py does it (section markers stripped); a fresh
+# conversation gets every section.
+_PROMPT = build_prompt(open("system_prompt.txt", "r", encoding="utf-8").read())
+SYSTEM_PROMPT = "\n\n".join(t for t in (_PROMPT.prefix, _PROMPT.rest) if t)
 
 session = boto3.Session(profile_name="Izu", region_name="us-east-1")
 brt = session.client("bedrock-runtime")
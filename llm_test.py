@@ -0,0 +1,122 @@
+"""
+llm_parse model routing: money turns start on the strong tier.
+
+Run:  python -m pytest -q llm_test.py
+"""
+import pytest
+
+import config
+import llm
+from loadtest import FakeBedrock, Latency, _nlu
+
+
+@pytest.fixture(autouse=True)
+def tiers(monkeypatch):
+    monkeypatch.setattr(llm, "FAST_MODEL_ID", "fast-model")
+    monkeypatch.setattr(llm, "MODEL_ID", "strong-model")
+    monkeypatch.setattr(llm, "TIERS", {"fast": "fast-model", "strong": "strong-model"})
+
+
+@pytest.fixture
+def brt(monkeypatch):
+    canned = {
+        "send 5k to Ada 0123456789": _nlu("en", "transfer", {"amount": {"text": "5k", "value": 5000}}, ["pin"], "ask", "Your PIN?"),
+        "1234": _nlu("en", "transfer", {"pin": "1234"}, [], "fulfill", "Okay."),
+        "what can you do": _nlu("en", "help", {}, [], "ask", "Balance or transfer?"),
+    }
+    fake = FakeBedrock(canned, Latency(0))
+    models = []
+    real = fake.converse_stream
+
+    def converse_stream(**req):
+        models.append(req["modelId"])
+        return real(**req)
+
+    fake.converse_stream = converse_stream
+    saved = config._LAZY.get("brt")
+    config._LAZY["brt"] = fake
+    yield models
+    if saved is None:
+        config._LAZY.pop("brt", None)
+    else:
+        config._LAZY["brt"] = saved
+
+
+@pytest.mark.parametrize("prev_intent, text, expected", [
+    ("transfer", "1234", ("strong", "money_intent")),
+    ("transfer", "Ada Obi", ("strong", "money_intent")),
+    ("unknown", "send 5k to Ada 0123456789", ("strong", "money_request")),
+    ("unknown", "tura 2000 zuwa ga Musa", ("strong", "money_request")),
+    ("unknown", "0123456789", ("strong", "money_request")),
+    ("check_balance", "1234", ("fast", "low_stakes")),
+    ("unknown", "what can you do", ("fast", "low_stakes")),
+])
+def test_route(prev_intent, text, expected):
+    assert llm._route(prev_intent, text) == expected
+
+
+def test_single_model(monkeypatch):
+    monkeypatch.setattr(llm, "FAST_MODEL_ID", "strong-model")
+    assert llm._route("transfer", "1234") == ("strong", "single_model")
+
+
+def test_transfer_fulfill_calls_only_the_strong_model(brt):
+    parsed = llm.llm_parse("1234", prev_intent="transfer", missing_slots=["pin"], stream=True)
+    assert parsed["action"] == "fulfill"
+    assert brt == ["strong-model"]
+
+
+def test_new_transfer_request_calls_only_the_strong_model(brt):
+    llm.llm_parse("send 5k to Ada 0123456789", stream=True)
+    assert brt == ["strong-model"]
+
+
+def test_small_talk_stays_on_the_fast_model(brt):
+    llm.llm_parse("what can you do", stream=True)
+    assert brt == ["fast-model"]
+
+
+def _prompt(prefix_chars):
+    return llm.AssembledPrompt("x" * prefix_chars, "turn rules", ["intro"], 0)
+
+
+@pytest.mark.parametrize("model_id, prefix_chars, cached", [
+    ("us.anthropic.claude-3-5-sonnet-20241022-v2:0", 3000, True),
+    ("us.anthropic.claude-3-5-haiku-20241022-v1:0", 3000, False),
+    ("us.anthropic.claude-3-5-haiku-20241022-v1:0", 6500, True),
+    ("us.anthropic.claude-3-haiku-20240307-v1:0", 20000, False),
+    ("some-other-model", 20000, False),
+])
+def test_cache_point_follows_the_model_minimum(monkeypatch, model_id, prefix_chars, cached):
+    monkeypatch.setattr(llm, "LLM_PROMPT_CACHE", True)
+    blocks = llm._system_blocks(_prompt(prefix_chars), model_id)
+    assert ({"cachePoint": {"type": "default"}} in blocks) is cached
+    assert blocks[0]["text"].startswith("x") and blocks[-1] == {"text": "turn rules"}
+
+
+def test_tool_schema_counts_towards_the_cached_prefix(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_PROMPT_CACHE", True)
+    sonnet = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+    # ~900 tokens of system text alone is below Sonnet's 1024
+    monkeypatch.setattr(llm, "LLM_TOOL_MODE", False)
+    assert len(llm._system_blocks(_prompt(3150), sonnet)) == 2
+    monkeypatch.setattr(llm, "LLM_TOOL_MODE", True)
+    assert len(llm._system_blocks(_prompt(3150), sonnet)) == 3
+
+
+def test_request_carries_the_cache_point_for_its_tier(brt, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_PROMPT_CACHE", True)
+    monkeypatch.setattr(llm, "CACHE_MIN_TOKENS", (("strong-model", 1024), ("fast-model", None)))
+    systems = {}
+    fake = config._LAZY["brt"]
+    real = fake.converse_stream
+
+    def converse_stream(**req):
+        systems[req["modelId"]] = req["system"]
+        return real(**req)
+
+    monkeypatch.setattr(fake, "converse_stream", converse_stream)
+    llm.llm_parse("send 5k to Ada 0123456789", stream=True)
+    llm.llm_parse("what can you do", stream=True)
+    assert {"cachePoint": {"type": "default"}} in systems["strong-model"]
+    assert {"cachePoint": {"type": "default"}} not in systems["fast-model"]
@@ -0,0 +1,674 @@
+"""
+Local end-to-end load test of `lambda_function.lambda_handler`.
+
+Synthetic WhatsApp webhook deliveries (multi-language, multi-turn balance
+and transfer flows, greetings) are pushed through the real handler, with
+in-process stand-ins for every external service:
+  - Bedrock   : `FakeBedrock` (converse / converse_stream) answering with
+                canned NLU tool calls after a sampled latency
+  - DynamoDB  : `MemoryDynamo`, an in-memory low-level client (sessions,
+                message ids, transfer ledger; conditional puts included)
+  - Finlake   : a local HTTP stub (FINLAKE_BASE_URL)
+  - Graph API : a local HTTP sink that records every reply (GRAPH_BASE_URL)
+Latencies are lognormal, given as median/p95 per service.
+
+Prints throughput and p50/p95/p99 for every pipeline stage recorded in
+`metrics` (plus the harness's own per-webhook latency), and checks that
+every turn got exactly one reply. No AWS or network access needed.
+
+All invocations share this process, i.e. they behave like concurrent
+invocations of one warm container: caches are shared, and session writes
+deferred by overlapping batches are flushed when the last of them ends.
+Run:
+
+    python loadtest.py --users 200 --concurrency 16
+    python loadtest.py --llm-ms 400,1500 --finlake-ms 120,400 --dup-rate 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+LANGS = ["en", "pcm", "ig", "yo", "ha"]
+PHONE_NUMBER_ID = "100000000000001"
+
+# Per-language user phrasing; {amount}/{acct}/{name} are filled per user
+PHRASES: Dict[str, Dict[str, str]] = {
+    "en": {
+        "greeting": "hello",
+        "balance": "what is my account balance",
+        "transfer": "send {amount} to {name} {acct}",
+    },
+    "pcm": {
+        "greeting": "how far",
+        "balance": "abeg check how much remain for my account",
+        "transfer": "abeg send {amount} give {name} {acct}",
+    },
+    "ig": {
+        "greeting": "ndewo",
+        "balance": "ego ole dị n'akaụntụ m",
+        "transfer": "ziga {amount} nye {name} {acct}",
+    },
+    "yo": {
+        "greeting": "ẹ n lẹ",
+        "balance": "elo lo wa ninu akaunti mi",
+        "transfer": "fi {amount} ranṣẹ si {name} {acct}",
+    },
+    "ha": {
+        "greeting": "sannu",
+        "balance": "nawa ne a asusuna",
+        "transfer": "tura {amount} zuwa ga {name} {acct}",
+    },
+}
+NAMES = ["Ada", "Musa", "Tunde", "Ngozi", "Bello", "Kemi", "Emeka", "Zainab"]
+
+
+# ---------------------------------------------------------------------------
+# Latency model
+# ---------------------------------------------------------------------------
+
+class Latency:
+    """
+    Lognormal latency from a median and a p95 (milliseconds).
+    """
+
+    def __init__(self, median_ms: float, p95_ms: Optional[float] = None) -> None:
+        self.median = max(0.0, median_ms) / 1000.0
+        p95 = (p95_ms if p95_ms is not None else median_ms) / 1000.0
+        self.sigma = math.log(p95 / self.median) / 1.645 if self.median > 0 and p95 > self.median else 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        parts = [float(x) for x in spec.split(",")]
+        return cls(parts[0], parts[1] if len(parts) > 1 else None)
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(random.gauss(0.0, self.sigma)) if self.sigma else self.median
+
+    def sleep(self) -> None:
+        s = self.sample()
+        if s > 0:
+            time.sleep(s)
+
+
+# ---------------------------------------------------------------------------
+# Bedrock stand-in
+# ---------------------------------------------------------------------------
+
+def _nlu(
+    lang: str,
+    intent: str,
+    slots: Dict[str, Any],
+    missing: List[str],
+    action: str,
+    reply: str,
+) -> Dict[str, Any]:
+    # Key order matters for streaming: canonical_en last, as the model emits it
+    return {
+        "lang": {"detected": lang, "confidence": 0.95},
+        "intent": intent,
+        "slots": slots,
+        "missing_slots": missing,
+        "ask_slot": missing[0] if missing else None,
+        "action": action,
+        "reply": reply,
+        "canonical_en": intent.replace("_", " "),
+    }
+
+
+class FakeBedrock:
+    """
+    `converse` / `converse_stream` returning canned NLU for known user texts.
+
+    `canned` maps the exact user text to its parse; unknown texts get an
+    "unknown" parse. Requests without a toolConfig (one-liners) get "OK.".
+    """
+
+    def __init__(self, canned: Dict[str, Dict[str, Any]], latency: Latency, chunk: int = 24) -> None:
+        self.canned = canned
+        self.latency = latency
+        self.chunk = chunk
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, req: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], str]:
+        with self._lock:
+            self.calls += 1
+        payload = req["messages"][0]["content"][0]["text"]
+        m = re.search(r"^User: (.*)$", payload, re.M)
+        if m is None:
+            return None, "OK."
+        nlu = self.canned.get(m.group(1).strip())
+        if nlu is None:
+            nlu = _nlu("en", "unknown", {}, [], "ask", "Sorry, please say that again.")
+        return copy.deepcopy(nlu), json.dumps(nlu, ensure_ascii=False)
+
+    @staticmethod
+    def _usage(text: str) -> Dict[str, int]:
+        return {"inputTokens": 1800, "outputTokens": len(text) // 4, "cacheReadInputTokens": 1500}
+
+    def converse(self, **req: Any) -> Dict[str, Any]:
+        self.latency.sleep()
+        nlu, text = self._answer(req)
+        if nlu is not None and "toolConfig" in req:
+            block: Dict[str, Any] = {"toolUse": {"toolUseId": "tool-1", "name": "record_nlu", "input": nlu}}
+        else:
+            block = {"text": text}
+        return {
+            "output": {"message": {"role": "assistant", "content": [block]}},
+            "stopReason": "tool_use" if "toolUse" in block else "end_turn",
+            "usage": self._usage(text),
+        }
+
+    def converse_stream(self, **req: Any) -> Dict[str, Any]:
+        nlu, text = self._answer(req)
+        tool = nlu is not None and "toolConfig" in req
+        total = self.latency.sample()
+        chunks = [text[i:i + self.chunk] for i in range(0, len(text), self.chunk)] or [""]
+
+        def events():
+            time.sleep(total * 0.4)  # time to first token
+            yield {"messageStart": {"role": "assistant"}}
+            step = total * 0.6 / len(chunks)
+            for c in chunks:
+                time.sleep(step)
+                delta = {"toolUse": {"input": c}} if tool else {"text": c}
+                yield {"contentBlockDelta": {"contentBlockIndex": 0, "delta": delta}}
+            yield {"messageStop": {"stopReason": "tool_use" if tool else "end_turn"}}
+            yield {"metadata": {"usage": self._usage(text)}}
+
+        return {"stream": events()}
+
+
+# ---------------------------------------------------------------------------
+# DynamoDB stand-in
+# ---------------------------------------------------------------------------
+
+class MemoryDynamo:
+    """
+    In-memory low-level DynamoDB client for the calls this bot makes.
+
+    Items are keyed on (table, key), the key attribute being `wa_id` unless
+    `key_attrs` names another for a table. Supports the condition forms
+    used here: `attribute_not_exists(x)`, `#a = :v`, `#a < :v`, joined with
+    AND inside parentheses and OR between them. TransactWriteItems (puts
+    only) cancels with per-item CancellationReasons like DynamoDB.
+    """
+
+    def __init__(self, latency: Latency, key_attrs: Optional[Dict[str, str]] = None) -> None:
+        self.latency = latency
+        self.key_attrs = dict(key_attrs or {})
+        self.items: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _op(self, name: str) -> None:
+        self.latency.sleep()
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _key(self, table: str, attrs: Dict[str, Any]) -> Tuple[str, str]:
+        return table, attrs[self.key_attrs.get(table, "wa_id")]["S"]
+
+    @staticmethod
+    def _clause(clause: str, cur: Optional[Dict[str, Any]], names: Dict[str, str], values: Dict[str, Any]) -> bool:
+        m = re.fullmatch(r"attribute_not_exists\((#?\w+)\)", clause)
+        if m:
+            return cur is None or names.get(m.group(1), m.group(1)) not in cur
+        m = re.fullmatch(r"(#?\w+) (=|<) (:\w+)", clause)
+        if m:
+            have = None if cur is None else cur.get(names.get(m.group(1), m.group(1)))
+            want = values[m.group(3)]
+            if m.group(2) == "=":
+                return have == want
+            return have is not None and "N" in have and float(have["N"]) < float(want["N"])
+        raise NotImplementedError(f"condition not supported by MemoryDynamo: {clause}")
+
+    def _check(self, cur: Optional[Dict[str, Any]], kw: Dict[str, Any], op: str) -> None:
+        cond = kw.get("ConditionExpression")
+        if not cond:
+            return
+        names = kw.get("ExpressionAttributeNames") or {}
+        values = kw.get("ExpressionAttributeValues") or {}
+        alts = [re.sub(r"^\((.*)\)$", r"\1", alt.strip()) for alt in cond.split(" OR ")]
+        if not any(all(self._clause(c.strip(), cur, names, values) for c in alt.split(" AND ")) for alt in alts):
+            from botocore.exceptions import ClientError
+
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}},
+                op,
+            )
+
+    def get_item(self, TableName: str, Key: Dict[str, Any], **kw: Any) -> Dict[str, Any]:
+        self._op("get_item")
+        with self._lock:
+            item = self.items.get(self._key(TableName, Key))
+            return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, TableName: str, Item: Dict[str, Any], **kw: Any) -> Dict[str, Any]:
+        self._op("put_item")
+        key = self._key(TableName, Item)
+        with self._lock:
+            self._check(self.items.get(key), kw, "PutItem")
+            self.items[key] = copy.deepcopy(Item)
+        return {}
+
+    def delete_item(self, TableName: str, Key: Dict[str, Any], **kw: Any) -> Dict[str, Any]:
+        self._op("delete_item")
+        with self._lock:
+            self.items.pop(self._key(TableName, Key), None)
+        return {}
+
+    def batch_get_item(self, RequestItems: Dict[str, Any]) -> Dict[str, Any]:
+        self._op("batch_get_item")
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for table, req in RequestItems.items():
+                out[table] = [
+                    copy.deepcopy(self.items[self._key(table, k)])
+                    for k in req["Keys"]
+                    if self._key(table, k) in self.items
+                ]
+        return {"Responses": out, "UnprocessedKeys": {}}
+
+    def transact_write_items(self, TransactItems: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self._op("transact_write_items")
+        from botocore.exceptions import ClientError
+
+        with self._lock:
+            reasons = []
+            for op in TransactItems:
+                put = op["Put"]
+                try:
+                    self._check(self.items.get(self._key(put["TableName"], put["Item"])), put, "TransactWriteItems")
+                    reasons.append({"Code": "None"})
+                except ClientError:
+                    reasons.append({"Code": "ConditionalCheckFailed"})
+            if any(r["Code"] != "None" for r in reasons):
+                raise ClientError(
+                    {
+                        "Error": {"Code": "TransactionCanceledException", "Message": "Transaction cancelled"},
+                        "CancellationReasons": reasons,
+                    },
+                    "TransactWriteItems",
+                )
+            for op in TransactItems:
+                put = op["Put"]
+                self.items[self._key(put["TableName"], put["Item"])] = copy.deepcopy(put["Item"])
+        return {}
+
+    def batch_write_item(self, RequestItems: Dict[str, Any]) -> Dict[str, Any]:
+        self._op("batch_write_item")
+        with self._lock:
+            for table, reqs in RequestItems.items():
+                for r in reqs:
+                    item = r["PutRequest"]["Item"]
+                    self.items[self._key(table, item)] = copy.deepcopy(item)
+        return {"UnprocessedItems": {}}
+
+
+# ---------------------------------------------------------------------------
+# HTTP stand-ins (Finlake stub, Graph sink)
+# ---------------------------------------------------------------------------
+
+class StubServer:
+    """
+    Local keep-alive JSON HTTP server: `route(path, body) -> (status, obj)`.
+    """
+
+    def __init__(self, route: Callable[[str, Dict[str, Any]], Tuple[int, Any]], latency: Latency) -> None:
+        self.hits: Dict[str, int] = {}
+        lock = threading.Lock()
+        hits = self.hits
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                n = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(n) or b"{}")
+                except ValueError:
+                    body = {}
+                with lock:
+                    hits[self.path] = hits.get(self.path, 0) + 1
+                latency.sleep()
+                status, obj = route(self.path, body)
+                data = json.dumps(obj).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, name="stub-http", daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+class FinlakeStub:
+    def __init__(self, latency: Latency) -> None:
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.http = StubServer(self.route, latency)
+
+    def route(self, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        ok = {"responseCode": "00", "responseMessage": "Successful"}
+        endpoint = path.rsplit("/", 1)[-1]
+        if endpoint == "cts-internal-name-enquiry":
+            return 200, dict(ok, accountName="ADA OKAFOR")
+        if endpoint == "cts-by-account-number":
+            return 200, dict(ok, account=[{"accountBalance": "152340.50"}], transactions=[])
+        if endpoint in ("cts-internal-fund-transfer", "cts-outward-fund-transfer"):
+            with self._lock:
+                self._seq += 1
+                seq = self._seq
+            return 200, dict(ok, reference=f"CBA{seq:08d}")
+        if endpoint == "cts-bank":
+            return 200, dict(ok, data=[{"bankCode": "058", "bankName": "Guaranty Trust Bank"}])
+        if endpoint == "cts-user-info":
+            return 200, ok
+        return 404, {"responseCode": "99", "responseMessage": f"no stub for {path}"}
+
+
+class GraphSink:
+    def __init__(self, latency: Latency) -> None:
+        self.replies: Dict[str, List[str]] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.http = StubServer(self.route, latency)
+
+    def route(self, path: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        with self._lock:
+            self._seq += 1
+            self.replies.setdefault(body.get("to", ""), []).append((body.get("text") or {}).get("body", ""))
+            seq = self._seq
+        return 200, {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.out{seq}"}]}
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(len(v) for v in self.replies.values())
+
+
+# ---------------------------------------------------------------------------
+# Synthetic users
+# ---------------------------------------------------------------------------
+
+def build_flows(n_users: int, seed: int) -> Tuple[List[Tuple[str, List[str]]], Dict[str, Dict[str, Any]]]:
+    """
+    One flow (wa_id, [texts...]) per user, plus the canned NLU for the
+    turns that reach the model. Slot answers (account numbers, PINs) are
+    left to the deterministic fast path, as in production, except the PIN
+    that completes a transfer: that fulfill decision goes to the model.
+    Transfer PINs are unique per user so their canned parses cannot clash.
+    """
+    from templates import render
+
+    rnd = random.Random(seed)
+    flows: List[Tuple[str, List[str]]] = []
+    canned: Dict[str, Dict[str, Any]] = {}
+    for i in range(n_users):
+        lang = LANGS[i % len(LANGS)]
+        p = PHRASES[lang]
+        wa_id = f"23480{i:08d}"
+        src = f"1{i:09d}"
+        pin = f"{rnd.randint(0, 9999):04d}"
+        texts: List[str] = []
+        if rnd.random() < 0.3:
+            texts.append(p["greeting"])
+            canned[p["greeting"]] = _nlu(lang, "greeting", {}, [], "ask", render("greeting", lang))
+
+        if rnd.random() < 0.5:
+            text = p["balance"]
+            missing = ["source_account_number", "pin"]
+            canned[text] = _nlu(lang, "check_balance", {}, missing, "ask", render("ask.source_account_number", lang))
+        else:
+            amount = rnd.choice([2000, 5000, 15000, 250000])
+            acct = f"0{rnd.randint(0, 999_999_999):09d}"
+            name = rnd.choice(NAMES)
+            text = p["transfer"].format(amount=f"{amount:,}", name=name, acct=acct)
+            slots = {
+                "amount": {"text": f"{amount:,}", "value": amount},
+                "destination_account_number": acct,
+                "recipient_name": name,
+            }
+            missing = ["source_account_number", "pin"]
+            canned[text] = _nlu(lang, "transfer", slots, missing, "ask", render("ask.source_account_number", lang))
+            pin = f"{i:06d}"
+            canned[pin] = _nlu(lang, "transfer", {"pin": pin}, [], "fulfill", render("fulfill_ack", lang))
+        texts += [text, src, pin]
+        flows.append((wa_id, texts))
+    return flows, canned
+
+
+class _Context:
+    def get_remaining_time_in_millis(self) -> int:
+        return 60_000
+
+
+def _event(wa_id: str, text: str, msg_id: str) -> Dict[str, Any]:
+    body = {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "WABA",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"phone_number_id": PHONE_NUMBER_ID},
+                    "messages": [{
+                        "from": wa_id,
+                        "id": msg_id,
+                        "timestamp": str(int(time.time())),
+                        "type": "text",
+                        "text": {"body": text},
+                    }],
+                },
+            }],
+        }],
+    }
+    return {"requestContext": {"http": {"method": "POST"}}, "body": json.dumps(body, ensure_ascii=False)}
+
+
+# ---------------------------------------------------------------------------
+# Run
+# ---------------------------------------------------------------------------
+
+STAGE_ORDER = [
+    "harness.webhook_ms",
+    "webhook.ack_ms",
+    "dispatch.batch_ms",
+    "message.processing_ms",
+    "llm.parse_ms",
+    "llm.fast.parse_ms",
+    "llm.strong.parse_ms",
+    "llm.reply_ms",
+    "name_enquiry.ms",
+    "graph.send_ms",
+    "outbound.queue_ms",
+]
+COUNTERS = [
+    "nlu.fastpath", "nlu.llm", "llm.route.fast", "llm.route.strong", "llm.stream_early_exit",
+    "session.read", "session.cache_hit", "session.write", "session.write_skipped",
+    "idempotency.duplicate", "ledger.committed", "graph.sent", "graph.retry", "outbound.requeued",
+    "nlu.fastpath_handoff",
+]
+
+
+def _stage_rows(snap: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    timings = snap["timings"]
+    names = [n for n in STAGE_ORDER if n in timings]
+    names += sorted(n for n in timings if n not in names and not n.startswith("coldstart."))
+    return [(n, timings[n]) for n in names]
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    finlake_stub = FinlakeStub(Latency.parse(args.finlake_ms))
+    graph_sink = GraphSink(Latency.parse(args.graph_ms))
+    # Must be set before the bot modules read their configuration
+    os.environ.update({
+        "FINLAKE_BASE_URL": finlake_stub.http.url,
+        "GRAPH_BASE_URL": graph_sink.http.url,
+        "PHONE_NUMBER_ID": PHONE_NUMBER_ID,
+        "WHATSAPP_TOKEN": "loadtest",
+        "WEBHOOK_MODE": "inline",
+        "LLM_STREAM": "1" if args.stream else "0",
+        "BANKS_SNAPSHOT_PATH": os.path.join("/tmp", f"loadtest-banks-{os.getpid()}.json"),
+    })
+
+    import config
+    import metrics
+
+    flows, canned = build_flows(args.users, args.seed)
+    brt = FakeBedrock(canned, Latency.parse(args.llm_ms))
+    ddb = MemoryDynamo(Latency.parse(args.ddb_ms), {config.IDEMPOTENCY_TABLE: config.IDEMPOTENCY_KEY_ATTR})
+    config._LAZY["brt"] = brt
+    config._LAZY["dynamodb"] = ddb
+
+    import lambda_function
+
+    metrics.reset()
+    metrics.MAX_SAMPLES = 10 ** 7  # keep every sample for exact percentiles
+    real_flush = metrics.flush
+    metrics.flush = lambda: None  # one JSON line per invocation would swamp the run
+    rnd = random.Random(args.seed + 1)
+    errors: List[str] = []
+    turns = dups = 0
+    count_lock = threading.Lock()
+
+    def user(flow: Tuple[str, List[str]]) -> None:
+        nonlocal turns, dups
+        wa_id, texts = flow
+        for j, text in enumerate(texts):
+            msg_id = f"wamid.{wa_id}.{j}"
+            deliveries = 2 if rnd.random() < args.dup_rate else 1
+            for _ in range(deliveries):
+                t0 = time.perf_counter()
+                try:
+                    resp = lambda_function.lambda_handler(_event(wa_id, text, msg_id), _Context())
+                    if resp.get("statusCode") != 200:
+                        errors.append(f"{wa_id}: HTTP {resp.get('statusCode')}")
+                except Exception as e:
+                    errors.append(f"{wa_id}: {e!r}")
+                metrics.timing("harness.webhook_ms", (time.perf_counter() - t0) * 1000.0)
+            with count_lock:
+                turns += 1
+                dups += deliveries - 1
+            if args.think_ms:
+                time.sleep(args.think_ms / 1000.0)
+
+    out = io.StringIO() if not args.verbose else None
+    t_start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out) if out is not None else contextlib.nullcontext():
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(user, flows))
+    finally:
+        metrics.flush = real_flush
+    wall = time.perf_counter() - t_start
+
+    snap = metrics.snapshot()
+    replies = graph_sink.count()
+    report = {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "turns": turns,
+        "redeliveries": dups,
+        "wall_s": round(wall, 2),
+        "turns_per_s": round(turns / wall, 1) if wall else 0.0,
+        "replies": replies,
+        "missing_replies": turns - replies,
+        "errors": errors[:10],
+        "error_count": len(errors),
+        "bedrock_calls": brt.calls,
+        "dynamodb_calls": dict(ddb.calls),
+        "finlake_hits": dict(finlake_stub.http.hits),
+        "counters": {c: snap["counters"].get(c, 0) for c in COUNTERS},
+        "bypass_rate": snap["gauges"].get("nlu.bypass_rate", 0.0),
+        "stages": {n: s for n, s in _stage_rows(snap)},
+    }
+    _stop_background()
+    finlake_stub.http.close()
+    graph_sink.http.close()
+    return report
+
+
+def _stop_background() -> None:
+    # Cancel the outbound pump (and any other task) on the shared loop
+    import asyncio
+
+    import bg_loop
+
+    async def cancel_all() -> None:
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    bg_loop.run(cancel_all())
+
+
+def print_report(r: Dict[str, Any]) -> None:
+    print(f"{r['users']} users, {r['turns']} turns (+{r['redeliveries']} redeliveries), "
+          f"concurrency {r['concurrency']}")
+    print(f"wall {r['wall_s']} s   throughput {r['turns_per_s']} turns/s   "
+          f"replies {r['replies']} (missing {r['missing_replies']})   errors {r['error_count']}")
+    for e in r["errors"]:
+        print("  ERR", e)
+    print()
+    print(f"{'stage':<40} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in r["stages"].items():
+        print(f"{name:<40} {s['n']:>7} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f}")
+    print()
+    print("counters  " + "  ".join(f"{k}={v}" for k, v in r["counters"].items()))
+    print(f"fast-path bypass rate {r['bypass_rate']:.1%}")
+    print(f"bedrock calls {r['bedrock_calls']}   dynamodb {r['dynamodb_calls']}")
+    print(f"finlake {r['finlake_hits']}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--users", type=int, default=100, help="synthetic users (one flow each)")
+    ap.add_argument("--concurrency", type=int, default=8, help="concurrent webhook invocations")
+    ap.add_argument("--llm-ms", default="350,1200", help="Bedrock latency median[,p95] in ms")
+    ap.add_argument("--finlake-ms", default="120,400", help="Finlake latency median[,p95] in ms")
+    ap.add_argument("--graph-ms", default="60,200", help="Graph API latency median[,p95] in ms")
+    ap.add_argument("--ddb-ms", default="4,12", help="DynamoDB latency median[,p95] in ms")
+    ap.add_argument("--dup-rate", type=float, default=0.0, help="fraction of webhooks delivered twice")
+    ap.add_argument("--think-ms", type=float, default=0.0, help="pause between a user's turns")
+    ap.add_argument("--no-stream", dest="stream", action="store_false", help="use converse instead of converse_stream")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    ap.add_argument("--verbose", action="store_true", help="keep the bot's own log output")
+    args = ap.parse_args(argv)
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
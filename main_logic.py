@@ -3,46 +3,103 @@ Conversation/session logic for the WhatsApp banking bot.
 
 Responsibilities:
   - Manage a short-lived DynamoDB session (language, intent, slots)
-  - Call the LLM parser to update state
+  - Try the deterministic fast path, else call the LLM parser to update state
   - Decide whether to ask for more info or fulfill an action
-  - Format the final one-liner in the user's language
+  - Start the destination name enquiry as soon as the account number (and,
+    where Finlake needs it, the PIN) is known, so it overlaps with the rest
+    of the slot collection; fulfillment never waits for it
+  - Render the final one-liner in the user's language (template catalog,
+    LLM fallback for languages/lines the catalog does not cover)
+  - Follow up transfers whose outcome was unknown: a background re-check
+    right after the reply, and another on the user's next message
 """
 from __future__ import annotations
 
 import time
+from concurrent.futures import Future
 from decimal import Decimal
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
-from sessions import load_session, merge_slots, save_session
+import ledger
+import metrics
+from session_model import Session
+from sessions import is_current, load_session, save_session
 from llm import llm_parse, llm_one_liner
+from nlu_schema import NLUParseError
+from fastpath import fast_parse
+from templates import CATALOG_VERSION, placeholders, render, template
+from outbound import PRIORITY_INFO, PRIORITY_PROMPT, PRIORITY_TRANSACTION
 from whatsapp_helpers import wa_send_text
-from banking_adapter import check_balance_adapter, transfer_adapter
+from banking_adapter import check_balance_adapter, prefetch_account_name, transfer_adapter
+from config import NAME_ENQUIRY_NEEDS_PIN, NAME_ENQUIRY_WAIT_SECONDS
+from finlake import FinlakeUnavailable
 
 IDLE_RESET_SECONDS = 60  # reset session silently after inactivity
+UNSETTLED_KEEP_SECONDS = 24 * 3600  # stop re-checking an unknown transfer after this
 
 
 # ---------------------------------------------------------------------------
 # Small helpers
 # ---------------------------------------------------------------------------
 
-def _ensure_defaults(sess: dict) -> dict:
-    if "intent" not in sess:
-        sess["intent"] = "unknown"
-    if "lang" not in sess:
-        sess["lang"] = "en"
-    if "slots" not in sess:
-        sess["slots"] = {}
-    if "missing_slots" not in sess:
-        sess["missing_slots"] = []
-    return sess
+def _session_age_seconds(sess: Session) -> int:
+    return max(0, int(time.time()) - sess.updated_at)
 
 
-def _session_age_seconds(sess: dict) -> int:
-    try:
-        updated = int(sess.get("updated_at") or 0)
-        return max(0, int(time.time()) - updated)
-    except Exception:
-        return 0
+def _log_reply(key: str, lang: str, source: str) -> None:
+    metrics.incr(f"reply.{source}")
+    print(f"REPLY key={key} lang={lang} source={source} catalog=v{CATALOG_VERSION}")
+
+
+def _localize(lang: str, key: str, **params: Any) -> str:
+    """
+    Render a catalog line in `lang`, else translate the English line via the LLM.
+
+    The English *template* is translated (and cached) rather than the filled-in
+    line, so e.g. every balance reply reuses one translation. If the model
+    mangles the placeholders we translate the concrete line instead.
+    """
+    line = render(key, lang, **params)
+    _log_reply(key, lang, "catalog" if line is not None else "llm")
+    if line is not None:
+        return line
+
+    base_tpl = template(key, "en") or ""
+    translated = llm_one_liner(lang, base_tpl)
+    if placeholders(translated) == placeholders(base_tpl):
+        try:
+            return translated.format_map(params)
+        except (KeyError, IndexError, ValueError, AttributeError) as e:
+            # e.g. "{}" or "{balance:d}" in the model's output
+            print(f"WARN translated template {key}/{lang} unusable:", e)
+    return llm_one_liner(lang, base_tpl.format_map(params))
+
+
+# Known causes of a failed transfer (substring of the lower-cased error) and
+# the catalog line for each; anything else gets the generic "transfer_failed"
+_FAILURE_KEYS = (
+    ("insufficient", "transfer_failed.insufficient_funds"),
+    ("not enough", "transfer_failed.insufficient_funds"),
+    ("invalid pin", "transfer_failed.invalid_pin"),
+    ("invalid transaction pin", "transfer_failed.invalid_pin"),
+    ("incorrect pin", "transfer_failed.invalid_pin"),
+    ("incorrect transaction pin", "transfer_failed.invalid_pin"),
+    ("wrong pin", "transfer_failed.invalid_pin"),
+    ("missing", "transfer_failed.missing_details"),
+    ("bank list unavailable", "transfer_failed.bank_list_unavailable"),
+)
+
+
+def _failure_key(error: str) -> str:
+    """
+    Catalog key for a failed transfer; the raw (English) error is only logged.
+    """
+    print("WARN transfer failed:", error)
+    low = (error or "").lower()
+    for needle, key in _FAILURE_KEYS:
+        if needle in low:
+            return key
+    return "transfer_failed"
 
 
 def _amount_value(slots: dict) -> int:
@@ -54,100 +111,262 @@ def _amount_value(slots: dict) -> int:
     return 0
 
 
+def _start_name_enquiry(sess: Session, old_slots: dict) -> Optional["Future[Optional[str]]"]:
+    """
+    Kick off the destination name enquiry once the account number is known.
+
+    A stored name is dropped when the account or bank changes. The enquiry
+    is only sent with a PIN when Finlake requires one (never with an empty
+    PIN). Returns the pending future, or None when there is nothing (new)
+    to look up.
+    """
+    slots = sess.slots
+    for k in ("destination_account_number", "destination_bank"):
+        if slots.get(k) != old_slots.get(k):
+            slots.pop("destination_account_name", None)
+    acct = slots.get("destination_account_number")
+    if sess.intent != "transfer" or not acct or slots.get("destination_account_name"):
+        return None
+    if slots.get("destination_bank"):
+        return None  # only same-bank accounts can be enquired
+    pin = slots.get("pin") or ""
+    if NAME_ENQUIRY_NEEDS_PIN and not pin:
+        return None
+    return prefetch_account_name(acct, pin)
+
+
+def _collect_name(sess: Session, fut: Optional["Future[Optional[str]]"]) -> None:
+    """
+    Store the enquiry result in the session if it arrives in time.
+
+    On timeout the lookup keeps running and lands in the name cache, so the
+    fulfillment turn still finds it there.
+    """
+    if fut is None:
+        return
+    try:
+        name = fut.result(timeout=NAME_ENQUIRY_WAIT_SECONDS)
+    except Exception:
+        return
+    if name:
+        sess.slots["destination_account_name"] = name
+
+
+def _fulfill(from_id: str, intent: str, slots: dict, lang: str, key: str = "") -> Tuple[str, bool]:
+    """
+    Run the bank action for a completed intent.
+
+    Returns (localized reply, done). `done` is False when we need one more
+    answer from the user (an ambiguous or unknown destination bank, or a
+    recipient name that does not match the account); `slots` is then
+    updated so the session can keep collecting. `key` identifies this turn
+    for the transfer ledger.
+    """
+    if intent == "check_balance":
+        res = check_balance_adapter(from_id, slots)
+        try:
+            bal = f"{Decimal(str(res.get('balance', '0'))):,.2f}"
+        except Exception:
+            bal = str(res.get("balance", "0"))
+        final = _localize(lang, "balance", balance=bal)
+
+    elif intent == "transfer":
+        # Normalize amount to plain int for the adapter
+        slots["amount"] = _amount_value(slots) or slots.get("amount")
+        res = transfer_adapter(from_id, slots, key)
+        if res.get("candidates"):
+            slots["destination_bank"] = None
+            options = ", ".join(c["name"] for c in res["candidates"])
+            return _localize(lang, "ask.bank_choice", options=options), False
+        if res.get("unknown_bank"):
+            slots["destination_bank"] = None
+            return _localize(lang, "ask.bank_unknown", bank=res["unknown_bank"]), False
+        if res.get("account_name"):
+            # The account holder is not who the user named; confirm before sending
+            slots["recipient_name"] = None
+            return _localize(
+                lang,
+                "ask.confirm_recipient",
+                account=slots.get("destination_account_number") or "",
+                name=res["account_name"],
+            ), False
+        if res.get("ok"):
+            final = _localize(lang, "transfer_ok", reference=res.get("transaction_id", "?"))
+        elif res.get("pending"):
+            final = _localize(lang, "transfer_pending", reference=res.get("reference", "?"))
+            if res.get("reference"):
+                slots["pending_reference"] = res["reference"]
+        else:
+            final = _localize(lang, _failure_key(res.get("error", "")))
+
+    else:
+        final = _localize(lang, "unknown_request")
+    return final, True
+
+
+# ---------------------------------------------------------------------------
+# Unknown transfers
+# ---------------------------------------------------------------------------
+
+def _settled_line(lang: str, res: dict) -> str:
+    if res.get("ok"):
+        return _localize(lang, "transfer_confirmed", reference=res.get("transaction_id", "?"))
+    return _localize(lang, _failure_key(res.get("error", "")))
+
+
+def _watch_transfer(from_id: str, lang: str, ref: str, pin: str) -> None:
+    """
+    Tell the user once a transfer we reported as pending has settled.
+    """
+    def notify(res: dict) -> None:
+        wa_send_text(from_id, _settled_line(lang, res), PRIORITY_TRANSACTION)
+
+    ledger.follow_up(ref, pin, notify)
+
+
+def _check_unsettled(from_id: str, sess: Session) -> None:
+    """
+    Re-check transfers left pending in earlier turns and announce any that
+    settled without the user being told. The PIN is this turn's, if the user
+    gave one; otherwise the ledger uses the one it kept in memory, if any.
+    Entries are dropped once announced, gone from the ledger, or older than
+    UNSETTLED_KEEP_SECONDS.
+    """
+    entries = sess.extra.get("unsettled")
+    if not entries:
+        return
+    pin = sess.slots.get("pin") or ""
+    keep = []
+    for entry in entries:
+        try:
+            res = ledger.recheck(entry["ref"], pin)
+        except Exception as e:
+            print("ERR unsettled transfer re-check:", e)
+            keep.append(entry)
+            continue
+        if res is None or res.get("notified"):
+            continue
+        if res.get("pending"):
+            if time.time() - entry.get("at", 0) < UNSETTLED_KEEP_SECONDS:
+                keep.append(entry)
+            continue
+        wa_send_text(from_id, _settled_line(sess.lang or "en", res), PRIORITY_TRANSACTION)
+        ledger.mark_notified(entry["ref"], ledger.COMMITTED if res.get("ok") else ledger.FAILED)
+    if keep:
+        sess.extra["unsettled"] = keep
+    else:
+        sess.extra.pop("unsettled", None)
+
+
 # ---------------------------------------------------------------------------
 # Core entrypoint
 # ---------------------------------------------------------------------------
 
-def handle_text(from_id: str, text: str) -> None:
+def handle_text(from_id: str, text: str, msg_id: str = "", fresh: bool = False) -> None:
     """
     Main per-message handler. Stateless other than the short DynamoDB session.
+
+    Every branch ends with exactly one `save_session`, so a turn costs at
+    most one session read and one write (often neither, see sessions.py).
+    `msg_id` (the WhatsApp message id) keys the transfer ledger; without it
+    the session version is used. A turn that would fulfill on a session
+    another container has since advanced is redone once on the stored
+    session (`fresh`).
     """
-    sess = _ensure_defaults(load_session(from_id))
+    sess = load_session(from_id, fresh=fresh)
 
-    # Silent inactivity reset
+    # Silent inactivity reset (persisted by the single save at the end of the turn)
     if _session_age_seconds(sess) > IDLE_RESET_SECONDS:
-        sess = {
-            "wa_id": from_id,
-            "state": "idle",
-            "intent": "unknown",
-            "lang": sess.get("lang", "auto"),
-            "slots": {},
-            "missing_slots": [],
-        }
-        save_session(sess)
+        sess.reset()
 
     # Use auto language on first turn; afterwards, stick to session language
-    preferred = (
-        "auto"
-        if (sess.get("intent", "unknown") == "unknown" and not (sess.get("slots") or {}))
-        else (sess.get("lang") or "auto")
-    )
-
-    parsed = llm_parse(
-        text,
-        prev_intent=sess.get("intent", "unknown"),
-        prev_slots=sess.get("slots") or {},
-        preferred_lang=preferred,
-    )
+    preferred = "auto" if sess.is_idle_shell else (sess.lang or "auto")
 
-    new_intent = parsed.get("intent") or "unknown"
-    lang = (parsed.get("lang") or {}).get("detected") or (sess.get("lang") or "en")
-    sess["lang"] = lang
+    # Deterministic pre-parse first; only unclear turns pay for Bedrock
+    parsed = fast_parse(text, sess)
+    if parsed is None:
+        try:
+            parsed = llm_parse(
+                text,
+                prev_intent=sess.intent,
+                prev_slots=sess.slots,
+                preferred_lang=preferred,
+                missing_slots=sess.missing_slots,
+            )
+        except NLUParseError as e:
+            # Keep the conversation where it was and ask the user to rephrase
+            print("ERR llm_parse:", e)
+            lang = sess.lang if sess.lang not in ("", "auto") else "en"
+            _check_unsettled(from_id, sess)
+            save_session(sess)
+            wa_send_text(from_id, _localize(lang, "not_understood"), PRIORITY_PROMPT)
+            return
 
-    new_slots = parsed.get("slots") or {}
-    sess["slots"] = merge_slots(sess.get("slots") or {}, new_slots)
-    sess["intent"] = new_intent
+    new_intent = parsed.get("intent") or "unknown"
+    lang = (parsed.get("lang") or {}).get("detected") or sess.lang or "en"
+    sess.lang = lang
 
+    old_slots = dict(sess.slots)
+    sess.merge_slots(parsed.get("slots") or {})
+    # After the merge, so a PIN given this turn can settle an earlier transfer
+    _check_unsettled(from_id, sess)
+    sess.intent = new_intent
     action = (parsed.get("action") or "ask").lower()
+    # The fulfillment turn never waits on a lookup; it uses what is known
+    name_fut = None if action == "fulfill" else _start_name_enquiry(sess, old_slots)
     ask_slot = parsed.get("ask_slot")
+    sess.ask_slot = ask_slot
     reply = (parsed.get("reply") or "").strip() or "Okay."
 
     # Reset / cancel
     if action == "reset" or new_intent == "reset":
-        sess = {"wa_id": from_id, "state": "idle", "intent": "unknown", "lang": lang, "slots": {}, "missing_slots": []}
+        sess.reset(lang)
         save_session(sess)
-        wa_send_text(from_id, reply)
+        wa_send_text(from_id, reply, PRIORITY_INFO)
         return
 
-    # Ask for more information
+    # Ask for more information (reply first; the name enquiry runs meanwhile)
     if action == "ask" or ask_slot:
-        sess["missing_slots"] = parsed.get("missing_slots") or []
+        sess.missing_slots = list(parsed.get("missing_slots") or [])
+        wa_send_text(from_id, reply, PRIORITY_PROMPT)
+        _collect_name(sess, name_fut)
         save_session(sess)
-        wa_send_text(from_id, reply)
         return
 
     # Fulfill (side-effects)
     if action == "fulfill":
+        if not fresh and not is_current(sess):
+            handle_text(from_id, text, msg_id, fresh=True)
+            return
         intent = new_intent
-        if intent == "check_balance":
-            res = check_balance_adapter(from_id, sess["slots"])
-            try:
-                bal = Decimal(str(res.get("balance", "0")))
-                base = f"Your current balance is NGN {bal:,.2f}."
-            except Exception:
-                base = f"Your current balance is NGN {res.get('balance', '0')}."
-            final = llm_one_liner(lang, base)
-
-        elif intent == "transfer":
-            # Normalize amount to plain int for the adapter
-            sess["slots"]["amount"] = _amount_value(sess["slots"]) or sess["slots"].get("amount")
-            res = transfer_adapter(from_id, sess["slots"])
-            if res.get("ok"):
-                txid = res.get("transaction_id", "?")
-                base = f"Transfer successful. Reference {txid}."
-            else:
-                base = f"Transfer failed: {res.get('error', 'unknown error')}."
-            final = llm_one_liner(lang, base)
+        try:
+            final, done = _fulfill(from_id, intent, sess.slots, lang, msg_id or f"v{sess.version}")
+        except FinlakeUnavailable as e:
+            # Bank API is down: fail fast with a clear message
+            print("ERR finlake unavailable:", e)
+            final, done = _localize(lang, "service_unavailable"), True
 
-        else:
-            final = llm_one_liner(lang, "I am not sure how to help with that.")
+        if not done:
+            # Ask for the missing piece (bank or recipient name); keep collecting
+            slot = "recipient_name" if sess.slots.get("recipient_name") is None else "destination_bank"
+            sess.missing_slots = [slot]
+            sess.ask_slot = slot
+            save_session(sess)
+            wa_send_text(from_id, final, PRIORITY_PROMPT)
+            return
 
-        wa_send_text(from_id, final)
+        wa_send_text(from_id, final, PRIORITY_TRANSACTION)
+        ref = sess.slots.get("pending_reference")
+        if ref:
+            _watch_transfer(from_id, lang, ref, sess.slots.get("pin") or "")
         # Always return to a clean idle session after fulfillment
-        sess = {"wa_id": from_id, "state": "idle", "intent": "unknown", "lang": lang, "slots": {}, "missing_slots": []}
+        sess.reset(lang)
+        if ref:
+            sess.extra.setdefault("unsettled", []).append({"ref": ref, "at": int(time.time())})
         save_session(sess)
         return
 
     # Default: persist updated session and echo parsed reply
+    wa_send_text(from_id, reply, PRIORITY_INFO)
+    _collect_name(sess, name_fut)
     save_session(sess)
-    wa_send_text(from_id, reply)
@@ -0,0 +1,117 @@
+"""
+handle_text turns end to end, with sessions, replies and Finlake faked.
+
+Run:  python -m pytest -q main_logic_test.py
+"""
+import pytest
+
+import finlake
+import ledger
+import main_logic
+from session_model import Session
+
+SLOTS = {
+    "amount": 5000,
+    "destination_account_number": "0123456789",
+    "recipient_name": "Ada Obi",
+    "source_account_number": "0001112223",
+    "pin": "1234",
+}
+
+
+@pytest.fixture
+def turn(monkeypatch):
+    """
+    One user with a transfer ready to fulfill; returns (session, sent replies).
+    """
+    sess = Session("2348000000001", intent="transfer", lang="en", slots=dict(SLOTS), version=3)
+    sess.updated_at = int(main_logic.time.time())
+    sent = []
+    monkeypatch.setattr(main_logic, "load_session", lambda wa_id, fresh=False: sess)
+    monkeypatch.setattr(main_logic, "save_session", lambda s: None)
+    monkeypatch.setattr(main_logic, "is_current", lambda s: True)
+    monkeypatch.setattr(main_logic, "wa_send_text", lambda to, body, priority=None: sent.append(body))
+    monkeypatch.setattr(
+        main_logic,
+        "fast_parse",
+        lambda text, s: {
+            "intent": "transfer",
+            "action": "fulfill",
+            "slots": {},
+            "lang": {"detected": "en", "confidence": 1.0},
+            "reply": "Sending now.",
+            "ask_slot": None,
+            "missing_slots": [],
+        },
+    )
+    ledger.set_ledger(ledger.MemoryLedger())
+    yield sess, sent
+    ledger.set_ledger(None)
+
+
+def _decline(message):
+    def post(**kwargs):
+        raise Exception(f"Finlake error responseCode=51 message={message}")
+    return post
+
+
+def test_declined_transfer_replies_with_localized_reason(turn, monkeypatch):
+    sess, sent = turn
+    monkeypatch.setattr(finlake, "fund_transfer_internal", _decline("Insufficient funds"))
+
+    main_logic.handle_text(sess.wa_id, "1234", "wamid.1")
+
+    assert sent == [main_logic.render("transfer_failed.insufficient_funds", "en")]
+    # The turn finished: the session is back to idle, not stuck on the PIN
+    assert sess.intent == "unknown" and not sess.slots
+
+
+def test_unknown_decline_gets_generic_line(turn, monkeypatch):
+    sess, sent = turn
+    monkeypatch.setattr(finlake, "fund_transfer_internal", _decline("Do not honour"))
+
+    main_logic.handle_text(sess.wa_id, "1234", "wamid.2")
+
+    assert sent == [main_logic.render("transfer_failed", "en")]
+    assert "honour" not in sent[0]
+
+
+def test_failure_key():
+    assert main_logic._failure_key("message=Invalid Transaction PIN") == "transfer_failed.invalid_pin"
+    assert main_logic._failure_key("missing fields") == "transfer_failed.missing_details"
+    assert main_logic._failure_key("") == "transfer_failed"
+
+
+def test_pin_given_on_a_later_turn_settles_an_unknown_transfer(turn, monkeypatch):
+    sess, sent = turn
+    ledger.get_ledger().create("r1", {"ref": "r1", "src": "0001112223", "state": ledger.UNKNOWN, "created_at": 0})
+    ledger._RECHECK_PINS.clear()  # the PIN went with the container that posted it
+    sess.reset("en")
+    sess.extra["unsettled"] = [{"ref": "r1", "at": int(main_logic.time.time())}]
+    pins = []
+
+    def history(acct, start, end, page, page_size, pin):
+        pins.append(pin)
+        return {"data": [{"narration": "chatbot r1", "transactionId": "T-r1"}]}
+
+    monkeypatch.setattr(finlake, "transaction_history_by_account", history)
+    monkeypatch.setattr(
+        main_logic,
+        "fast_parse",
+        lambda text, s: {
+            "intent": "check_balance",
+            "action": "ask",
+            "slots": {"pin": "4321"},
+            "lang": {"detected": "en", "confidence": 1.0},
+            "reply": "Which account?",
+            "ask_slot": "source_account_number",
+            "missing_slots": ["source_account_number"],
+        },
+    )
+
+    main_logic.handle_text(sess.wa_id, "4321", "wamid.3")
+
+    assert pins == ["4321"]
+    assert sent == [main_logic._settled_line("en", ledger.recheck("r1")), "Which account?"]
+    assert ledger.get_ledger().get("r1")["notified"] == ledger.COMMITTED
+    assert "unsettled" not in sess.extra
@@ -0,0 +1,145 @@
+"""
+Tiny in-process metrics for the WhatsApp banking bot.
+
+We keep counters, gauges and timing samples in module-level dicts so any
+module can record without wiring. `flush()` prints one JSON line (picked
+up by CloudWatch Logs) and is called once per Lambda invocation.
+
+Nothing here talks to the network; it is safe to call from hot paths.
+"""
+from __future__ import annotations
+
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator
+
+MAX_SAMPLES = 1000  # per timing series (warm container lifetime)
+
+_LOCK = threading.Lock()
+_COUNTERS: Dict[str, int] = {}
+_GAUGES: Dict[str, Any] = {}
+_TIMINGS: Dict[str, Deque[float]] = {}
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+def incr(name: str, n: int = 1) -> None:
+    """
+    Increment a counter.
+    """
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+
+def gauge(name: str, value: Any) -> None:
+    """
+    Set a point-in-time value (last write wins).
+    """
+    with _LOCK:
+        _GAUGES[name] = value
+
+
+def timing(name: str, ms: float) -> None:
+    """
+    Record one latency sample in milliseconds.
+    """
+    observe(name, ms)
+
+
+def observe(name: str, value: float) -> None:
+    """
+    Record one sample of any distribution (latency, sizes, token counts).
+    """
+    with _LOCK:
+        series = _TIMINGS.get(name)
+        if series is None:
+            series = _TIMINGS[name] = deque(maxlen=MAX_SAMPLES)
+        series.append(float(value))
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """
+    Context manager recording the wall time of the block under `name`.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing(name, (time.perf_counter() - t0) * 1000.0)
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def counter(name: str) -> int:
+    with _LOCK:
+        return _COUNTERS.get(name, 0)
+
+
+def ratio(part: str, *others: str) -> float:
+    """
+    part / (part + others...) over counters; 0.0 when nothing was counted.
+    """
+    with _LOCK:
+        num = _COUNTERS.get(part, 0)
+        den = num + sum(_COUNTERS.get(o, 0) for o in others)
+    return (num / den) if den else 0.0
+
+
+def percentile(name: str, p: float) -> float:
+    """
+    Nearest-rank percentile (0..100) of a timing series; 0.0 if empty.
+    """
+    with _LOCK:
+        data = sorted(_TIMINGS.get(name) or ())
+    if not data:
+        return 0.0
+    k = max(0, min(len(data) - 1, math.ceil(p / 100.0 * len(data)) - 1))
+    return data[k]
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Return counters, gauges and p50/p95/p99 per timing series.
+    """
+    with _LOCK:
+        names = list(_TIMINGS)
+        out: Dict[str, Any] = {
+            "counters": dict(_COUNTERS),
+            "gauges": dict(_GAUGES),
+        }
+    out["timings"] = {
+        n: {
+            "n": len(_TIMINGS.get(n) or ()),
+            "p50": percentile(n, 50),
+            "p95": percentile(n, 95),
+            "p99": percentile(n, 99),
+        }
+        for n in names
+    }
+    return out
+
+
+def flush() -> None:
+    """
+    Print a single JSON metrics line. Samples are kept (warm-container view).
+    """
+    print("METRICS " + json.dumps(snapshot(), default=str, separators=(",", ":")))
+
+
+def reset() -> None:
+    """
+    Drop everything recorded so far (used by local tools/harnesses).
+    """
+    with _LOCK:
+        _COUNTERS.clear()
+        _GAUGES.clear()
+        _TIMINGS.clear()
@@ -0,0 +1,233 @@
+"""
+Pluggable queue used by the ack-fast webhook mode.
+
+The webhook enqueues extracted messages and returns 200 straight away;
+`worker.py` drains the queue and runs the conversation logic.
+
+Backends (QUEUE_BACKEND):
+  - "sqs"    : Amazon SQS (use a FIFO queue to keep per-user order)
+  - "sqlite" : single-file queue for local runs (QUEUE_DB_PATH)
+  - "memory" : in-process deque, for tests and local harnesses
+
+Every backend has the same small surface: put_many / receive / ack / release.
+`receive` leases messages; un-acked leases are handed out again later.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from config import QUEUE_BACKEND, QUEUE_DB_PATH, QUEUE_URL
+
+VISIBILITY_TIMEOUT_SECONDS = 60
+
+
+class QueuedMessage:
+    """
+    One leased message: `body` is the message dict, `handle` is backend-specific.
+    """
+
+    __slots__ = ("body", "handle")
+
+    def __init__(self, body: Dict[str, Any], handle: Any) -> None:
+        self.body = body
+        self.handle = handle
+
+
+class QueueBackend:
+    """
+    Interface implemented by every backend.
+    """
+
+    def put_many(self, msgs: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def receive(self, max_n: int = 10) -> List[QueuedMessage]:
+        raise NotImplementedError
+
+    def ack(self, items: List[QueuedMessage]) -> None:
+        raise NotImplementedError
+
+    def release(self, items: List[QueuedMessage]) -> None:
+        """
+        Return leased messages to the queue immediately (e.g. deadline reached).
+        """
+        raise NotImplementedError
+
+
+# ---------------------------------------------------------------------------
+# In-process backend
+# ---------------------------------------------------------------------------
+
+class MemoryQueue(QueueBackend):
+    def __init__(self) -> None:
+        self._items: Deque[Dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+
+    def put_many(self, msgs: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._items.extend(msgs)
+
+    def receive(self, max_n: int = 10) -> List[QueuedMessage]:
+        with self._lock:
+            out = []
+            while self._items and len(out) < max_n:
+                body = self._items.popleft()
+                out.append(QueuedMessage(body, body))
+            return out
+
+    def ack(self, items: List[QueuedMessage]) -> None:
+        return None
+
+    def release(self, items: List[QueuedMessage]) -> None:
+        with self._lock:
+            self._items.extendleft(i.body for i in reversed(items))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+
+# ---------------------------------------------------------------------------
+# SQLite backend (local stand-in for SQS)
+# ---------------------------------------------------------------------------
+
+class SQLiteQueue(QueueBackend):
+    def __init__(self, path: str = QUEUE_DB_PATH) -> None:
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " body TEXT NOT NULL,"
+            " leased_until REAL NOT NULL DEFAULT 0)"
+        )
+
+    def put_many(self, msgs: List[Dict[str, Any]]) -> None:
+        rows = [(json.dumps(m, ensure_ascii=False),) for m in msgs]
+        with self._lock:
+            self._db.executemany("INSERT INTO queue (body) VALUES (?)", rows)
+
+    def receive(self, max_n: int = 10) -> List[QueuedMessage]:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, body FROM queue WHERE leased_until < ? ORDER BY id LIMIT ?",
+                    (now, max_n),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE queue SET leased_until = ? WHERE id = ?",
+                    [(now + VISIBILITY_TIMEOUT_SECONDS, r[0]) for r in rows],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [QueuedMessage(json.loads(body), rid) for rid, body in rows]
+
+    def ack(self, items: List[QueuedMessage]) -> None:
+        with self._lock:
+            self._db.executemany("DELETE FROM queue WHERE id = ?", [(i.handle,) for i in items])
+
+    def release(self, items: List[QueuedMessage]) -> None:
+        with self._lock:
+            self._db.executemany("UPDATE queue SET leased_until = 0 WHERE id = ?", [(i.handle,) for i in items])
+
+
+# ---------------------------------------------------------------------------
+# SQS backend
+# ---------------------------------------------------------------------------
+
+class SQSQueue(QueueBackend):
+    """
+    SQS-backed queue. For FIFO queues (URL ends with ".fifo") each sender
+    gets its own MessageGroupId so per-user ordering is preserved.
+    """
+
+    def __init__(self, queue_url: str = QUEUE_URL) -> None:
+        import boto3
+
+        self.url = queue_url
+        self.fifo = queue_url.endswith(".fifo")
+        self._sqs = boto3.client("sqs")
+
+    def put_many(self, msgs: List[Dict[str, Any]]) -> None:
+        for start in range(0, len(msgs), 10):  # SQS batch limit
+            entries = []
+            for i, m in enumerate(msgs[start:start + 10]):
+                body = json.dumps(m, ensure_ascii=False)
+                e: Dict[str, Any] = {"Id": str(i), "MessageBody": body}
+                if self.fifo:
+                    e["MessageGroupId"] = m.get("from") or "default"
+                    # The WhatsApp id is stable across webhook redeliveries; the body is not
+                    dedup = m.get("id") or body
+                    e["MessageDeduplicationId"] = hashlib.sha256(dedup.encode("utf-8")).hexdigest()
+                entries.append(e)
+            resp = self._sqs.send_message_batch(QueueUrl=self.url, Entries=entries)
+            if resp.get("Failed"):
+                raise Exception(f"SQS send_message_batch failed: {resp['Failed']}")
+
+    def receive(self, max_n: int = 10) -> List[QueuedMessage]:
+        resp = self._sqs.receive_message(
+            QueueUrl=self.url,
+            MaxNumberOfMessages=max(1, min(max_n, 10)),
+            VisibilityTimeout=VISIBILITY_TIMEOUT_SECONDS,
+            WaitTimeSeconds=0,
+        )
+        return [QueuedMessage(json.loads(m["Body"]), m["ReceiptHandle"]) for m in resp.get("Messages", [])]
+
+    def ack(self, items: List[QueuedMessage]) -> None:
+        for start in range(0, len(items), 10):
+            entries = [{"Id": str(i), "ReceiptHandle": it.handle} for i, it in enumerate(items[start:start + 10])]
+            if entries:
+                self._sqs.delete_message_batch(QueueUrl=self.url, Entries=entries)
+
+    def release(self, items: List[QueuedMessage]) -> None:
+        for start in range(0, len(items), 10):
+            entries = [
+                {"Id": str(i), "ReceiptHandle": it.handle, "VisibilityTimeout": 0}
+                for i, it in enumerate(items[start:start + 10])
+            ]
+            if entries:
+                self._sqs.change_message_visibility_batch(QueueUrl=self.url, Entries=entries)
+
+
+# ---------------------------------------------------------------------------
+# Factory
+# ---------------------------------------------------------------------------
+
+_QUEUE: Optional[QueueBackend] = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_queue() -> QueueBackend:
+    """
+    Return the process-wide queue backend selected by QUEUE_BACKEND.
+    """
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            backend = (QUEUE_BACKEND or "memory").lower()
+            if backend == "sqs":
+                _QUEUE = SQSQueue()
+            elif backend == "sqlite":
+                _QUEUE = SQLiteQueue()
+            else:
+                _QUEUE = MemoryQueue()
+        return _QUEUE
+
+
+def set_queue(q: Optional[QueueBackend]) -> None:
+    """
+    Override the process-wide backend (local tools / tests).
+    """
+    global _QUEUE
+    with _QUEUE_LOCK:
+        _QUEUE = q
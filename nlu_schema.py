@@ -0,0 +1,147 @@
+"""
+The NLU output schema (mirrors "OUTPUT JSON SCHEMA" in system_prompt.txt).
+
+Used three ways:
+  - as the input schema of the Bedrock tool the model is made to call, so
+    the parse arrives as structured tool arguments instead of free text
+  - by `validate`, which checks every parse (tool input or extracted text)
+  - by `normalize`, which fills the defaults the conversation layer expects
+
+The validator covers the JSON Schema subset used here (type, enum,
+properties, required, items); it avoids a jsonschema dependency.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+LANGS = ["en", "pcm", "ig", "yo", "ha"]
+INTENTS = ["check_balance", "transfer", "greeting", "help", "reset", "unknown"]
+ACTIONS = ["ask", "fulfill", "reset", "idle"]
+
+TOOL_NAME = "record_nlu"
+TOOL_DESCRIPTION = "Record the parsed language, intent, slots, next action and reply for this turn."
+
+_NULLABLE_STR = {"type": ["string", "null"]}
+
+NLU_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "lang": {
+            "type": "object",
+            "properties": {
+                "detected": {"type": "string", "enum": LANGS},
+                "confidence": {"type": "number"},
+            },
+            "required": ["detected", "confidence"],
+        },
+        "intent": {"type": "string", "enum": INTENTS},
+        "slots": {
+            "type": "object",
+            "properties": {
+                "amount": {
+                    "type": ["object", "null"],
+                    "properties": {
+                        "text": {"type": "string"},
+                        "value": {"type": "number"},
+                    },
+                },
+                "destination_account_number": _NULLABLE_STR,
+                "destination_bank": _NULLABLE_STR,
+                "recipient_name": _NULLABLE_STR,
+                "source_account_number": _NULLABLE_STR,
+                "source_account_name": _NULLABLE_STR,
+                "narration": _NULLABLE_STR,
+                "pin": _NULLABLE_STR,
+            },
+        },
+        "missing_slots": {"type": "array", "items": {"type": "string"}},
+        "ask_slot": _NULLABLE_STR,
+        "action": {"type": "string", "enum": ACTIONS},
+        "reply": {"type": "string"},
+        "canonical_en": {"type": "string"},
+    },
+    "required": ["lang", "intent", "slots", "missing_slots", "ask_slot", "action", "reply"],
+}
+
+
+class NLUParseError(ValueError):
+    """
+    The model's answer could not be turned into a valid NLU parse.
+    """
+
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def _type_ok(value: Any, name: str) -> bool:
+    if name == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if name == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, _TYPES[name])
+
+
+def _check(value: Any, schema: Dict[str, Any], path: str, errors: List[str]) -> None:
+    types = schema.get("type")
+    if types:
+        names = types if isinstance(types, list) else [types]
+        if not any(_type_ok(value, t) for t in names):
+            errors.append(f"{path}: expected {'|'.join(names)}")
+            return
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} not allowed")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+        for key, sub in (schema.get("properties") or {}).items():
+            if key in value:
+                _check(value[key], sub, f"{path}.{key}", errors)
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            _check(item, schema["items"], f"{path}[{i}]", errors)
+
+
+def validate(parsed: Any) -> List[str]:
+    """
+    Schema violations in `parsed` (empty list = valid).
+    """
+    errors: List[str] = []
+    _check(parsed, NLU_SCHEMA, "$", errors)
+    return errors
+
+
+def normalize(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill fields the model may leave out when they are empty.
+    """
+    parsed.setdefault("slots", {})
+    parsed.setdefault("missing_slots", [])
+    parsed.setdefault("ask_slot", None)
+    if parsed.get("slots") is None:
+        parsed["slots"] = {}
+    if parsed.get("missing_slots") is None:
+        parsed["missing_slots"] = []
+    return parsed
+
+
+def tool_config() -> Dict[str, Any]:
+    """
+    Bedrock Converse `toolConfig` forcing the model to answer via the NLU tool.
+    """
+    return {
+        "tools": [{
+            "toolSpec": {
+                "name": TOOL_NAME,
+                "description": TOOL_DESCRIPTION,
+                "inputSchema": {"json": NLU_SCHEMA},
+            }
+        }],
+        "toolChoice": {"tool": {"name": TOOL_NAME}},
+    }
@@ -0,0 +1,455 @@
+"""
+Outbound rate limiting and priority queue for WhatsApp replies.
+
+Replies are not sent the moment `handle_text` produces them. `submit` puts
+them on a priority queue, and a pump on the shared background loop
+(bg_loop.py) sends them through graph_sender as fast as two token buckets
+allow:
+  - one per sending number (PHONE_NUMBER_ID): Meta's throughput tier
+  - one per recipient: Meta's pair rate limit (per-user pacing)
+Higher-priority replies (transaction results) leave before prompts, and
+prompts before greetings/help text, across recipients. One recipient's
+replies always leave in the order they were queued, one at a time. A
+recipient that is out of tokens does not hold up anyone else.
+
+Throttling answers that survive graph_sender's own retries (429, rate-limit
+codes) put the reply back on the queue with a back-off instead of dropping
+it. Backpressure: the queue is bounded (OUTBOUND_MAX_PENDING); when it is
+full `submit` blocks up to OUTBOUND_SUBMIT_TIMEOUT and then raises
+`OutboundFull`, so callers slow down rather than pile up. `depth()` and
+the outbound.depth gauge show the backlog.
+
+`send(...)` queues a reply without waiting for it (pacing is not the
+turn's business) and logs delivery failures. At the end of a batch the
+worker calls `flush(timeout, requeue)`, bounded by the Lambda deadline:
+replies queued before the call are waited for, and those still queued when
+the time is up are taken off this container's queue (so a frozen container
+never sends them much later) and handed to `requeue`, which puts them on
+the message queue for the next invocation; their futures fail with
+`OutboundRequeued`. Only if that fails (or no `requeue` is given) are they
+dropped, with `OutboundDropped`. The pump is restarted
+if it ever stops, and survives errors in its own loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import metrics
+from bg_loop import loop
+from cache_utils import TTLCache
+from config import (
+    GRAPH_SEND_CONCURRENCY,
+    OUTBOUND_BURST,
+    OUTBOUND_FLUSH_TIMEOUT,
+    OUTBOUND_MAX_PENDING,
+    OUTBOUND_RATE,
+    OUTBOUND_SUBMIT_TIMEOUT,
+    RECIPIENT_BURST,
+    RECIPIENT_RATE,
+)
+from graph_sender import AsyncGraphSender, GraphError, sender
+
+# Priorities (lower leaves first)
+PRIORITY_TRANSACTION = 0  # fulfillment results: transfer/balance outcomes
+PRIORITY_PROMPT = 1       # questions needed to finish an action
+PRIORITY_INFO = 2         # greetings, help, resets, echoes
+
+MAX_REQUEUES = 5
+REQUEUE_BACKOFF = 1.0  # seconds; doubled per requeue
+THROTTLE_CODES = frozenset({4, 80007, 130429, 131056})
+PUMP_ERROR_PAUSE = 0.2  # seconds before the pump carries on after an error
+
+
+class OutboundFull(Exception):
+    """
+    The outbound queue stayed full for longer than the submit timeout.
+    """
+
+
+class OutboundDropped(Exception):
+    """
+    A queued reply was dropped by `flush` before it could be sent.
+    """
+
+
+class OutboundRequeued(OutboundDropped):
+    """
+    A queued reply was handed back by `flush` for a later invocation to send.
+    """
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, at most `burst` stored.
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._t = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        # `now` may predate a bucket created after it was read; never drain
+        if now <= self._t:
+            return
+        self._tokens = min(self.burst, self._tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        """
+        Seconds until one token is available (0 if one is available now).
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self._tokens >= 1.0:
+            return 0.0
+        return (1.0 - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self) -> None:
+        self._tokens -= 1.0
+
+
+class _Item:
+    __slots__ = ("to", "body", "priority", "seq", "future", "enqueued", "not_before", "requeues")
+
+    def __init__(self, to: str, body: str, priority: int, seq: int) -> None:
+        self.to = to
+        self.body = body
+        self.priority = priority
+        self.seq = seq
+        self.future: "Future[Dict[str, Any]]" = Future()
+        self.enqueued = time.monotonic()
+        self.not_before = 0.0
+        self.requeues = 0
+
+    @property
+    def entry(self) -> Tuple[int, int, "_Item"]:
+        return (self.priority, self.seq, self)
+
+
+def _resolve(fut: "Future[Dict[str, Any]]", result: Any = None, error: Optional[BaseException] = None) -> None:
+    # A caller may have cancelled its future; never let that break the pump
+    if fut.done():
+        return
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(result)
+
+
+class OutboundQueue:
+    """
+    Bounded priority queue drained by a rate-limited pump.
+
+    Parameters
+    ----------
+    graph : AsyncGraphSender
+        Sender used for delivery.
+    rate / burst : float
+        Messages per second (and burst) for the sending number.
+    recipient_rate / recipient_burst : float
+        Messages per second (and burst) per recipient.
+    max_pending : int
+        Queue bound; `submit` blocks (then raises OutboundFull) beyond it.
+    """
+
+    def __init__(
+        self,
+        graph: Optional[AsyncGraphSender] = None,
+        rate: float = OUTBOUND_RATE,
+        burst: float = OUTBOUND_BURST,
+        recipient_rate: float = RECIPIENT_RATE,
+        recipient_burst: float = RECIPIENT_BURST,
+        max_pending: int = OUTBOUND_MAX_PENDING,
+        concurrency: int = GRAPH_SEND_CONCURRENCY,
+    ) -> None:
+        self.graph = graph
+        self.bucket = TokenBucket(rate, burst)
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        # Idle recipients' buckets are full again after burst/rate seconds
+        ttl = recipient_burst / recipient_rate if recipient_rate > 0 else 3600.0
+        self._recipients = TTLCache(maxsize=100_000, ttl=max(60.0, ttl))
+        self._heap: List[Tuple[int, int, _Item]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._live: Set[int] = set()  # seqs of queued + in-flight items
+        self._tails: Dict[str, Tuple[int, int]] = {}  # recipient -> (live items, last priority)
+        self._inflight: Set[str] = set()  # recipients with a send in progress
+        self._wake: Optional[asyncio.Event] = None
+        self._pump_future: "Optional[Future[None]]" = None
+
+    # -----------------------------------------------------------------------
+    # Producer side (any thread)
+    # -----------------------------------------------------------------------
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._live)
+
+    def submit(
+        self,
+        to: str,
+        body: str,
+        priority: int = PRIORITY_INFO,
+        timeout: float = OUTBOUND_SUBMIT_TIMEOUT,
+    ) -> "Future[Dict[str, Any]]":
+        """
+        Queue a text reply; the Future resolves with Meta's answer or error.
+
+        Blocks while the queue is full, up to `timeout` seconds, then
+        raises OutboundFull. A reply never overtakes an earlier one to the
+        same recipient (it inherits that one's priority if lower).
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._live) < self.max_pending, timeout):
+                metrics.incr("outbound.full")
+                raise OutboundFull(f"outbound queue full ({len(self._live)} pending)")
+            count, last = self._tails.get(to, (0, priority))
+            if count:
+                priority = max(priority, last)
+            item = _Item(to, body, priority, next(self._seq))
+            self._tails[to] = (count + 1, priority)
+            self._live.add(item.seq)
+            heapq.heappush(self._heap, item.entry)
+            metrics.gauge("outbound.depth", len(self._live))
+        self._ensure_started()
+        self._kick()
+        return item.future
+
+    def flush(
+        self,
+        timeout: float,
+        requeue: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ) -> int:
+        """
+        Wait up to `timeout` seconds for every reply queued so far.
+
+        Replies still queued (not in flight) after that are taken off the
+        queue and passed to `requeue` as {"to", "body", "priority"} dicts,
+        in queue order; their futures fail with OutboundRequeued. Without
+        `requeue`, or if it raises, they are dropped (OutboundDropped).
+        Returns how many replies were left unsent.
+        """
+        if self.depth():
+            self._ensure_started()
+        with self._cond:
+            upto = max(self._live, default=-1)
+            self._cond.wait_for(lambda: min(self._live, default=upto + 1) > upto, max(0.0, timeout))
+            left = sorted((e for e in self._heap if e[1] <= upto), key=lambda e: e[1])
+            if left:
+                self._heap = [e for e in self._heap if e[1] > upto]
+                heapq.heapify(self._heap)
+                for _, _, item in left:
+                    self._forget(item)
+        items = [e[2] for e in left]
+        if not items:
+            return 0
+        n = len(items)
+        plural = "y" if n == 1 else "ies"
+        try:
+            if requeue is None:
+                raise OutboundDropped("no requeue target")
+            requeue([{"to": i.to, "body": i.body, "priority": i.priority} for i in items])
+        except Exception as e:
+            metrics.incr("outbound.dropped", n)
+            print(f"WARN outbound: dropped {n} queued repl{plural} at flush:", e)
+            for item in items:
+                _resolve(item.future, error=OutboundDropped(f"reply to {item.to} not sent before the deadline"))
+        else:
+            metrics.incr("outbound.deferred", n)
+            print(f"WARN outbound: requeued {n} unsent repl{plural} at flush")
+            for item in items:
+                _resolve(item.future, error=OutboundRequeued(f"reply to {item.to} requeued at the deadline"))
+        return n
+
+    def _ensure_started(self) -> None:
+        with self._cond:
+            pump = self._pump_future
+            if pump is not None and not pump.done():
+                return
+            self._pump_future = asyncio.run_coroutine_threadsafe(self._pump(), loop())
+        if pump is not None:
+            metrics.incr("outbound.pump_restart")
+            print("WARN outbound pump had stopped; restarted")
+
+    def _kick(self) -> None:
+        if self._wake is not None:
+            loop().call_soon_threadsafe(self._wake.set)
+
+    def _forget(self, item: _Item) -> None:
+        # Caller holds self._cond
+        self._live.discard(item.seq)
+        count, last = self._tails.get(item.to, (1, item.priority))
+        if count <= 1:
+            self._tails.pop(item.to, None)
+        else:
+            self._tails[item.to] = (count - 1, last)
+        metrics.gauge("outbound.depth", len(self._live))
+        self._cond.notify_all()
+
+    def _done(self, item: _Item) -> None:
+        with self._cond:
+            self._inflight.discard(item.to)
+            self._forget(item)
+        self._kick()
+
+    # -----------------------------------------------------------------------
+    # Pump (background loop)
+    # -----------------------------------------------------------------------
+
+    def _recipient_bucket(self, to: str) -> TokenBucket:
+        b = self._recipients.get(to)
+        if b is None:
+            b = TokenBucket(self.recipient_rate, self.recipient_burst)
+            self._recipients.set(to, b)
+        return b
+
+    def _next(self) -> Tuple[Optional[_Item], float]:
+        """
+        Highest-priority item that may be sent now, else how long to wait.
+        """
+        now = time.monotonic()
+        wait = float("inf")
+        with self._cond:
+            wait_number = self.bucket.wait_time(now)
+            if wait_number > 0:
+                return None, wait_number
+            held: List[Tuple[int, int, _Item]] = []
+            blocked = set(self._inflight)  # recipients whose earlier reply is not out yet
+            found: Optional[_Item] = None
+            try:
+                while self._heap:
+                    entry = heapq.heappop(self._heap)
+                    item = entry[2]
+                    if item.to in blocked:
+                        held.append(entry)
+                        continue
+                    w = max(item.not_before - now, self._recipient_bucket(item.to).wait_time(now))
+                    if w <= 0:
+                        found = item
+                        break
+                    wait = min(wait, w)
+                    held.append(entry)
+                    blocked.add(item.to)
+            finally:
+                for entry in held:
+                    heapq.heappush(self._heap, entry)
+            if found is not None:
+                self.bucket.take()
+                rb = self._recipient_bucket(found.to)
+                rb.take()
+                self._recipients.set(found.to, rb)  # keep active recipients' buckets
+                self._inflight.add(found.to)
+                return found, 0.0
+        return None, wait
+
+    async def _pump(self) -> None:
+        self._wake = asyncio.Event()
+        sem = asyncio.Semaphore(max(1, self.concurrency))
+        while True:
+            try:
+                item, wait = self._next()
+                if item is None:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), None if wait == float("inf") else wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await sem.acquire()
+                task = asyncio.ensure_future(self._deliver(item))
+                task.add_done_callback(lambda _t: sem.release())
+            except Exception as e:
+                # Keep draining: a dead pump would leave every later reply queued
+                metrics.incr("outbound.pump_error")
+                print("ERR outbound pump:", e)
+                await asyncio.sleep(PUMP_ERROR_PAUSE)
+
+    async def _deliver(self, item: _Item) -> None:
+        metrics.timing("outbound.queue_ms", (time.monotonic() - item.enqueued) * 1000.0)
+        try:
+            resp = await (self.graph or sender()).asend_text(item.to, item.body)
+        except GraphError as e:
+            throttled = e.status == 429 or e.code in THROTTLE_CODES
+            if throttled and item.requeues < MAX_REQUEUES:
+                # Back on the queue with its original position, so later
+                # replies to the same recipient still wait behind it
+                item.requeues += 1
+                item.not_before = time.monotonic() + REQUEUE_BACKOFF * (2 ** (item.requeues - 1))
+                metrics.incr("outbound.requeued")
+                with self._cond:
+                    self._inflight.discard(item.to)
+                    heapq.heappush(self._heap, item.entry)
+                self._kick()
+                return
+            self._done(item)
+            _resolve(item.future, error=e)
+            return
+        except asyncio.CancelledError:
+            self._done(item)
+            _resolve(item.future, error=OutboundDropped(f"reply to {item.to} cancelled"))
+            raise
+        except Exception as e:
+            self._done(item)
+            _resolve(item.future, error=e)
+            return
+        self._done(item)
+        metrics.incr("outbound.sent")
+        _resolve(item.future, resp)
+
+
+# ---------------------------------------------------------------------------
+# Process-wide queue
+# ---------------------------------------------------------------------------
+
+_QUEUE: Optional[OutboundQueue] = None
+_LOCK = threading.Lock()
+
+
+def get_outbound() -> OutboundQueue:
+    global _QUEUE
+    with _LOCK:
+        if _QUEUE is None:
+            _QUEUE = OutboundQueue()
+        return _QUEUE
+
+
+def _log_failure(fut: "Future[Dict[str, Any]]") -> None:
+    if fut.cancelled() or fut.exception() is None:
+        return
+    e = fut.exception()
+    if not isinstance(e, OutboundDropped):
+        metrics.incr("outbound.failed")
+        print("ERR outbound send:", e)
+
+
+def send(to: str, body: str, priority: int = PRIORITY_INFO) -> "Future[Dict[str, Any]]":
+    """
+    Queue a reply without waiting for its delivery; failures are logged.
+
+    Raises OutboundFull under backpressure. The returned Future can be
+    waited on by callers that need Meta's answer.
+    """
+    fut = get_outbound().submit(to, body, priority)
+    fut.add_done_callback(_log_failure)
+    return fut
+
+
+def flush(
+    timeout: float = OUTBOUND_FLUSH_TIMEOUT,
+    requeue: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+) -> int:
+    """
+    Deliver what is queued within `timeout` seconds; see OutboundQueue.flush.
+    """
+    return _QUEUE.flush(timeout, requeue) if _QUEUE is not None else 0
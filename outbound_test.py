@@ -0,0 +1,136 @@
+"""
+Outbound reply queue: token buckets, priority order, flush at the deadline.
+
+Run:  python -m pytest -q outbound_test.py
+"""
+import pytest
+
+import outbound
+import worker
+from msg_queue import MemoryQueue, set_queue
+from outbound import (
+    PRIORITY_INFO,
+    PRIORITY_PROMPT,
+    PRIORITY_TRANSACTION,
+    OutboundDropped,
+    OutboundQueue,
+    OutboundRequeued,
+    TokenBucket,
+)
+
+
+class Graph:
+    def __init__(self):
+        self.sent = []
+
+    async def asend_text(self, to, body):
+        self.sent.append((to, body))
+        return {"messages": [{"id": f"wamid.out.{len(self.sent)}"}]}
+
+
+@pytest.fixture
+def paused():
+    """
+    A queue whose pump never starts; `_next`/`_done` are driven by hand.
+    """
+    q = OutboundQueue(Graph(), rate=100, burst=100, recipient_rate=100, recipient_burst=100)
+    q._ensure_started = lambda: None
+    return q
+
+
+def _drain_order(q):
+    out = []
+    while True:
+        item, _ = q._next()
+        if item is None:
+            return out
+        out.append(item.body)
+        q._done(item)
+
+
+def test_token_bucket():
+    b = TokenBucket(rate=2, burst=2)
+    now = b._t
+    assert b.wait_time(now) == 0
+    b.take()
+    b.take()
+    assert b.wait_time(now) == pytest.approx(0.5)
+    assert b.wait_time(now + 0.5) == 0
+    # Never refills past the burst
+    assert b.wait_time(now + 60) == 0 and b._tokens == 2
+
+
+def test_token_bucket_ignores_an_earlier_clock_reading():
+    b = TokenBucket(rate=1, burst=1)
+    assert b.wait_time(b._t - 0.5) == 0
+
+
+def test_higher_priority_leaves_first(paused):
+    paused.submit("a", "help text", PRIORITY_INFO)
+    paused.submit("b", "which account?", PRIORITY_PROMPT)
+    paused.submit("c", "transfer done", PRIORITY_TRANSACTION)
+    assert _drain_order(paused) == ["transfer done", "which account?", "help text"]
+
+
+def test_one_recipient_keeps_its_order(paused):
+    paused.submit("a", "first", PRIORITY_INFO)
+    paused.submit("a", "second", PRIORITY_TRANSACTION)
+    paused.submit("b", "other", PRIORITY_PROMPT)
+    assert _drain_order(paused) == ["other", "first", "second"]
+
+
+def test_recipient_out_of_tokens_does_not_block_others(paused):
+    paused.recipient_rate, paused.recipient_burst = 0.001, 1
+    paused.submit("a", "a1", PRIORITY_TRANSACTION)
+    paused.submit("a", "a2", PRIORITY_TRANSACTION)
+    paused.submit("b", "b1", PRIORITY_INFO)
+    assert _drain_order(paused) == ["a1", "b1"]
+    _, wait = paused._next()
+    assert wait > 0
+
+
+def test_flush_requeues_unsent_replies(paused):
+    f1 = paused.submit("a", "one", PRIORITY_INFO)
+    f2 = paused.submit("b", "two", PRIORITY_TRANSACTION)
+    handed = []
+    assert paused.flush(0, handed.extend) == 2
+    assert handed == [
+        {"to": "a", "body": "one", "priority": PRIORITY_INFO},
+        {"to": "b", "body": "two", "priority": PRIORITY_TRANSACTION},
+    ]
+    assert isinstance(f1.exception(), OutboundRequeued) and isinstance(f2.exception(), OutboundRequeued)
+    assert paused.depth() == 0
+
+
+def test_flush_drops_when_requeue_fails(paused):
+    fut = paused.submit("a", "one", PRIORITY_INFO)
+
+    def broken(replies):
+        raise RuntimeError("queue down")
+
+    assert paused.flush(0, broken) == 1
+    assert type(fut.exception()) is OutboundDropped
+
+
+def test_flush_waits_for_delivery():
+    graph = Graph()
+    q = OutboundQueue(graph, rate=100, burst=100, recipient_rate=100, recipient_burst=100)
+    fut = q.submit("a", "hello", PRIORITY_INFO)
+    assert q.flush(5, lambda replies: pytest.fail("nothing to requeue")) == 0
+    assert fut.result(1)["messages"] and graph.sent == [("a", "hello")]
+
+
+def test_requeued_reply_is_sent_by_a_later_batch(monkeypatch):
+    q = MemoryQueue()
+    set_queue(q)
+    try:
+        worker._requeue_replies([{"to": "a", "body": "one", "priority": PRIORITY_PROMPT}])
+        sent = []
+        monkeypatch.setattr(worker, "wa_send_text", lambda to, body, priority=None: sent.append((to, body, priority)))
+        monkeypatch.setattr(worker, "handle_text", lambda *a, **kw: pytest.fail("not a turn"))
+        monkeypatch.setattr(worker, "prefetch_sessions", lambda ids: None)
+        monkeypatch.setattr(worker, "_flush_replies", lambda context: None)
+        assert worker.drain(queue=q)["processed"] == 1
+        assert sent == [("a", "one", PRIORITY_PROMPT)]
+    finally:
+        set_queue(None)
@@ -0,0 +1,141 @@
+"""
+Per-turn assembly of the NLU system prompt from tagged sections.
+
+`system_prompt.txt` is split by marker lines of the form
+
+    %% section <name> [intent=a,b] [lang=x,y] [slot=s1,s2]
+
+Untagged sections are always sent. Tagged sections are sent only when
+they match the turn:
+  - intent : the previous intent (when it is a known banking intent;
+             on a fresh conversation every intent matches)
+  - slot   : one of the slots still missing (on a fresh conversation, all)
+  - lang   : the session language ("auto" matches all). If no section for
+             an intent exists in that language, the other languages' sections
+             are kept so the model still sees an example.
+
+The leading run of untagged sections is returned separately as `prefix`,
+identical on every turn, so `llm.py` can put a prompt-cache checkpoint
+right after it. A prompt without markers is returned whole as the prefix.
+"""
+from __future__ import annotations
+
+import math
+import re
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+import metrics
+
+MARKER = re.compile(r"^%%\s*section\s+(\S+)(.*)$", re.MULTILINE)
+TASK_INTENTS = ("transfer", "check_balance")
+CHARS_PER_TOKEN = 3.5  # rough average for this prompt's mix of English/JSON
+
+
+class Section(NamedTuple):
+    name: str
+    attrs: Dict[str, FrozenSet[str]]
+    text: str
+
+
+class AssembledPrompt(NamedTuple):
+    prefix: str          # stable across turns (cacheable)
+    rest: str            # turn-specific sections, in file order
+    sections: List[str]  # names of the sections used
+    tokens: int          # estimated token count of prefix + rest
+
+
+_PARSED: Dict[str, List[Section]] = {}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count (no tokenizer at runtime; Bedrock usage has the real one).
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def parse_sections(text: str) -> List[Section]:
+    """
+    Split a prompt into sections; text before the first marker is an untagged section.
+    """
+    cached = _PARSED.get(text)
+    if cached is not None:
+        return cached
+
+    sections: List[Section] = []
+    matches = list(MARKER.finditer(text))
+    head = text[:matches[0].start()] if matches else text
+    if head.strip():
+        sections.append(Section("_head", {}, head.strip("\n")))
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        attrs: Dict[str, FrozenSet[str]] = {}
+        for token in m.group(2).split():
+            key, _, vals = token.partition("=")
+            attrs[key] = frozenset(v for v in vals.split(",") if v)
+        body = text[m.end():end].strip("\n")
+        sections.append(Section(m.group(1), attrs, body))
+
+    _PARSED[text] = sections
+    return sections
+
+
+def _matches(sec: Section, intents: Optional[FrozenSet[str]], missing: Optional[FrozenSet[str]]) -> bool:
+    want = sec.attrs.get("intent")
+    if want and intents is not None and not (want & intents):
+        return False
+    slots = sec.attrs.get("slot")
+    if slots and missing is not None and not (slots & missing):
+        return False
+    return True
+
+
+def _select_lang(secs: Iterable[Section], lang: str) -> List[Section]:
+    secs = list(secs)
+    if lang in ("", "auto"):
+        return secs
+    # Group language-tagged sections by intent and keep the ones in `lang`
+    # when that intent has any; otherwise keep them all.
+    have = {
+        frozenset(s.attrs.get("intent") or ())
+        for s in secs
+        if lang in (s.attrs.get("lang") or ())
+    }
+    return [
+        s for s in secs
+        if not s.attrs.get("lang")
+        or lang in s.attrs["lang"]
+        or frozenset(s.attrs.get("intent") or ()) not in have
+    ]
+
+
+def build_prompt(
+    source: str,
+    prev_intent: str = "unknown",
+    missing_slots: Optional[Iterable[str]] = None,
+    lang: str = "auto",
+) -> AssembledPrompt:
+    """
+    Assemble the sections of `source` that matter for this turn.
+    """
+    sections = parse_sections(source)
+    fresh = prev_intent not in TASK_INTENTS
+    intents = None if fresh else frozenset([prev_intent])
+    missing = None if fresh else frozenset(missing_slots or ())
+
+    prefix: List[Section] = []
+    for sec in sections:
+        if sec.attrs:
+            break
+        prefix.append(sec)
+    rest = _select_lang(
+        (s for s in sections[len(prefix):] if _matches(s, intents, missing)),
+        lang or "auto",
+    )
+
+    prefix_text = "\n\n".join(s.text for s in prefix)
+    rest_text = "\n\n".join(s.text for s in rest if s.text)
+    tokens = estimate_tokens(prefix_text) + estimate_tokens(rest_text)
+    metrics.observe("prompt.tokens", tokens)
+    metrics.observe("prompt.sections", len(prefix) + len(rest))
+    return AssembledPrompt(prefix_text, rest_text, [s.name for s in prefix + rest], tokens)
@@ -0,0 +1,181 @@
+"""
+Failure-handling primitives for upstream calls.
+
+  - `CircuitBreaker`: closed -> open after N consecutive failures; after a
+    cool-down one probe is let through (half-open); success closes it. A
+    probe that never reports back (cancelled, unexpected error) expires
+    after `probe_timeout`, so the next call can probe instead.
+  - `RetryBudget`: caps retries to a fraction of recent traffic so an
+    outage does not multiply load (and Lambda time) by MAX_RETRIES.
+  - `parse_retry_after`: seconds from a Retry-After header value.
+
+All classes are thread-safe; state can be read from any thread for metrics.
+"""
+from __future__ import annotations
+
+import email.utils
+import threading
+import time
+from collections import deque
+from typing import Deque, Optional
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Parameters
+    ----------
+    name : str
+        Used in metric names (`breaker.<name>.*`).
+    failure_threshold : int
+        Consecutive failures that open the circuit.
+    reset_timeout : float
+        Seconds to stay open before allowing a half-open probe.
+    probe_timeout : float, optional
+        Seconds after which an unanswered probe is given up (defaults to
+        `reset_timeout`).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        probe_timeout: Optional[float] = None,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = reset_timeout if probe_timeout is None else probe_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def _set(self, state: str) -> None:
+        if state != self._state:
+            self._state = state
+            metrics.gauge(f"breaker.{self.name}", state)
+            metrics.incr(f"breaker.{self.name}.{state}")
+
+    def allow(self) -> bool:
+        """
+        True if a call may proceed now. In half-open only one probe is allowed.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._set(HALF_OPEN)
+                self._probe_in_flight = False
+            now = time.monotonic()
+            if self._probe_in_flight:
+                if now - self._probe_started < self.probe_timeout:
+                    return False
+                # The probe's caller never recorded an outcome; let another one try
+                metrics.incr(f"breaker.{self.name}.probe_expired")
+            self._probe_in_flight = True
+            self._probe_started = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._set(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set(OPEN)
+
+
+class RetryBudget:
+    """
+    Allow retries only while retries <= ratio * requests over a sliding window
+    (with a small floor so low traffic can still retry).
+
+    Parameters
+    ----------
+    ratio : float
+        Max retries as a fraction of first attempts in the window.
+    window : float
+        Window length in seconds.
+    min_retries : int
+        Retries always allowed per window regardless of traffic.
+    """
+
+    def __init__(self, ratio: float = 0.1, window: float = 10.0, min_retries: int = 3) -> None:
+        self.ratio = ratio
+        self.window = window
+        self.min_retries = min_retries
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - self.window
+        for q in (self._requests, self._retries):
+            while q and q[0] < cutoff:
+                q.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_acquire(self) -> bool:
+        """
+        Spend one retry from the budget; False if the budget is exhausted.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            allowed = max(self.min_retries, int(self.ratio * len(self._requests)))
+            if len(self._retries) >= allowed:
+                metrics.incr("retry_budget.exhausted")
+                return False
+            self._retries.append(now)
+            return True
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After as seconds (delta-seconds or HTTP-date); None if absent/invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        dt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if dt is None:
+        return None
+    return max(0.0, dt.timestamp() - time.time())
@@ -0,0 +1,94 @@
+"""
+Circuit breaker, retry budget and Retry-After parsing.
+
+Run:  python -m pytest -q resilience_test.py
+"""
+import email.utils
+import time
+
+import pytest
+
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, RetryBudget, parse_retry_after
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Frozen monotonic clock; advance it with `clock.now += seconds`.
+    """
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    b = CircuitBreaker("t", failure_threshold=3, reset_timeout=10)
+    b.record_failure()
+    b.record_failure()
+    b.record_success()  # resets the count
+    b.record_failure()
+    b.record_failure()
+    assert b.state == CLOSED and b.allow()
+    b.record_failure()
+    assert b.state == OPEN and not b.allow()
+
+
+def test_half_open_lets_one_probe_through(clock):
+    b = CircuitBreaker("t", failure_threshold=1, reset_timeout=10)
+    b.record_failure()
+    clock.now += 10
+    assert b.state == HALF_OPEN
+    assert b.allow() and not b.allow()
+    b.record_success()
+    assert b.state == CLOSED and b.allow()
+
+
+def test_failed_probe_reopens(clock):
+    b = CircuitBreaker("t", failure_threshold=5, reset_timeout=10)
+    for _ in range(5):
+        b.record_failure()
+    clock.now += 10
+    assert b.allow()
+    b.record_failure()
+    assert b.state == OPEN and not b.allow()
+
+
+def test_unanswered_probe_expires(clock):
+    b = CircuitBreaker("t", failure_threshold=1, reset_timeout=10, probe_timeout=2)
+    b.record_failure()
+    clock.now += 10
+    assert b.allow()  # this caller never reports back
+    clock.now += 1
+    assert not b.allow()
+    clock.now += 1
+    assert b.allow()
+
+
+def test_retry_budget_floor_and_ratio(clock):
+    budget = RetryBudget(ratio=0.5, window=10, min_retries=1)
+    assert budget.try_acquire() and not budget.try_acquire()
+    for _ in range(6):
+        budget.record_request()
+    # 6 requests allow 3 retries; one is already spent
+    assert budget.try_acquire() and budget.try_acquire() and not budget.try_acquire()
+
+
+def test_retry_budget_window_slides(clock):
+    budget = RetryBudget(ratio=0.1, window=10, min_retries=2)
+    assert budget.try_acquire() and budget.try_acquire() and not budget.try_acquire()
+    clock.now += 11
+    assert budget.try_acquire()
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(" 1.5 ") == 1.5
+    assert parse_retry_after("-4") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    later = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 <= parse_retry_after(later) <= 30
+    assert parse_retry_after(email.utils.formatdate(0, usegmt=True)) == 0.0
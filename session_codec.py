@@ -0,0 +1,138 @@
+"""
+DynamoDB attribute-value codec for session items.
+
+Current layout (four attributes):
+    wa_id (S, key) | p (S, `Session.pack()`) | version (N) | ttl (N)
+
+Older items store one attribute per field (state, intent, lang, slots, ...).
+`decode_item` reads both, so those migrate on their next save. Legacy
+fields are decoded without boto3's TypeDeserializer: fixed-type converters
+for the known fields, and a small generic converter (native int/float,
+never Decimal) for slots and unknown attributes.
+
+`PROJECTION` lists the attributes a turn reads; `projection()` returns the
+matching ProjectionExpression/ExpressionAttributeNames (several of these
+names, e.g. "state" and "ttl", are DynamoDB reserved words).
+"""
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Any, Callable, Dict, Tuple
+
+from session_model import Session
+
+PACKED_ATTR = "p"
+
+# Attributes loaded per turn (`ttl` is rewritten on every save, never read);
+# the legacy names are only present on items not yet migrated.
+PROJECTION = (
+    "wa_id", PACKED_ATTR, "version",
+    "state", "intent", "lang", "slots", "missing_slots", "ask_slot", "updated_at",
+)
+
+
+# ---------------------------------------------------------------------------
+# Generic values (legacy slots and unknown attributes)
+# ---------------------------------------------------------------------------
+
+def _number(s: str) -> Any:
+    try:
+        return int(s)
+    except ValueError:
+        return float(s)
+
+
+def decode_value(av: Dict[str, Any]) -> Any:
+    (t, v), = av.items()
+    if t == "S":
+        return v
+    if t == "N":
+        return _number(v)
+    if t == "M":
+        return {k: decode_value(x) for k, x in v.items()}
+    if t == "L":
+        return [decode_value(x) for x in v]
+    if t == "NULL":
+        return None
+    if t == "BOOL":
+        return v
+    if t == "SS":
+        return list(v)
+    if t == "NS":
+        return [_number(x) for x in v]
+    raise TypeError(f"unsupported attribute type {t}")
+
+
+# ---------------------------------------------------------------------------
+# Legacy top-level fields
+# ---------------------------------------------------------------------------
+
+def _dec_str(av: Dict[str, Any]) -> Any:
+    s = av.get("S")
+    return s if s is not None else decode_value(av)
+
+
+def _dec_str_list(av: Dict[str, Any]) -> Any:
+    items = av.get("L")
+    if items is None:
+        return decode_value(av)
+    return [x["S"] if "S" in x else decode_value(x) for x in items]
+
+
+def _dec_int(av: Dict[str, Any]) -> Any:
+    n = av.get("N")
+    if n is None:
+        return decode_value(av)
+    try:
+        return int(n)
+    except ValueError:
+        return int(Decimal(n))
+
+
+_LEGACY: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "wa_id": _dec_str,
+    "state": _dec_str,
+    "intent": _dec_str,
+    "lang": _dec_str,
+    "ask_slot": _dec_str,
+    "missing_slots": _dec_str_list,
+    "updated_at": _dec_int,
+    "version": _dec_int,
+}
+
+
+# ---------------------------------------------------------------------------
+# Items
+# ---------------------------------------------------------------------------
+
+def encode_item(sess: Session, ttl: int) -> Dict[str, Any]:
+    """
+    Session -> DynamoDB attribute-value map (packed layout).
+    """
+    return {
+        "wa_id": {"S": sess.wa_id},
+        PACKED_ATTR: {"S": sess.pack()},
+        "version": {"N": str(sess.version)},
+        "ttl": {"N": str(int(ttl))},
+    }
+
+
+def decode_item(av: Dict[str, Any]) -> Session:
+    """
+    DynamoDB attribute-value map (packed or legacy layout) -> Session.
+    """
+    wa_id = av["wa_id"]["S"]
+    version = _dec_int(av["version"]) if "version" in av else 0
+    packed = av.get(PACKED_ATTR)
+    if packed is not None:
+        return Session.unpack(wa_id, packed["S"], version)
+    item = {k: _LEGACY.get(k, decode_value)(v) for k, v in av.items()}
+    return Session.from_dict(item)
+
+
+def projection(fields: Tuple[str, ...] = PROJECTION) -> Dict[str, Any]:
+    """
+    ProjectionExpression kwargs for GetItem/BatchGetItem.
+    """
+    names = {f"#p{i}": f for i, f in enumerate(fields)}
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
@@ -0,0 +1,57 @@
+"""
+Session item codec: packed layout, legacy layout, projection.
+
+Run:  python -m pytest -q session_codec_test.py
+"""
+from boto3.dynamodb.types import TypeSerializer
+
+from session_codec import PACKED_ATTR, PROJECTION, decode_item, decode_value, encode_item, projection
+from session_model import Session
+
+_SER = TypeSerializer()
+
+
+def _sess():
+    return Session(
+        "2348000000001",
+        intent="transfer",
+        lang="pcm",
+        slots={"amount": {"text": "5k", "value": 5000}, "recipient_name": "Ada", "nickname": "sis"},
+        missing_slots=["pin"],
+        ask_slot="pin",
+        updated_at=1760000000,
+        version=7,
+    )
+
+
+def test_packed_round_trip():
+    item = encode_item(_sess(), ttl=1760003600)
+    assert set(item) == {"wa_id", PACKED_ATTR, "version", "ttl"}
+    back = decode_item(item)
+    assert back.to_dict() == _sess().to_dict()
+
+
+def test_legacy_item_is_read():
+    legacy = {k: _SER.serialize(v) for k, v in _sess().to_dict().items()}
+    legacy["ttl"] = _SER.serialize(1760003600)
+    legacy["channel"] = _SER.serialize("whatsapp")
+    back = decode_item(legacy)
+    assert back.slots == _sess().slots
+    assert back.missing_slots == ["pin"] and back.ask_slot == "pin"
+    assert back.version == 7 and back.updated_at == 1760000000
+    # Unknown attributes are kept, the TTL is not
+    assert back.extra == {"channel": "whatsapp"}
+    # ... and the next save writes the packed layout
+    assert PACKED_ATTR in encode_item(back, ttl=1)
+
+
+def test_decode_value_uses_native_numbers():
+    assert decode_value({"N": "5000"}) == 5000 and isinstance(decode_value({"N": "5000"}), int)
+    assert decode_value({"N": "2.5"}) == 2.5
+    assert decode_value({"M": {"a": {"L": [{"NULL": True}, {"BOOL": False}]}}}) == {"a": [None, False]}
+
+
+def test_projection_names_every_field():
+    p = projection()
+    assert sorted(p["ExpressionAttributeNames"].values()) == sorted(PROJECTION)
+    assert p["ProjectionExpression"].split(", ") == list(p["ExpressionAttributeNames"])
@@ -0,0 +1,291 @@
+"""
+Typed conversation session.
+
+`Session` replaces the loose session dict: fixed fields (`__slots__`), a
+typed slot schema, and slot merging that never lets a null overwrite a
+known value (the NLU returns every slot, with null for the ones the user
+did not mention this turn).
+
+Storage form: `pack()` turns everything except the key, version and TTL
+into one compact JSON string (slot names shortened to one-letter codes);
+`unpack()` reverses it. `from_dict()` reads the older one-attribute-per-
+field layout, so existing items migrate on their next save.
+"""
+from __future__ import annotations
+
+import copy
+import json
+from typing import Any, Dict, List, Optional
+
+PACK_FORMAT = 1
+
+# Slot name -> storage code. Unknown slot names are stored as "~<name>".
+SLOT_CODES: Dict[str, str] = {
+    "amount": "a",
+    "destination_account_number": "d",
+    "destination_bank": "b",
+    "recipient_name": "r",
+    "destination_account_name": "n",
+    "source_account_number": "s",
+    "source_account_name": "o",
+    "narration": "t",
+    "pin": "p",
+}
+_CODE_SLOTS = {v: k for k, v in SLOT_CODES.items()}
+
+# Slot name -> expected kind ("amount" or "str"); other slots are kept as given
+SLOT_TYPES: Dict[str, str] = {name: "str" for name in SLOT_CODES}
+SLOT_TYPES["amount"] = "amount"
+
+
+# ---------------------------------------------------------------------------
+# Slot typing
+# ---------------------------------------------------------------------------
+
+def _as_str(v: Any) -> Optional[str]:
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    if isinstance(v, (str, int)):
+        s = str(v).strip()
+        return s or None
+    return None
+
+
+def _as_amount(v: Any) -> Any:
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, dict):
+        value = _as_amount(v.get("value"))
+        if value is None:
+            return None
+        return {"text": str(v.get("text") or value), "value": value}
+    if isinstance(v, (int, float)):
+        return int(v) if v > 0 else None
+    if isinstance(v, str):
+        digits = v.replace(",", "").strip()
+        return int(digits) if digits.isdigit() and int(digits) > 0 else None
+    return None
+
+
+def coerce_slot(name: str, value: Any) -> Any:
+    """
+    `value` converted to the slot's type, or None if it does not fit.
+    """
+    kind = SLOT_TYPES.get(name)
+    if kind == "str":
+        return _as_str(value)
+    if kind == "amount":
+        return _as_amount(value)
+    return value
+
+
+def merge_slots(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Merge slot dicts: typed, non-null new values override; nulls never do.
+    """
+    out = dict(old or {})
+    for k, v in (new or {}).items():
+        v = coerce_slot(k, v)
+        if v is not None:
+            out[k] = v
+    return out
+
+
+def _rebase_dict(base: Dict[str, Any], mine: Dict[str, Any], theirs: Dict[str, Any]) -> Dict[str, Any]:
+    out = copy.deepcopy(theirs)
+    for k in set(base) | set(mine):
+        if mine.get(k) == base.get(k) and (k in mine) == (k in base):
+            continue
+        if k in mine:
+            out[k] = copy.deepcopy(mine[k])
+        else:
+            out.pop(k, None)
+    return out
+
+
+def _pack_slot(name: str) -> str:
+    return SLOT_CODES.get(name) or f"~{name}"
+
+
+def _unpack_slot(code: str) -> str:
+    return code[1:] if code.startswith("~") else _CODE_SLOTS.get(code, code)
+
+
+# ---------------------------------------------------------------------------
+# Session
+# ---------------------------------------------------------------------------
+
+class Session:
+    """
+    One user's conversation state.
+
+    `version` and `updated_at` are maintained by sessions.save_session.
+    `extra` keeps unknown top-level fields from older items.
+    """
+
+    __slots__ = (
+        "wa_id", "state", "intent", "lang", "slots", "missing_slots",
+        "ask_slot", "updated_at", "version", "extra",
+    )
+
+    def __init__(
+        self,
+        wa_id: str,
+        state: str = "idle",
+        intent: str = "unknown",
+        lang: str = "en",
+        slots: Optional[Dict[str, Any]] = None,
+        missing_slots: Optional[List[str]] = None,
+        ask_slot: Optional[str] = None,
+        updated_at: int = 0,
+        version: int = 0,
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.wa_id = wa_id
+        self.state = state or "idle"
+        self.intent = intent or "unknown"
+        self.lang = lang or "en"
+        self.slots: Dict[str, Any] = dict(slots or {})
+        self.missing_slots: List[str] = list(missing_slots or [])
+        self.ask_slot = ask_slot
+        self.updated_at = int(updated_at or 0)
+        self.version = int(version or 0)
+        self.extra: Dict[str, Any] = dict(extra or {})
+
+    def __repr__(self) -> str:
+        return (
+            f"Session({self.wa_id!r}, intent={self.intent!r}, lang={self.lang!r}, "
+            f"slots={sorted(self.slots)}, v{self.version})"
+        )
+
+    @property
+    def is_idle_shell(self) -> bool:
+        return self.intent == "unknown" and not self.slots
+
+    def merge_slots(self, new: Dict[str, Any]) -> None:
+        self.slots = merge_slots(self.slots, new)
+
+    def reset(self, lang: Optional[str] = None) -> None:
+        """
+        Back to an idle conversation (language kept unless given).
+        """
+        self.state = "idle"
+        self.intent = "unknown"
+        self.lang = lang or self.lang
+        self.slots = {}
+        self.missing_slots = []
+        self.ask_slot = None
+
+    def copy(self) -> "Session":
+        s = Session.__new__(Session)
+        for name in Session.__slots__:
+            setattr(s, name, getattr(self, name))
+        s.slots = copy.deepcopy(self.slots)
+        s.missing_slots = list(self.missing_slots)
+        s.extra = copy.deepcopy(self.extra)
+        return s
+
+    def rebase(self, base: "Session", onto: "Session") -> "Session":
+        """
+        This turn's changes (relative to `base`, the state it started from)
+        re-applied on top of `onto`, a newer stored version.
+
+        Fields this turn left alone keep `onto`'s value; slots are merged
+        per key (added, changed and removed slots are carried over).
+        """
+        out = onto.copy()
+        for name in ("state", "intent", "lang", "ask_slot", "missing_slots"):
+            if getattr(self, name) != getattr(base, name):
+                setattr(out, name, copy.copy(getattr(self, name)))
+        out.slots = _rebase_dict(base.slots, self.slots, onto.slots)
+        out.extra = _rebase_dict(base.extra, self.extra, onto.extra)
+        return out
+
+    # -----------------------------------------------------------------------
+    # Storage form
+    # -----------------------------------------------------------------------
+
+    def _body(self, updated_at: int) -> list:
+        body = [
+            PACK_FORMAT,
+            self.state,
+            self.intent,
+            self.lang,
+            _pack_slot(self.ask_slot) if self.ask_slot else None,
+            [_pack_slot(s) for s in self.missing_slots],
+            updated_at,
+            {_pack_slot(k): v for k, v in self.slots.items()},
+        ]
+        if self.extra:
+            body.append(self.extra)
+        return body
+
+    def pack(self) -> str:
+        """
+        Compact JSON of everything except key, version and TTL.
+        """
+        return json.dumps(self._body(self.updated_at), separators=(",", ":"), ensure_ascii=False)
+
+    def fingerprint(self) -> str:
+        """
+        Like `pack` but without the timestamp; equal fingerprints = same state.
+        """
+        return json.dumps(self._body(0), separators=(",", ":"), ensure_ascii=False, sort_keys=True)
+
+    @classmethod
+    def unpack(cls, wa_id: str, packed: str, version: int = 0) -> "Session":
+        body = json.loads(packed)
+        if not isinstance(body, list) or body[0] != PACK_FORMAT:
+            raise ValueError(f"unknown packed session format for {wa_id}")
+        _, state, intent, lang, ask, missing, updated_at, slots = body[:8]
+        return cls(
+            wa_id,
+            state=state,
+            intent=intent,
+            lang=lang,
+            slots={_unpack_slot(k): v for k, v in (slots or {}).items()},
+            missing_slots=[_unpack_slot(s) for s in missing or []],
+            ask_slot=_unpack_slot(ask) if ask else None,
+            updated_at=updated_at,
+            version=version,
+            extra=body[8] if len(body) > 8 else None,
+        )
+
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any]) -> "Session":
+        """
+        Build from the legacy dict layout (one attribute per field).
+        """
+        known = ("wa_id", "state", "intent", "lang", "slots", "missing_slots", "ask_slot", "updated_at", "version")
+        return cls(
+            item["wa_id"],
+            state=item.get("state") or "idle",
+            intent=item.get("intent") or "unknown",
+            lang=item.get("lang") or "en",
+            slots=item.get("slots") or {},
+            missing_slots=item.get("missing_slots") or [],
+            ask_slot=item.get("ask_slot"),
+            updated_at=int(item.get("updated_at") or 0),
+            version=int(item.get("version") or 0),
+            extra={k: v for k, v in item.items() if k not in known and k != "ttl"},
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Plain dict view (legacy layout), e.g. for logs and tools.
+        """
+        out = dict(self.extra)
+        out.update(
+            wa_id=self.wa_id,
+            state=self.state,
+            intent=self.intent,
+            lang=self.lang,
+            slots=copy.deepcopy(self.slots),
+            missing_slots=list(self.missing_slots),
+            ask_slot=self.ask_slot,
+            updated_at=self.updated_at,
+            version=self.version,
+        )
+        return out
@@ -0,0 +1,76 @@
+"""
+Typed Session: slot typing and merging, packing, rebase.
+
+Run:  python -m pytest -q session_model_test.py
+"""
+import pytest
+
+from session_model import Session, coerce_slot, merge_slots
+
+
+@pytest.mark.parametrize("name, value, expected", [
+    ("amount", 5000, 5000),
+    ("amount", "5,000", 5000),
+    ("amount", {"text": "5k", "value": 5000}, {"text": "5k", "value": 5000}),
+    ("amount", 0, None),
+    ("amount", True, None),
+    ("destination_account_number", 123456789.0, "123456789"),
+    ("recipient_name", "  ", None),
+    ("recipient_name", ["Ada"], None),
+    ("nickname", ["kept", "as", "is"], ["kept", "as", "is"]),
+])
+def test_coerce_slot(name, value, expected):
+    assert coerce_slot(name, value) == expected
+
+
+def test_nulls_never_overwrite_known_slots():
+    old = {"amount": 5000, "recipient_name": "Ada"}
+    assert merge_slots(old, {"amount": None, "recipient_name": "Obi", "pin": None}) == {
+        "amount": 5000,
+        "recipient_name": "Obi",
+    }
+
+
+def test_pack_round_trip_keeps_unknown_slots_and_extra():
+    sess = Session(
+        "2348000000001",
+        intent="transfer",
+        slots={"pin": "1234", "nickname": "sis"},
+        missing_slots=["source_account_number"],
+        ask_slot="source_account_number",
+        updated_at=1760000000,
+        extra={"unsettled": [{"ref": "r1", "at": 1}]},
+    )
+    packed = sess.pack()
+    assert '"p":"1234"' in packed and '"~nickname":"sis"' in packed
+    back = Session.unpack(sess.wa_id, packed, version=4)
+    assert back.to_dict() == dict(sess.to_dict(), version=4)
+
+
+def test_unpack_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        Session.unpack("2348000000001", "[99]")
+
+
+def test_fingerprint_ignores_the_timestamp():
+    a = Session("2348000000001", slots={"pin": "1234"}, updated_at=1)
+    b = a.copy()
+    b.updated_at = 2
+    assert a.fingerprint() == b.fingerprint() and a.pack() != b.pack()
+    b.slots["pin"] = "4321"
+    assert a.fingerprint() != b.fingerprint()
+
+
+def test_rebase_keeps_both_sides_changes():
+    base = Session("2348000000001", intent="transfer", slots={"amount": 5000, "recipient_name": "Ada"})
+    theirs = base.copy()
+    theirs.slots["destination_bank"] = "zenith"
+    theirs.version = 2
+    mine = base.copy()
+    mine.slots["pin"] = "1234"
+    del mine.slots["recipient_name"]
+    mine.ask_slot = "recipient_name"
+
+    out = mine.rebase(base, theirs)
+    assert out.slots == {"amount": 5000, "destination_bank": "zenith", "pin": "1234"}
+    assert out.ask_slot == "recipient_name" and out.version == 2
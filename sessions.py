@@ -1,44 +1,378 @@
 """
 Session storage on DynamoDB.
 
-We keep a minimal user session with:
+Sessions are `session_model.Session` objects, stored as:
   - wa_id (partition key)
-  - state / intent / lang
-  - slots / missing_slots
-  - updated_at (epoch seconds)
+  - p (packed JSON: state / intent / lang / slots / missing_slots /
+    ask_slot / updated_at)
+  - version (incremented on every write; used for optimistic concurrency)
   - ttl (auto-expiry)
+Items in the older one-attribute-per-field layout are read transparently
+and rewritten in the packed layout on their next save.
+
+A warm container keeps a small LRU of the sessions it last read or wrote.
+A back-to-back turn from the same user is served from that cache (no
+`get_item`), and `save_session` skips the `put_item` when nothing but the
+timestamps changed. Writes are conditional on the `version` the turn
+read. On a conflict (another container handled the user meanwhile) the
+cache entry is evicted, the item is re-read with ConsistentRead, this
+turn's changes are re-applied on top of it (`Session.rebase`) and the
+conditional write is retried; if that still fails the turn fails with
+`SessionConflict`. Nothing is ever overwritten blindly.
+
+Cached sessions can lag behind another container's writes, so a turn
+that is about to move money checks `is_current` first (one consistent
+read of the version).
+
+For multi-user webhook deliveries, `prefetch_sessions` loads every sender's
+session with one BatchGetItem, and inside `deferred_writes()` the saves are
+buffered and flushed when the batch is done with TransactWriteItems, each
+put conditional on the version stored before the batch. Sessions whose
+condition fails are rebased and written one by one like above; a buffered
+write stays pending (and is flushed with the next batch) until it has
+succeeded, so a failed flush loses nothing.
+
+All calls go through the low-level DynamoDB client (`config.get_dynamodb`)
+with the session-specific codec in session_codec.py; reads project only
+the attributes a turn uses.
 """
 from __future__ import annotations
 
+import random
+import threading
 import time
-from typing import Dict, Any
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+import metrics
+from cache_utils import TTLCache
+from config import SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SECONDS, SESSIONS_TABLE, get_dynamodb
+from session_codec import decode_item, encode_item, projection
+from session_model import Session, merge_slots  # noqa: F401  (merge_slots re-exported)
+
+# Unchanged, non-idle sessions are still rewritten after this long so that
+# `updated_at` (idle reset) and `ttl` keep moving while a user is active.
+SESSION_TOUCH_SECONDS = 20
+
+# wa_id -> {"sess": Session, "fp": str}
+_CACHE = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL_SECONDS)
+
+# DynamoDB batch limits and retry policy for Unprocessed{Keys,Items}
+BATCH_GET_MAX = 100
+BATCH_MAX_ATTEMPTS = 5
+BATCH_BACKOFF_BASE = 0.05  # seconds; exponential + small jitter
+TRANSACT_WRITE_MAX = 100
+
+# Conditional-write retries (re-read + rebase) before a turn fails
+CONFLICT_RETRIES = 2
 
-from config import table
+# Buffered writes while inside `deferred_writes()` (shared by worker threads)
+_PENDING_LOCK = threading.Lock()
+# wa_id -> (session, ttl, version stored before the first buffered write,
+#           the session as stored at that version if known)
+_PENDING: Dict[str, Tuple[Session, int, int, Optional[Session]]] = {}
+_DEFER_DEPTH = 0
 
 
-def load_session(wa_id: str) -> dict:
+_PROJECTION = projection()
+
+
+class SessionConflict(Exception):
+    """
+    The session kept changing under a turn (or could not be rebased).
+    """
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _key(wa_id: str) -> Dict[str, Any]:
+    return {"wa_id": {"S": wa_id}}
+
+
+def _put(sess: Session, ttl: int, **condition: Any) -> None:
+    get_dynamodb().put_item(TableName=SESSIONS_TABLE, Item=encode_item(sess, ttl), **condition)
+
+
+def _version_condition(expected: int) -> Dict[str, Any]:
+    if expected:
+        return dict(
+            ConditionExpression="#v = :v",
+            ExpressionAttributeNames={"#v": "version"},
+            ExpressionAttributeValues={":v": {"N": str(expected)}},
+        )
+    return dict(
+        ConditionExpression="attribute_not_exists(wa_id) OR attribute_not_exists(#v)",
+        ExpressionAttributeNames={"#v": "version"},
+    )
+
+
+def _put_if_version(sess: Session, ttl: int, expected: int) -> None:
+    _put(sess, ttl, **_version_condition(expected))
+
+
+def _error_code(e: ClientError) -> str:
+    return e.response.get("Error", {}).get("Code") or ""
+
+
+def _read(wa_id: str, consistent: bool = False) -> Session:
+    metrics.incr("session.read")
+    extra = {"ConsistentRead": True} if consistent else {}
+    r = get_dynamodb().get_item(TableName=SESSIONS_TABLE, Key=_key(wa_id), **_PROJECTION, **extra)
+    return decode_item(r["Item"]) if r.get("Item") else Session(wa_id)
+
+
+def _remember(sess: Session) -> None:
+    _CACHE.set(sess.wa_id, {"sess": sess.copy(), "fp": sess.fingerprint()})
+
+
+def forget(wa_id: str) -> None:
+    """
+    Drop a cached session (e.g. after a write conflict).
+    """
+    _CACHE.delete(wa_id)
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def load_session(wa_id: str, fresh: bool = False) -> Session:
     """
     Fetch the session for a given WhatsApp user id, or a default shell.
+
+    Served from the warm-container cache when this process saw the user
+    recently, unless `fresh` (then a consistent read).
     """
-    r = table.get_item(Key={"wa_id": wa_id})
-    return r.get("Item") or {"wa_id": wa_id, "state": "idle", "slots": {}, "missing_slots": []}
+    if not fresh:
+        hit = _CACHE.get(wa_id)
+        if hit is not None:
+            metrics.incr("session.cache_hit")
+            return hit["sess"].copy()
 
+    sess = _read(wa_id, consistent=fresh)
+    _remember(sess)
+    return sess.copy()
 
-def save_session(item: dict, ttl_minutes: int = 60) -> None:
+
+def is_current(sess: Session) -> bool:
+    """
+    True if `sess` (as loaded by this turn) is still the stored version.
+
+    One consistent read of `version`; buffered writes of this process are
+    taken into account. On False the cache entry is dropped, so
+    `load_session` reads the stored session again.
+    """
+    with _PENDING_LOCK:
+        pending = _PENDING.get(sess.wa_id)
+    expected = pending[2] if pending is not None and pending[0].version == sess.version else sess.version
+
+    r = get_dynamodb().get_item(
+        TableName=SESSIONS_TABLE,
+        Key=_key(sess.wa_id),
+        ProjectionExpression="#v",
+        ExpressionAttributeNames={"#v": "version"},
+        ConsistentRead=True,
+    )
+    stored = int(((r.get("Item") or {}).get("version") or {}).get("N") or 0)
+    if stored == expected:
+        return True
+    metrics.incr("session.stale")
+    print(f"WARN session for {sess.wa_id} is stale (v{expected}, stored v{stored})")
+    forget(sess.wa_id)
+    return False
+
+
+def save_session(sess: Session, ttl_minutes: int = 60) -> bool:
     """
     Upsert the session and set an expiry TTL.
+
+    Returns False when the write was skipped because nothing changed.
     """
+    wa_id = sess.wa_id
     now = int(time.time())
-    item["updated_at"] = now
-    item["ttl"] = now + ttl_minutes * 60
-    table.put_item(Item=item)
+    cached: Optional[Dict[str, Any]] = _CACHE.get(wa_id)
+
+    # The state this turn started from (the cache holds what load_session returned)
+    expected = sess.version
+    base: Optional[Session] = cached["sess"] if cached is not None and cached["sess"].version == expected else None
+
+    if base is not None and cached["fp"] == sess.fingerprint():
+        last = base.updated_at
+        if sess.is_idle_shell or (now - last) < SESSION_TOUCH_SECONDS:
+            metrics.incr("session.write_skipped")
+            sess.updated_at = last
+            return False
 
+    ttl = now + ttl_minutes * 60
+    sess.updated_at = now
+    sess.version = expected + 1
 
-def merge_slots(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    with _PENDING_LOCK:
+        if _DEFER_DEPTH:
+            prev = _PENDING.get(wa_id)
+            if prev is not None and prev[0].version == expected:
+                stored, stored_sess = prev[2], prev[3]
+            else:
+                stored, stored_sess = expected, (base.copy() if base is not None else None)
+            _PENDING[wa_id] = (sess.copy(), ttl, stored, stored_sess)
+            _remember(sess)
+            return True
+
+    metrics.incr("session.write")
+    _write(sess, ttl, expected, base, first_conflict=False)
+    return True
+
+
+def _write(sess: Session, ttl: int, expected: int, base: Optional[Session], first_conflict: bool) -> None:
     """
-    Shallow-merge slot dictionaries; new keys override.
+    Conditionally write `sess` over stored version `expected`, rebasing this
+    turn's changes (relative to `base`) onto the stored session on conflict.
+
+    `first_conflict` says the caller already saw the condition fail. Updates
+    `sess` in place; raises SessionConflict when it cannot be written.
     """
-    out = dict(old or {})
-    for k, v in (new or {}).items():
-        out[k] = v
-    return out
+    wa_id = sess.wa_id
+    now = sess.updated_at
+    mine = sess.copy()
+    for attempt in range(CONFLICT_RETRIES + 1):
+        if not (first_conflict and attempt == 0):
+            try:
+                _put_if_version(sess, ttl, expected)
+                break
+            except ClientError as e:
+                if _error_code(e) != "ConditionalCheckFailedException":
+                    raise
+        # Another container wrote this session after our read
+        metrics.incr("session.version_conflict")
+        forget(wa_id)
+        if base is None or attempt == CONFLICT_RETRIES:
+            raise SessionConflict(f"session for {wa_id} changed concurrently (read v{expected})")
+        theirs = _read(wa_id, consistent=True)
+        print(f"WARN session version conflict for {wa_id}: v{expected} -> v{theirs.version}; rebasing")
+        rebased = mine.rebase(base, theirs)
+        for name in Session.__slots__:
+            setattr(sess, name, getattr(rebased, name))
+        expected = theirs.version
+        sess.updated_at = now
+        sess.version = expected + 1
+
+    _remember(sess)
+
+
+def _backoff(attempt: int) -> None:
+    time.sleep(BATCH_BACKOFF_BASE * (2 ** attempt) + random.uniform(0, 0.02))
+
+
+def prefetch_sessions(wa_ids: Iterable[str]) -> int:
+    """
+    Load every not-yet-cached session in one BatchGetItem per 100 keys.
+
+    Users without a stored session get the default shell cached, so the
+    following `load_session` calls need no round-trip. Returns the number
+    of keys requested.
+    """
+    wanted = [w for w in dict.fromkeys(wa_ids) if w and _CACHE.get(w) is None]
+    for start in range(0, len(wanted), BATCH_GET_MAX):
+        chunk = wanted[start:start + BATCH_GET_MAX]
+        found: Dict[str, Session] = {}
+        request: Dict[str, Any] = {SESSIONS_TABLE: {"Keys": [_key(w) for w in chunk], **_PROJECTION}}
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            metrics.incr("session.batch_read")
+            resp = get_dynamodb().batch_get_item(RequestItems=request)
+            for av in resp.get("Responses", {}).get(SESSIONS_TABLE, []):
+                sess = decode_item(av)
+                found[sess.wa_id] = sess
+            request = resp.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            _backoff(attempt)
+        else:
+            # Leave the rest uncached; load_session will fetch them one by one
+            chunk = [w for w in chunk if w in found]
+
+        for w in chunk:
+            _remember(found.get(w) or Session(w))
+    return len(wanted)
+
+
+def _flush_pending() -> None:
+    """
+    Write the buffered sessions, conditional on their stored versions.
+
+    Entries are only dropped from `_PENDING` once written (or given up on
+    after an unresolvable conflict); on any other error they stay buffered
+    for the next flush and the error is raised.
+    """
+    with _PENDING_LOCK:
+        items = list(_PENDING.items())
+
+    conflicts = []
+    for start in range(0, len(items), TRANSACT_WRITE_MAX):
+        chunk = items[start:start + TRANSACT_WRITE_MAX]
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            metrics.incr("session.batch_write")
+            try:
+                get_dynamodb().transact_write_items(TransactItems=[
+                    {"Put": dict(TableName=SESSIONS_TABLE, Item=encode_item(e[0], e[1]), **_version_condition(e[2]))}
+                    for _, e in chunk
+                ])
+            except ClientError as err:
+                if _error_code(err) != "TransactionCanceledException":
+                    raise
+                reasons = [r.get("Code") for r in err.response.get("CancellationReasons") or []]
+                if "ConditionalCheckFailed" not in reasons:
+                    # Throttling / transaction conflict: back off and retry as is
+                    if attempt == BATCH_MAX_ATTEMPTS - 1:
+                        raise
+                    _backoff(attempt)
+                    continue
+                # Rebase the conflicting sessions one by one, retry the rest together
+                conflicts += [x for x, code in zip(chunk, reasons) if code == "ConditionalCheckFailed"]
+                chunk = [x for x, code in zip(chunk, reasons) if code != "ConditionalCheckFailed"]
+                if not chunk:
+                    break
+                continue
+            _done(chunk)
+            break
+
+    for wa_id, entry in conflicts:
+        sess, ttl, stored, base = entry
+        try:
+            _write(sess, ttl, stored, base, first_conflict=True)
+        except SessionConflict as e:
+            metrics.incr("session.write_lost")
+            print("ERR deferred session write:", e)
+        _done([(wa_id, entry)])
+
+
+def _done(written: List[Tuple[str, Tuple[Session, int, int, Optional[Session]]]]) -> None:
+    # Drop flushed entries unless a newer save replaced them meanwhile
+    with _PENDING_LOCK:
+        for wa_id, entry in written:
+            if _PENDING.get(wa_id) is entry:
+                del _PENDING[wa_id]
+
+
+@contextmanager
+def deferred_writes() -> Iterator[None]:
+    """
+    Buffer `save_session` calls (the last one per user is written) and flush
+    them on exit, see `_flush_pending`. Nested scopes flush at the outermost
+    exit; a failed flush raises and keeps the writes buffered.
+    """
+    global _DEFER_DEPTH
+    with _PENDING_LOCK:
+        _DEFER_DEPTH += 1
+    try:
+        yield
+    finally:
+        with _PENDING_LOCK:
+            _DEFER_DEPTH -= 1
+            outermost = _DEFER_DEPTH == 0
+        if outermost:
+            _flush_pending()
+
@@ -0,0 +1,150 @@
+"""
+Session storage: conditional writes, rebase on conflict, deferred flushes.
+
+Run:  python -m pytest -q sessions_test.py
+"""
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+import config
+import sessions
+from loadtest import Latency, MemoryDynamo
+from session_model import Session
+
+WA = "2348000000001"
+
+
+@pytest.fixture(autouse=True)
+def ddb():
+    mem = MemoryDynamo(Latency(0))
+    saved = config._LAZY.get("dynamodb")
+    config._LAZY["dynamodb"] = mem
+    sessions._CACHE.clear()
+    sessions._PENDING.clear()
+    yield mem
+    sessions._CACHE.clear()
+    sessions._PENDING.clear()
+    if saved is None:
+        config._LAZY.pop("dynamodb", None)
+    else:
+        config._LAZY["dynamodb"] = saved
+
+
+def _stored(wa_id=WA):
+    sessions.forget(wa_id)
+    return sessions._read(wa_id, consistent=True)
+
+
+def _other_container_writes(**slots):
+    """
+    Advance the stored session behind this process's cache.
+    """
+    theirs = sessions._read(WA, consistent=True)
+    theirs.slots.update(slots)
+    theirs.version += 1
+    theirs.updated_at = int(time.time())
+    sessions._put(theirs, int(time.time()) + 3600)
+
+
+def _seed(**slots):
+    sess = sessions.load_session(WA)
+    sess.intent = "transfer"
+    sess.slots.update(slots)
+    sessions.save_session(sess)
+    return sess.version
+
+
+def test_deferred_flush_rebases_on_version_conflict():
+    _seed(amount=5000)
+    with sessions.deferred_writes():
+        sess = sessions.load_session(WA)  # cached, v1
+        _other_container_writes(destination_bank="zenith")
+        sess.slots["pin"] = "1234"
+        sessions.save_session(sess)
+
+    stored = _stored()
+    assert stored.version == 3
+    assert stored.slots == {"amount": 5000, "destination_bank": "zenith", "pin": "1234"}
+    assert not sessions._PENDING
+
+
+def test_deferred_flush_without_conflict_is_one_transaction(ddb):
+    for i in range(3):
+        s = sessions.load_session(f"u{i}")
+        s.intent = "check_balance"
+        sessions.save_session(s)
+    ddb.calls.clear()
+    with sessions.deferred_writes():
+        for i in range(3):
+            s = sessions.load_session(f"u{i}")
+            s.slots["pin"] = "1111"
+            sessions.save_session(s)
+    assert ddb.calls == {"transact_write_items": 1}
+    assert all(_stored(f"u{i}").slots == {"pin": "1111"} for i in range(3))
+
+
+def test_failed_flush_keeps_writes_pending(ddb, monkeypatch):
+    _seed(amount=5000)
+    real = ddb.transact_write_items
+
+    def down(**kw):
+        raise ClientError({"Error": {"Code": "InternalServerError", "Message": "boom"}}, "TransactWriteItems")
+
+    monkeypatch.setattr(ddb, "transact_write_items", down)
+    with pytest.raises(ClientError):
+        with sessions.deferred_writes():
+            sess = sessions.load_session(WA)
+            sess.slots["pin"] = "1234"
+            sessions.save_session(sess)
+    assert WA in sessions._PENDING
+    assert "pin" not in _stored().slots
+
+    # The next batch flushes it along with its own writes
+    monkeypatch.setattr(ddb, "transact_write_items", real)
+    with sessions.deferred_writes():
+        pass
+    assert not sessions._PENDING
+    assert _stored().slots["pin"] == "1234"
+
+
+def test_save_rebases_this_turns_changes_on_conflict():
+    _seed(amount=5000)
+    sess = sessions.load_session(WA)  # cached, v1
+    _other_container_writes(recipient_name="Ada")
+    sess.slots["pin"] = "1234"
+    sessions.save_session(sess)
+
+    assert sess.version == 3
+    assert _stored().slots == {"amount": 5000, "recipient_name": "Ada", "pin": "1234"}
+
+
+def test_conflict_without_a_base_fails_the_turn():
+    _seed(amount=5000)
+    sess = sessions.load_session(WA)
+    sessions.forget(WA)  # nothing to tell this turn's changes apart from the read
+    _other_container_writes(recipient_name="Ada")
+    sess.slots["amount"] = 9000
+    with pytest.raises(sessions.SessionConflict):
+        sessions.save_session(sess)
+    assert _stored().slots == {"amount": 5000, "recipient_name": "Ada"}
+
+
+def test_unchanged_session_is_not_written(ddb):
+    _seed(amount=5000)
+    ddb.calls.clear()
+    sess = sessions.load_session(WA)
+    assert sessions.save_session(sess) is False
+    assert ddb.calls == {}
+
+
+def test_is_current_sees_other_writers():
+    _seed(amount=5000)
+    sess = sessions.load_session(WA)
+    assert sessions.is_current(sess)
+
+    _other_container_writes(recipient_name="Ada")
+    assert not sessions.is_current(sess)
+    # The stale cache entry is gone: the next load reads the stored session
+    assert sessions.load_session(WA).slots["recipient_name"] == "Ada"
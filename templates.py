@@ -0,0 +1,215 @@
+"""
+Localized reply templates for the WhatsApp banking bot.
+
+Fixed sentences (fulfillment results, slot prompts, greetings) are kept
+here per language (en/pcm/ig/yo/ha) so they can be rendered without a
+Bedrock call. Placeholders use `str.format` syntax and are filled with
+values the caller has already formatted (e.g. "1,234.50"), so currency
+amounts and references come out exactly as given.
+
+Bump CATALOG_VERSION whenever wording changes so logs can tell which
+catalog produced a reply (main_logic logs it with every localized line).
+"""
+from __future__ import annotations
+
+from string import Formatter
+from typing import Any, Dict, Optional, Set
+
+CATALOG_VERSION = 5
+
+CATALOG: Dict[str, Dict[str, str]] = {
+    # --- Fulfillment results ---
+    "balance": {
+        "en": "Your current balance is NGN {balance}.",
+        "pcm": "Your balance now na NGN {balance}.",
+        "ig": "Ego dị n'akaụntụ gị ugbu a bụ NGN {balance}.",
+        "yo": "Iye owó tó wà nínú àkáǹtì yín báyìí jẹ́ NGN {balance}.",
+        "ha": "Ma'aunin asusunka na yanzu shine NGN {balance}.",
+    },
+    "transfer_ok": {
+        "en": "Transfer successful. Reference {reference}.",
+        "pcm": "Transfer don go successfully. Reference na {reference}.",
+        "ig": "Ezigara ego nke ọma. Nọmba ntụaka: {reference}.",
+        "yo": "Ìfiránṣẹ́ owó ti yọrí sí rere. Nọ́mbà ìtọ́kasí: {reference}.",
+        "ha": "An tura kuɗi cikin nasara. Lambar shaida: {reference}.",
+    },
+    # Failed transfers: one line per known cause (see main_logic._failure_key);
+    # the bare key covers everything else
+    "transfer_failed": {
+        "en": "Transfer failed. The bank did not accept it; no money was sent.",
+        "pcm": "Transfer no go. Bank no accept am; no money comot.",
+        "ig": "Iziga ego adaghị. Ụlọ akụ anabataghị ya; o nweghị ego zipụrụ.",
+        "yo": "Ìfiránṣẹ́ owó kò yọrí. Ilé-ìfowópamọ́ kò gbà á; kò sí owó tí a fi ránṣẹ́.",
+        "ha": "Tura kuɗi bai yi nasara ba. Banki bai karɓa ba; ba a tura kuɗi ba.",
+    },
+    "transfer_failed.insufficient_funds": {
+        "en": "Transfer failed: there is not enough money in your account.",
+        "pcm": "Transfer no go: money wey dey your account no reach.",
+        "ig": "Iziga ego adaghị: ego zuru ezu adịghị n'akaụntụ gị.",
+        "yo": "Ìfiránṣẹ́ owó kò yọrí: owó tó wà nínú àkáǹtì yín kò tó.",
+        "ha": "Tura kuɗi bai yi nasara ba: babu isasshen kuɗi a asusunka.",
+    },
+    "transfer_failed.invalid_pin": {
+        "en": "Transfer failed: the PIN is not correct. Please start again with the right PIN.",
+        "pcm": "Transfer no go: the PIN no correct. Abeg start again with the correct PIN.",
+        "ig": "Iziga ego adaghị: PIN ahụ ezighi ezi. Biko malite ọzọ were PIN ziri ezi.",
+        "yo": "Ìfiránṣẹ́ owó kò yọrí: PIN náà kò tọ̀nà. Ẹ jọ̀wọ́ bẹ̀rẹ̀ lẹ́ẹ̀kan sí i pẹ̀lú PIN tó tọ̀nà.",
+        "ha": "Tura kuɗi bai yi nasara ba: PIN ɗin ba daidai ba ne. Don Allah a sake farawa da PIN mai kyau.",
+    },
+    "transfer_failed.missing_details": {
+        "en": "Transfer failed: some details are missing. Please start the transfer again.",
+        "pcm": "Transfer no go: some details no dey. Abeg start the transfer again.",
+        "ig": "Iziga ego adaghị: ụfọdụ nkọwa na-efu. Biko malite nzipu ego ahụ ọzọ.",
+        "yo": "Ìfiránṣẹ́ owó kò yọrí: àwọn àlàyé kan kò sí. Ẹ jọ̀wọ́ bẹ̀rẹ̀ ìfiránṣẹ́ náà lẹ́ẹ̀kan sí i.",
+        "ha": "Tura kuɗi bai yi nasara ba: wasu bayanai sun ɓace. Don Allah a sake fara tura kuɗin.",
+    },
+    "transfer_failed.bank_list_unavailable": {
+        "en": "Transfer not sent: we could not load the list of banks. Please try again shortly.",
+        "pcm": "Transfer no go: we no fit load the list of banks. Abeg try again small time.",
+        "ig": "Ezipụghị ego: anyị enweghị ike ibudata ndepụta ụlọ akụ. Biko nwaa ọzọ n'oge na-adịghị anya.",
+        "yo": "A kò fi owó ránṣẹ́: a kò rí àkójọ àwọn ilé-ìfowópamọ́. Ẹ jọ̀wọ́ gbìyànjú lẹ́ẹ̀kan sí i láìpẹ́.",
+        "ha": "Ba a tura kuɗi ba: mun kasa samun jerin bankuna. Don Allah a sake gwadawa nan ba da jimawa ba.",
+    },
+    "transfer_pending": {
+        "en": "Your transfer is being confirmed with the bank. Please check your balance before trying again. Reference {reference}.",
+        "pcm": "We still dey confirm your transfer with the bank. Abeg check your balance before you try again. Reference na {reference}.",
+        "ig": "Anyị ka na-enyocha nzipu ego gị n'ụlọ akụ. Biko lee ego dị n'akaụntụ gị tupu ị nwaa ọzọ. Nọmba ntụaka: {reference}.",
+        "yo": "À ń jẹ́rìísí ìfiránṣẹ́ owó yín pẹ̀lú ilé-ìfowópamọ́. Ẹ jọ̀wọ́ ṣàyẹ̀wò iye owó yín kí ẹ tó gbìyànjú lẹ́ẹ̀kan sí i. Nọ́mbà ìtọ́kasí: {reference}.",
+        "ha": "Ana tabbatar da tura kuɗinka da banki. Don Allah duba ma'aunin asusunka kafin ka sake gwadawa. Lambar shaida: {reference}.",
+    },
+    "transfer_confirmed": {
+        "en": "Your transfer has now been confirmed. Reference {reference}.",
+        "pcm": "Bank don confirm your transfer. Reference na {reference}.",
+        "ig": "Ekwenyela nzipu ego gị ugbu a. Nọmba ntụaka: {reference}.",
+        "yo": "Wọ́n ti jẹ́rìísí ìfiránṣẹ́ owó yín báyìí. Nọ́mbà ìtọ́kasí: {reference}.",
+        "ha": "An tabbatar da tura kuɗinka yanzu. Lambar shaida: {reference}.",
+    },
+    "service_unavailable": {
+        "en": "Our banking service is temporarily unavailable. Please try again in a few minutes.",
+        "pcm": "Our bank service no dey work now. Abeg try again after some minutes.",
+        "ig": "Ọrụ ụlọ akụ anyị adịghị arụ ọrụ ugbu a. Biko nwaa ọzọ mgbe nkeji ole na ole gachara.",
+        "yo": "Iṣẹ́ ilé-ìfowópamọ́ wa kò ṣiṣẹ́ fún ìgbà díẹ̀. Ẹ jọ̀wọ́ gbìyànjú lẹ́ẹ̀kan sí i lẹ́yìn ìṣẹ́jú díẹ̀.",
+        "ha": "Sabis ɗin bankinmu baya aiki na ɗan lokaci. Don Allah a sake gwadawa bayan 'yan mintuna.",
+    },
+    "unknown_request": {
+        "en": "I am not sure how to help with that.",
+        "pcm": "I no sure how I fit help with that one.",
+        "ig": "Amaghị m otú m ga-esi nyere aka na nke ahụ.",
+        "yo": "Mi ò mọ bí mo ṣe lè ràn yín lọ́wọ́ nínú ìyẹn.",
+        "ha": "Ban tabbata yadda zan taimaka da wannan ba.",
+    },
+    "not_understood": {
+        "en": "Sorry, I didn't catch that. Please say it again, e.g. \"check my balance\" or \"send 5k\".",
+        "pcm": "Abeg no vex, I no catch wetin you talk. Talk am again, like \"check my balance\" or \"send 5k\".",
+        "ig": "Ndo, aghọtaghị m nke ahụ. Biko kwuo ya ọzọ, dịka \"lee ego dị n'akaụntụ m\" ma ọ bụ \"ziga 5k\".",
+        "yo": "Ẹ má bínú, mi ò gbọ́ ìyẹn yé. Ẹ jọ̀wọ́ sọ ọ́ lẹ́ẹ̀kan sí i, bíi \"ṣàyẹ̀wò owó mi\" tàbí \"fi 5k ránṣẹ́\".",
+        "ha": "Yi haƙuri, ban gane ba. Don Allah a sake faɗa, misali \"duba kuɗina\" ko \"tura 5k\".",
+    },
+    # --- Conversation prompts ---
+    "greeting": {
+        "en": "Hello! Would you like to check your balance or make a transfer?",
+        "pcm": "How far! You wan check balance or make transfer?",
+        "ig": "Ndewo! Ị chọrọ ilele ego dị n'akaụntụ gị ka ọ bụ iziga ego?",
+        "yo": "Ẹ n lẹ́! Ṣé ẹ fẹ́ wo iye owó yín ni tàbí fi owó ránṣẹ́?",
+        "ha": "Sannu! Kana so ka duba ma'auni ko ka tura kuɗi?",
+    },
+    "reset": {
+        "en": "I've reset our chat. Would you like to check your balance or make a transfer?",
+        "pcm": "I don reset our chat. Wetin you wan do—check balance or make transfer?",
+        "ig": "Amalitela m mkparịta ụka anyị ọzọ. Ị chọrọ ilele ego gị ka iziga ego?",
+        "yo": "Mo ti tún ìjíròrò wa bẹ̀rẹ̀. Ṣé ẹ fẹ́ wo iye owó yín ni tàbí fi owó ránṣẹ́?",
+        "ha": "Na sake fara tattaunawarmu. Kana so ka duba ma'auni ko ka tura kuɗi?",
+    },
+    "fulfill_ack": {
+        "en": "Okay, I'll process that now.",
+        "pcm": "Oya, I dey do am now.",
+        "ig": "Ọ dị mma, m na-eme ya ugbu a.",
+        "yo": "Ó dáa, mo ń ṣe é báyìí.",
+        "ha": "To, ina aiwatar da shi yanzu.",
+    },
+    "ask.amount": {
+        "en": "How much would you like to send?",
+        "pcm": "How much you wan send?",
+        "ig": "Ego ole ka ị chọrọ iziga?",
+        "yo": "Elo ni ẹ fẹ́ fi ránṣẹ́?",
+        "ha": "Nawa kake so ka tura?",
+    },
+    "ask.recipient_name": {
+        "en": "What is the recipient's name?",
+        "pcm": "Wetin be the name of the person wey you wan send am give?",
+        "ig": "Kedu aha onye ị na-ezigara ego?",
+        "yo": "Kí ni orúkọ ẹni tí ẹ fẹ́ fi owó ránṣẹ́ sí?",
+        "ha": "Menene sunan wanda za ka tura wa?",
+    },
+    "ask.destination_account_number": {
+        "en": "What is the recipient's account number? (10 digits)",
+        "pcm": "Wetin be the person account number? (10 digits)",
+        "ig": "Kedu nọmba akaụntụ onye ahụ? (ọnụọgụ iri)",
+        "yo": "Kí ni nọ́mbà àkáǹtì ẹni náà? (nọ́mbà mẹ́wàá)",
+        "ha": "Menene lambar asusun wanda za ka tura wa? (lambobi 10)",
+    },
+    "ask.source_account_number": {
+        "en": "Which of your account numbers should I use? (10 digits)",
+        "pcm": "Which account number make I use? (10 digits)",
+        "ig": "Kedu nọmba akaụntụ m ga-eji? (ọnụọgụ iri)",
+        "yo": "Nọ́mbà àkáǹtì wo ni kí n lò? (nọ́mbà mẹ́wàá)",
+        "ha": "Wace lambar asusu zan yi amfani da ita? (lambobi 10)",
+    },
+    "ask.bank_choice": {
+        "en": "Which bank did you mean: {options}?",
+        "pcm": "Which bank you mean: {options}?",
+        "ig": "Kedu ụlọ akụ ị na-ekwu maka ya: {options}?",
+        "yo": "Ilé-ìfowópamọ́ wo ni ẹ ní lọ́kàn: {options}?",
+        "ha": "Wane banki kake nufi: {options}?",
+    },
+    "ask.bank_unknown": {
+        "en": "I could not find a bank called \"{bank}\". Which bank is the account with?",
+        "pcm": "I no see any bank wey dem dey call \"{bank}\". Which bank the account dey?",
+        "ig": "Ahụghị m ụlọ akụ a na-akpọ \"{bank}\". Kedu ụlọ akụ akaụntụ ahụ dị?",
+        "yo": "Mi ò rí ilé-ìfowópamọ́ tí wọ́n ń pè ní \"{bank}\". Ilé-ìfowópamọ́ wo ni àkáǹtì náà wà?",
+        "ha": "Ban sami banki mai suna \"{bank}\" ba. A wane banki asusun yake?",
+    },
+    "ask.confirm_recipient": {
+        "en": "Account {account} belongs to {name}. If that is who you want to pay, reply with the account holder's name.",
+        "pcm": "Account {account} na {name} get am. If na the person you wan pay, reply with the name wey dey the account.",
+        "ig": "Akaụntụ {account} bụ nke {name}. Ọ bụrụ na ọ bụ onye ahụ ka ị chọrọ ịkwụ ụgwọ, zaghachi aha onye nwe akaụntụ ahụ.",
+        "yo": "Àkáǹtì {account} jẹ́ ti {name}. Bí ó bá jẹ́ ẹni tí ẹ fẹ́ san owó fún, ẹ fi orúkọ ẹni tó ni àkáǹtì náà dáhùn.",
+        "ha": "Asusun {account} na {name} ne. Idan shi ne kake son biya, ka amsa da sunan mai asusun.",
+    },
+    "ask.pin": {
+        "en": "Please enter your transaction PIN.",
+        "pcm": "Abeg send your transaction PIN.",
+        "ig": "Biko zite PIN azụmahịa gị.",
+        "yo": "Jọ̀wọ́ fi PIN ìdúnàádúrà yín ránṣẹ́.",
+        "ha": "Don Allah aiko da PIN na ciniki.",
+    },
+}
+
+
+def template(key: str, lang: str) -> Optional[str]:
+    """
+    Raw template text (placeholders intact), or None.
+    """
+    return CATALOG.get(key, {}).get(lang)
+
+
+def placeholders(text: str) -> Set[str]:
+    """
+    Names of the `{placeholders}` in `text`; empty set if it is not a valid template.
+    """
+    try:
+        return {name for _, name, _, _ in Formatter().parse(text) if name}
+    except ValueError:
+        return set()
+
+
+def render(key: str, lang: str, **params: Any) -> Optional[str]:
+    """
+    Render template `key` in `lang`; None if that variant is not in the catalog.
+
+    Placeholder values are inserted verbatim (callers pre-format numbers).
+    """
+    tpl = template(key, lang)
+    if tpl is None:
+        return None
+    return tpl.format_map(params)
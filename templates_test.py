@@ -0,0 +1,39 @@
+"""
+Reply template catalog: coverage, placeholders, rendering.
+
+Run:  python -m pytest -q templates_test.py
+"""
+import pytest
+
+from templates import CATALOG, placeholders, render, template
+
+LANGS = ("en", "pcm", "ig", "yo", "ha")
+
+
+@pytest.mark.parametrize("key", sorted(CATALOG))
+def test_every_key_has_all_languages(key):
+    assert set(CATALOG[key]) == set(LANGS)
+    assert all(text.strip() for text in CATALOG[key].values())
+
+
+@pytest.mark.parametrize("key", sorted(CATALOG))
+def test_languages_share_placeholders(key):
+    expected = placeholders(CATALOG[key]["en"])
+    for lang, text in CATALOG[key].items():
+        assert placeholders(text) == expected, lang
+        # Every variant renders with the English variant's parameters
+        render(key, lang, **{name: "x" for name in expected})
+
+
+def test_render():
+    assert render("balance", "en", balance="1,234.50") == "Your current balance is NGN 1,234.50."
+    assert render("ask.pin", "pcm") == "Abeg send your transaction PIN."
+    assert render("balance", "fr", balance="1") is None
+    assert render("no.such.key", "en") is None
+    assert template("balance", "yo").endswith("NGN {balance}.")
+
+
+def test_placeholders():
+    assert placeholders("Account {account} belongs to {name}.") == {"account", "name"}
+    assert placeholders("no fields, {{escaped}}") == set()
+    assert placeholders("broken {") == set()
@@ -1,21 +1,4 @@
-from config import GRAPH_API_VERSION, PHONE_NUMBER_ID, WHATSAPP_TOKEN
-import json, urllib
-
-def wa_send_text(to: str, body: str):
-    url = f"https://graph.facebook.com/{GRAPH_API_VERSION}/{PHONE_NUMBER_ID}/messages"
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": to,
-        "type": "text",
-        "text": { "body": body[:4000] }  # WA text limit safety
-    }
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url, data=data, method="POST",
-        headers={
-            "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-            "Content-Type": "application/json"
-        }
-    )
-    with urllib.request.urlopen(req, timeout=30) as r:
-        _ = r.read()
\ No newline at end of file
+"""
+Legacy import path for the reply sender; see whatsapp_helpers / graph_sender.
+"""
+from whatsapp_helpers import wa_send_text  # noqa: F401
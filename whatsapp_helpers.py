@@ -3,11 +3,9 @@ WhatsApp helper utilities for replying and extracting inbound messages.
 """
 from __future__ import annotations
 
-import json
-import urllib.request
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-from config import GRAPH_API_VERSION, PHONE_NUMBER_ID, WHATSAPP_TOKEN
+from config import OUTBOUND_QUEUE
 
 
 def wa_ok(body: str = "OK", status: int = 200) -> Dict[str, Any]:
@@ -17,45 +15,59 @@ def wa_ok(body: str = "OK", status: int = 200) -> Dict[str, Any]:
     return {"statusCode": status, "headers": {"Content-Type": "text/plain"}, "body": body}
 
 
-def wa_send_text(to: str, body: str) -> None:
+def wa_send_text(to: str, body: str, priority: Optional[int] = None) -> None:
     """
     Send a text message via WhatsApp Cloud API.
 
+    With OUTBOUND_QUEUE (default) the reply goes through the rate-limited
+    priority queue in outbound.py: this call only queues it (delivery
+    errors are logged, and the worker flushes the queue at the end of the
+    batch) and raises outbound.OutboundFull under backpressure. Otherwise
+    it is sent directly by graph_sender, raising graph_sender.GraphError
+    on failure.
+
     Parameters
     ----------
     to : str
         WhatsApp phone number id for the recipient.
     body : str
         Message body (truncated to 4000 chars by the API).
+    priority : int, optional
+        outbound.PRIORITY_* (default PRIORITY_INFO).
     """
-    url = f"https://graph.facebook.com/{GRAPH_API_VERSION}/{PHONE_NUMBER_ID}/messages"
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": to,
-        "type": "text",
-        "text": {"body": body[:4000]},
-    }
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(payload).encode("utf-8"),
-        method="POST",
-        headers={"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"},
-    )
-    with urllib.request.urlopen(req, timeout=30) as r:
-        _ = r.read()
-
-
-def extract_messages(event_body: Dict[str, Any]) -> List[Dict[str, str]]:
+    # httpx and the queue: only the POST path needs them
+    if OUTBOUND_QUEUE:
+        import outbound
+
+        outbound.send(to, body, outbound.PRIORITY_INFO if priority is None else priority)
+        return
+    from graph_sender import send_text
+
+    send_text(to, body)
+
+
+def extract_messages(event_body: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Extract plain text messages from the WhatsApp webhook body.
 
-    Returns a list of {'from': str, 'text': str}.
+    Returns a list of {'from': str, 'text': str, 'id': str, 'timestamp': int}.
+    `id` is the WhatsApp message id (stable across redeliveries, used for
+    de-duplication); `timestamp` is when the user sent it (epoch seconds).
     """
-    msgs: list[dict[str, str]] = []
+    msgs: list[dict[str, Any]] = []
     for entry in event_body.get("entry", []):
         for change in entry.get("changes", []):
             value = change.get("value", {})
             for m in value.get("messages", []) or []:
                 if m.get("type") == "text" and "from" in m:
-                    msgs.append({"from": m["from"], "text": (m["text"]["body"] or "").strip()})
+                    try:
+                        ts = int(m.get("timestamp") or 0)
+                    except (TypeError, ValueError):
+                        ts = 0
+                    msgs.append({
+                        "from": m["from"],
+                        "text": (m["text"]["body"] or "").strip(),
+                        "id": m.get("id") or "",
+                        "timestamp": ts,
+                    })
     return msgs
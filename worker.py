@@ -0,0 +1,200 @@
+"""
+Queue worker for the ack-fast webhook mode.
+
+Entry points:
+  - `worker_handler(event, context)`: Lambda handler. Accepts an SQS event
+    source batch ("Records") or, with no records, drains `msg_queue` itself.
+  - `drain(...)`: pull batches from the configured backend until empty
+    (or the Lambda deadline is near) and process them.
+
+Both modes (and the inline webhook path) go through `process_batch`:
+sessions for every sender are prefetched with one BatchGetItem, messages
+run through the per-sender dispatcher (each one claimed by id first and
+marked done once handled, see idempotency.py), session writes are flushed
+with conditional TransactWriteItems at the end, and then the queued
+replies (outbound.py) are delivered, bounded by the Lambda deadline. Background re-checks of
+transfers whose outcome was unknown (ledger.follow_up) are waited for
+within the same deadline, and their messages delivered. Replies still
+unsent at the deadline go back on `msg_queue` as reply messages
+({"id", "from", "reply", "priority"}), which a later batch sends instead of
+running a turn.
+"""
+from __future__ import annotations
+
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import metrics
+import ledger
+from config import (
+    DEADLINE_MARGIN_MS,
+    LEDGER_FOLLOW_UP_WAIT,
+    OUTBOUND_FLUSH_TIMEOUT,
+    OUTBOUND_QUEUE,
+    WORKER_BATCH_SIZE,
+)
+from dispatcher import process_messages, remaining_ms
+from idempotency import claim, complete, release
+from main_logic import handle_text
+from msg_queue import QueueBackend, get_queue
+from sessions import deferred_writes, prefetch_sessions
+from whatsapp_helpers import wa_send_text
+
+
+def handle_message(msg: Dict[str, Any]) -> None:
+    """
+    Run the conversation logic for one extracted message and record latency
+    from webhook receipt to completion.
+
+    Redeliveries of an already-claimed message id are dropped here, before
+    any parse, bank call or reply. A turn that fails gives its claim back,
+    so the redelivery is processed. A reply requeued at an earlier deadline
+    (see `_requeue_replies`) is just sent.
+    """
+    if not claim(msg):
+        return
+    try:
+        if "reply" in msg:
+            wa_send_text(msg["from"], msg["reply"], msg.get("priority"))
+        else:
+            handle_text(msg["from"], msg["text"], msg.get("id") or "")
+    except Exception:
+        release(msg)
+        raise
+    complete(msg)
+    received = msg.get("received_at")
+    if received:
+        metrics.timing("message.processing_ms", (time.time() - float(received)) * 1000.0)
+
+
+def process_batch(msgs: List[Dict[str, Any]], context: Any = None) -> Dict[str, Any]:
+    """
+    Process a batch of extracted messages with batched session I/O.
+
+    Returns the dispatcher result (processed/failed/failed_msgs/skipped).
+    """
+    try:
+        prefetch_sessions(m["from"] for m in msgs)
+    except Exception as e:
+        # Not fatal: load_session falls back to single reads
+        print("ERR prefetch_sessions:", e)
+    res: Dict[str, Any] = {"processed": 0, "failed": 0, "failed_msgs": [], "skipped": []}
+    try:
+        with deferred_writes():
+            res = process_messages(msgs, handle_message, context)
+    except Exception as e:
+        # Replies are already queued; raising would make Meta redeliver them.
+        # The session writes stay buffered and go out with the next flush.
+        metrics.incr("session.flush_failed")
+        print("ERR session flush:", e)
+    _flush_replies(context)
+    if ledger.wait_follow_ups(_budget(context, LEDGER_FOLLOW_UP_WAIT)) == 0:
+        _flush_replies(context)
+    return res
+
+
+def _budget(context: Any, cap: float) -> float:
+    """
+    Seconds we may still block for, at most `cap`, keeping the deadline margin.
+    """
+    left = remaining_ms(context)
+    if left is None:
+        return cap
+    return min(cap, max(0, left - DEADLINE_MARGIN_MS) / 1000.0)
+
+
+def _flush_replies(context: Any) -> None:
+    """
+    Deliver the batch's queued replies before the invocation returns (a
+    frozen container would otherwise send them much later, if at all).
+    """
+    if not OUTBOUND_QUEUE:
+        return
+    import outbound
+
+    try:
+        with metrics.timed("outbound.flush_ms"):
+            outbound.flush(_budget(context, OUTBOUND_FLUSH_TIMEOUT), _requeue_replies)
+    except Exception as e:
+        print("ERR outbound flush:", e)
+
+
+def _requeue_replies(replies: List[Dict[str, Any]]) -> None:
+    """
+    Put replies left unsent at the deadline on the message queue; each one
+    gets its own id, so the usual claim keeps it from going out twice.
+    """
+    get_queue().put_many([
+        {"id": f"reply.{uuid.uuid4().hex}", "from": r["to"], "reply": r["body"], "priority": r["priority"]}
+        for r in replies
+    ])
+
+
+def drain(
+    queue: Optional[QueueBackend] = None,
+    context: Any = None,
+    batch_size: int = WORKER_BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Process queued messages batch by batch until the queue is empty or the
+    deadline margin is reached. Failed and skipped messages are released
+    for redelivery. Returns processed/failed/released counts.
+    """
+    q = queue or get_queue()
+    totals = {"processed": 0, "failed": 0, "released": 0}
+    while True:
+        items = q.receive(batch_size)
+        if not items:
+            break
+        by_body = {id(i.body): i for i in items}
+        res = process_batch([i.body for i in items], context)
+
+        skipped = [by_body[id(m)] for m in res["skipped"]]
+        retry = skipped + [by_body[id(m)] for m in res["failed_msgs"]]
+        retry_ids = {id(i) for i in retry}
+        q.ack([i for i in items if id(i) not in retry_ids])
+        totals["processed"] += res["processed"]
+        totals["failed"] += res["failed"]
+        if retry:
+            q.release(retry)
+            totals["released"] += len(retry)
+        if skipped or res["failed"]:
+            # Near the deadline, or something is failing: leave the rest for later
+            break
+    return totals
+
+
+def _handle_sqs_records(records: List[Dict[str, Any]], context: Any) -> Dict[str, Any]:
+    """
+    SQS event source batch: report failed and deadline-skipped messages as
+    partial batch failures so SQS redelivers only those (a failed turn has
+    released its idempotency claim, see `handle_message`).
+    """
+    msgs, ids = [], {}
+    for r in records:
+        try:
+            body = json.loads(r.get("body") or "{}")
+        except ValueError:
+            print("ERR worker: bad record body", r.get("messageId"))
+            continue
+        msgs.append(body)
+        ids[id(body)] = r.get("messageId")
+
+    res = process_batch(msgs, context)
+    retry = res["failed_msgs"] + res["skipped"]
+    return {"batchItemFailures": [{"itemIdentifier": ids[id(m)]} for m in retry]}
+
+
+def worker_handler(event, context):
+    """
+    Lambda runtime entrypoint for the worker function.
+    """
+    try:
+        records = (event or {}).get("Records")
+        if records:
+            return _handle_sqs_records(records, context)
+        return drain(context=context)
+    finally:
+        metrics.flush()
@@ -0,0 +1,77 @@
+"""
+Worker entry points: failed turns give their claim back and are redelivered.
+
+Run:  python -m pytest -q worker_test.py
+"""
+import json
+
+import pytest
+
+import lambda_function
+import worker
+from msg_queue import MemoryQueue
+
+
+def _msg(i, sender="2348000000001", text="hi"):
+    return {"id": f"wamid.{i}", "from": sender, "text": text}
+
+
+@pytest.fixture
+def turns(monkeypatch):
+    """
+    Fake turn: text "boom" raises. Returns the claim log.
+    """
+    log = []
+    monkeypatch.setattr(worker, "prefetch_sessions", lambda ids: None)
+    monkeypatch.setattr(worker, "_flush_replies", lambda context: None)
+    monkeypatch.setattr(worker, "claim", lambda m: log.append(("claim", m["id"])) or True)
+    monkeypatch.setattr(worker, "complete", lambda m: log.append(("complete", m["id"])))
+    monkeypatch.setattr(worker, "release", lambda m: log.append(("release", m["id"])))
+
+    def handle_text(frm, text, msg_id=""):
+        if text == "boom":
+            raise RuntimeError("bank exploded")
+
+    monkeypatch.setattr(worker, "handle_text", handle_text)
+    return log
+
+
+def test_failed_turn_is_released_and_reported(turns):
+    msgs = [_msg(1), _msg(2, text="boom"), _msg(3, sender="2348000000002")]
+    res = worker.process_batch(msgs)
+    assert res["processed"] == 2 and res["failed"] == 1
+    assert [m["id"] for m in res["failed_msgs"]] == ["wamid.2"]
+    assert ("release", "wamid.2") in turns and ("complete", "wamid.2") not in turns
+
+
+def test_sqs_batch_reports_failed_messages(turns):
+    records = [
+        {"messageId": "sqs-1", "body": json.dumps(_msg(1))},
+        {"messageId": "sqs-2", "body": json.dumps(_msg(2, text="boom"))},
+    ]
+    out = worker._handle_sqs_records(records, None)
+    assert out == {"batchItemFailures": [{"itemIdentifier": "sqs-2"}]}
+
+
+def test_drain_releases_failed_messages(turns):
+    q = MemoryQueue()
+    q.put_many([_msg(1), _msg(2, text="boom")])
+    totals = worker.drain(queue=q)
+    assert totals == {"processed": 1, "failed": 1, "released": 1}
+    assert [i.body["id"] for i in q.receive(10)] == ["wamid.2"]
+
+
+def _post(msgs):
+    body = {
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {"messages": [
+            {"id": m["id"], "from": m["from"], "type": "text", "text": {"body": m["text"]}} for m in msgs
+        ]}}]}],
+    }
+    return lambda_function._handle_post({"body": json.dumps(body)})
+
+
+def test_inline_webhook_asks_for_redelivery_on_failure(turns, monkeypatch):
+    monkeypatch.setattr(lambda_function, "WEBHOOK_MODE", "inline")
+    assert _post([_msg(1)])["statusCode"] == 200
+    assert _post([_msg(2), _msg(3, text="boom")])["statusCode"] == 500